@@ -0,0 +1,121 @@
+import os
+import threading
+from urllib.parse import urlparse
+
+from parsers import add_debug_log
+
+STATIC = 'static'
+BROWSER = 'browser'
+
+
+def url_pattern(url: str, depth: int = 2) -> str:
+    """
+    Group URLs that are likely built by the same page template.
+
+    Numeric path segments (dates, ids) and the final segment (the slug) are
+    dropped and the first depth remaining segments kept, so
+    https://www.nytimes.com/2024/05/01/us/politics/story.html becomes
+    www.nytimes.com/us/politics.
+    """
+    parsed = urlparse(url)
+    segments = [segment for segment in parsed.path.split('/') if segment]
+    sections = [segment for segment in segments[:-1]
+                if not any(char.isdigit() for char in segment)]
+    return '/'.join([(parsed.hostname or '').lower()] + sections[:depth])
+
+
+def score_results(results: dict) -> tuple:
+    """(paragraphs, characters of text) extracted from a page"""
+    paragraphs = sum(1 for key in results if key.startswith('paragraph_'))
+    return paragraphs, len(results.get('full_text', ''))
+
+
+class AdaptiveParser:
+    """
+    Parser for sites that may need a browser, trying a static fetch first.
+
+    A page whose static extraction has fewer than min_paragraphs paragraphs
+    or min_chars characters of text is scraped again with the browser. The
+    outcome is remembered per url_pattern: patterns that render server-side
+    skip the browser, the others skip the static probe, until reprobe_after
+    browser visits have passed and the static fetch is tried again.
+    """
+
+    def __init__(self, static, browser, min_paragraphs: int = None,
+                 min_chars: int = None, reprobe_after: int = None) -> None:
+        self.static = static
+        self.browser = browser
+        self.min_paragraphs = min_paragraphs if min_paragraphs is not None else int(
+            os.environ.get('RENDER_MIN_PARAGRAPHS', '3'))
+        self.min_chars = min_chars if min_chars is not None else int(
+            os.environ.get('RENDER_MIN_CHARS', '500'))
+        self.reprobe_after = reprobe_after if reprobe_after is not None else int(
+            os.environ.get('RENDER_REPROBE_AFTER', '50'))
+
+        self._lock = threading.Lock()
+        # pattern -> [decision, browser visits since the last probe]
+        self._decisions = {}
+        self.probes = 0
+        self.escalations = 0
+        self.browser_launches_avoided = 0
+        self.browser_pages = 0
+
+    def _decide(self, pattern: str) -> str:
+        """Whether to go straight to the browser, or probe statically first"""
+        with self._lock:
+            decision = self._decisions.get(pattern)
+            if decision is None or decision[0] == STATIC:
+                return STATIC
+            decision[1] += 1
+            if decision[1] > self.reprobe_after:
+                decision[1] = 0
+                return STATIC
+            self.browser_pages += 1
+            return BROWSER
+
+    def parse_article(self, url: str, links: list = None) -> dict:
+        pattern = url_pattern(url)
+        if self._decide(pattern) == BROWSER:
+            add_debug_log(
+                "AdaptiveParser: %s needs a browser, skipping the static fetch", "INFO", pattern)
+            return self.browser.parse_article(url, links)
+
+        # Links of a probe the browser replaces are not kept
+        static_links = [] if links is not None else None
+        results = self.static.parse_article(url, static_links)
+        paragraphs, chars = score_results(results)
+        sufficient = paragraphs >= self.min_paragraphs and chars >= self.min_chars
+        with self._lock:
+            self.probes += 1
+            if sufficient:
+                self.browser_launches_avoided += 1
+                avoided = self.browser_launches_avoided
+                self._decisions[pattern] = [STATIC, 0]
+            else:
+                self.escalations += 1
+                self.browser_pages += 1
+                self._decisions[pattern] = [BROWSER, 0]
+
+        if sufficient:
+            add_debug_log(
+                "AdaptiveParser: Static fetch of %s is enough (%s paragraphs, %s characters), %s browser launches avoided so far", "SUCCESS", pattern, paragraphs, chars, avoided)
+            if links is not None:
+                links.extend(static_links)
+            return results
+
+        add_debug_log(
+            "AdaptiveParser: Static fetch of %s too thin (%s paragraphs, %s characters), rendering with the browser", "WARNING", pattern, paragraphs, chars)
+        return self.browser.parse_article(url, links)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                'patterns_static': sum(1 for decision in self._decisions.values()
+                                       if decision[0] == STATIC),
+                'patterns_browser': sum(1 for decision in self._decisions.values()
+                                        if decision[0] == BROWSER),
+                'probes': self.probes,
+                'escalations': self.escalations,
+                'browser_pages': self.browser_pages,
+                'browser_launches_avoided': self.browser_launches_avoided,
+            }
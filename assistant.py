@@ -1,53 +1,193 @@
-from flask import Flask, render_template, request
-from parsers import DefaultParser
-from parsers import SeleniumParser
+from flask import Flask, Response, jsonify, render_template, request, url_for
+from boilerplate import get_default_model as get_boilerplate_model
+from extraction_pool import PoolSaturated
+from extraction_pool import get_default_pool as get_extraction_pool
+from extraction_cache import get_default_cache as get_extraction_cache
+from http_cache import get_default_cache
+from metrics import metric_labels
+from metrics import profile_if_slow
+from metrics import render_prometheus
+from metrics import span
 from parsers import get_debug_logs
-from urllib.parse import urlparse
+from parsers import start_debug_logs
+from scraper import get_domain_name
+from scraper import scrape_webpage
+from summarizer import SummaryQueue
+from summarizer import get_default_summarizer
+from webdriver_pool import get_default_pool as get_webdriver_pool
 import json
-from repo import insert
+import logging
+import math
+import os
+import threading
+import time
+from urllib.parse import urlparse
+from crawler import Crawler
+from jobs import FINISHED
+from jobs import JobQueue
+from jobs import JobWorkers
+from recrawl import RecrawlScheduler
+from repo import search_documents
+from repo import store_document
+from repo import store_summary
+from routing import get_router
 
+# Rest of your code
 
-def get_domain_name(url: str) -> str:
-    parsed_url = urlparse(url)
-    domain = parsed_url.netloc.split('.')
-    domain_name = domain[0] if domain[0] != 'www' else domain[1]
-    return domain_name
 
+logger = logging.getLogger(__name__)
 
-def scrape_webpage(url: str) -> dict:
-    urlDomain = get_domain_name(url)
+# Flask web application
+app = Flask(__name__)
 
-    return {
-        'nytimes': SeleniumParser(),
-    }.get(urlDomain, DefaultParser()).parse_article(url)
 
-# Rest of your code
+@app.errorhandler(PoolSaturated)
+def extraction_pool_saturated(e):
+    return render_template('result.html',
+                           summary=f"<p>{e}</p>",
+                           title='Server busy',
+                           abstract="Too many pages are being parsed, try again shortly"), 503, {'Retry-After': '5'}
 
 
-# Flask web application
-app = Flask(__name__)
+def scrape_and_store(url: str, links: list = None, unfiltered: list = None) -> dict:
+    """
+    Scrape url and write the extracted elements to the database.
+
+    links and unfiltered, when lists, get the page's hrefs and its results
+    before boilerplate removal, see scrape_webpage.
+    """
+    with profile_if_slow(url), metric_labels(domain=get_domain_name(url)), \
+            span('request'):
+        parsed_elements = scrape_webpage(url, links, unfiltered)
+
+        if parsed_elements:
+            try:
+                document_id = store_document(url, parsed_elements)
+            except Exception as e:
+                document_id = None
+                logger.error("Could not store %s: %s", url, e)
+            summarize_and_store(url, parsed_elements, document_id)
+
+    return parsed_elements
+
+
+def _title(parsed_elements: dict, default: str) -> str:
+    """Text of the first heading, highest level first"""
+    headings = [(key[len('heading_h')], text)
+                for key, text in parsed_elements.items()
+                if key.startswith('heading_h') and text]
+    return min(headings, key=lambda heading: heading[0])[1] if headings else default
+
+
+_summary_queue = None
+_summary_queue_lock = threading.Lock()
+
+
+def get_summary_queue():
+    """
+    Background summarizer writing into articles.summary, started on first
+    use. None when SUMMARY_BACKEND is not set.
+    """
+    global _summary_queue
+    summarizer = get_default_summarizer()
+    if summarizer is None:
+        return None
+    with _summary_queue_lock:
+        if _summary_queue is None:
+            _summary_queue = SummaryQueue(
+                summarizer, store_summary,
+                batch_size=int(os.environ.get('SUMMARY_BATCH_SIZE', '16')),
+                batch_wait=float(os.environ.get('SUMMARY_BATCH_WAIT', '1')),
+                max_pending=int(os.environ.get('SUMMARY_MAX_PENDING', '10000')))
+        return _summary_queue
+
+
+def summarize_and_store(url: str, parsed_elements: dict, document_id: int = None) -> None:
+    """
+    Queue the full text for summarizing into articles.summary, if
+    SUMMARY_BACKEND is set. The summary is written later, off the request.
+    """
+    full_text = parsed_elements.get("full_text", "")
+    if not full_text:
+        return
+    summaries = get_summary_queue()
+    if summaries is not None:
+        summaries.enqueue(url, _title(parsed_elements, url), full_text, document_id)
+
+
+_job_queue = None
+_job_workers = None
+_jobs_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Job queue and its workers, started on first use"""
+    global _job_queue, _job_workers
+    with _jobs_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(os.environ.get(
+                'JOB_QUEUE_PATH', '.cache/jobs.sqlite3'))
+            # Jobs left running by a previous process will never finish
+            _job_queue.requeue_running()
+            _job_workers = JobWorkers(
+                _job_queue, scrape_and_store,
+                threads=int(os.environ.get('JOB_WORKERS', '4')),
+                retry_delay=float(os.environ.get('JOB_RETRY_DELAY', '5')),
+                retention=float(os.environ.get('JOB_RETENTION', str(7 * 86400))))
+        return _job_queue
+
+
+_recrawl = None
+_recrawl_lock = threading.Lock()
+
+
+def get_recrawl_scheduler() -> RecrawlScheduler:
+    """Recrawl scheduler of the monitored URLs, started on first use"""
+    global _recrawl
+    with _recrawl_lock:
+        if _recrawl is None:
+            _recrawl = RecrawlScheduler(
+                os.environ.get('RECRAWL_PATH', '.cache/recrawl.sqlite3'),
+                scrape_and_store,
+                threads=int(os.environ.get('RECRAWL_WORKERS', '2')),
+                initial_interval=float(os.environ.get('RECRAWL_INITIAL_INTERVAL', '3600')),
+                min_interval=float(os.environ.get('RECRAWL_MIN_INTERVAL', '900')),
+                max_interval=float(os.environ.get('RECRAWL_MAX_INTERVAL', str(7 * 86400))),
+                domain_delay=float(os.environ.get('RECRAWL_DOMAIN_DELAY', '5')),
+                retry_delay=float(os.environ.get('RECRAWL_RETRY_DELAY', '5')))
+        return _recrawl
+
+
+_crawler = None
+_crawler_lock = threading.Lock()
+
+
+def get_crawler() -> Crawler:
+    """Crawler following links of the pages it scrapes, started on first use"""
+    global _crawler
+    with _crawler_lock:
+        if _crawler is None:
+            _crawler = Crawler(
+                os.environ.get('CRAWL_PATH', '.cache/crawl.sqlite3'),
+                scrape_and_store,
+                threads=int(os.environ.get('CRAWL_WORKERS', '2')),
+                max_depth=int(os.environ.get('CRAWL_MAX_DEPTH', '2')),
+                max_pages_per_domain=int(os.environ.get('CRAWL_MAX_PAGES_PER_DOMAIN', '1000')),
+                domain_delay=float(os.environ.get('CRAWL_DOMAIN_DELAY', '1')),
+                capacity=int(os.environ.get('CRAWL_CAPACITY', '10000000')),
+                retry_delay=float(os.environ.get('CRAWL_RETRY_DELAY', '5')))
+        return _crawler
 
 
 @app.route('/', methods=['GET', 'POST'])
 def home():
     if request.method == 'POST':
+        start_debug_logs()
         url = request.form['url']
         print("Got URL: ")
         print(url)
 
-        parsed_elements = scrape_webpage(url)
-
-        # Convert the results_dict to a JSON string
-        json_result = json.dumps(parsed_elements, indent=4)
-
-        for key in parsed_elements:
-            insert(key=key, val=parsed_elements[key])
-
-        # Specify the file path where you want to save the JSON data
-        file_path = "testdata/output.json"
-        # Save the JSON data to a file
-        with open(file_path, "w") as json_file:
-            json_file.write(json_result)
+        parsed_elements = scrape_and_store(url)
 
         # Get debug logs
         debug_log_html = get_debug_logs()
@@ -86,5 +226,210 @@ def home():
     return render_template('index.html')
 
 
+def _requested_urls(payload):
+    """
+    The url or urls field of a POST payload.
+
+    Returns:
+        tuple: The URLs and None, or None and the 400 response when they are
+        missing or not all http(s) URLs
+    """
+    if 'urls' in payload:
+        urls = payload['urls'] if request.is_json else payload.getlist('urls')
+    elif payload.get('url'):
+        urls = [payload['url']]
+    else:
+        return None, (jsonify(error="Expected 'url' or 'urls'"), 400)
+    # A bare string would otherwise be taken one character at a time
+    if not isinstance(urls, list) or not all(isinstance(url, str) and url for url in urls):
+        return None, (jsonify(error="Expected 'url' to be a string or 'urls' a list of strings"), 400)
+    for url in urls:
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+            return None, (jsonify(error=f"Expected an http(s) URL, got {url!r}"), 400)
+    return urls, None
+
+
+@app.route('/scrape', methods=['POST'])
+def submit_scrape():
+    """Queue one url or a list of urls, answer with their job ids at once"""
+    payload = request.get_json(silent=True) or request.form
+    urls, error = _requested_urls(payload)
+    if error is not None:
+        return error
+
+    jobs = get_job_queue()
+    job_ids = [jobs.enqueue(url) for url in urls]
+    _job_workers.notify()
+
+    accepted = [{
+        'url': url,
+        'job_id': job_id,
+        'status_url': url_for('scrape_status', job_id=job_id),
+        'events_url': url_for('scrape_events', job_id=job_id),
+    } for url, job_id in zip(urls, job_ids)]
+    if 'urls' in payload:
+        return jsonify(jobs=accepted), 202
+    return jsonify(accepted[0]), 202
+
+
+@app.route('/scrape/<job_id>', methods=['GET'])
+def scrape_status(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify(error=f"No job {job_id}"), 404
+    return jsonify(job)
+
+
+@app.route('/scrape/<job_id>/events', methods=['GET'])
+def scrape_events(job_id):
+    """Server-sent events with the job status, until it finishes"""
+    jobs = get_job_queue()
+    if jobs.get(job_id, with_result=False) is None:
+        return jsonify(error=f"No job {job_id}"), 404
+
+    def stream():
+        last_status = None
+        while True:
+            job = jobs.get(job_id, with_result=False)
+            if job['status'] != last_status:
+                last_status = job['status']
+                if last_status in FINISHED:
+                    job = jobs.get(job_id)
+                yield f"event: status\ndata: {json.dumps(job)}\n\n"
+            if last_status in FINISHED:
+                return
+            time.sleep(0.5)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+
+@app.route('/monitor', methods=['GET'])
+def list_monitored():
+    """Monitored URLs with their recrawl interval and change counts"""
+    limit = request.args.get('limit', 100, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    return jsonify(urls=get_recrawl_scheduler().list(limit, offset))
+
+
+@app.route('/monitor', methods=['POST'])
+def add_monitored():
+    """Recrawl one url or a list of urls as often as they change"""
+    payload = request.get_json(silent=True) or request.form
+    urls, error = _requested_urls(payload)
+    if error is not None:
+        return error
+    interval = payload.get('interval')
+    if interval in (None, ''):
+        interval = None
+    else:
+        try:
+            interval = float(interval)
+        except (TypeError, ValueError):
+            interval = math.nan
+        if not (math.isfinite(interval) and interval > 0):
+            return jsonify(error="Expected 'interval' to be a positive number of seconds"), 400
+
+    scheduler = get_recrawl_scheduler()
+    monitored = [scheduler.add(url, interval) for url in urls]
+    if 'urls' in payload:
+        return jsonify(urls=monitored), 201
+    return jsonify(monitored[0]), 201
+
+
+@app.route('/monitor', methods=['DELETE'])
+def remove_monitored():
+    url = request.args.get('url')
+    if not url:
+        return jsonify(error="Expected 'url'"), 400
+    if not get_recrawl_scheduler().remove(url):
+        return jsonify(error=f"{url} is not monitored"), 404
+    return '', 204
+
+
+@app.route('/crawl', methods=['GET'])
+def crawl_status():
+    """Frontier counters and the crawled domains"""
+    crawler = get_crawler()
+    limit = request.args.get('limit', 100, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    return jsonify(**crawler.metrics(), domains=crawler.domains(limit, offset))
+
+
+@app.route('/crawl', methods=['POST'])
+def start_crawl():
+    """Crawl the sites of one url or a list of urls, starting from them"""
+    payload = request.get_json(silent=True) or request.form
+    urls, error = _requested_urls(payload)
+    if error is not None:
+        return error
+
+    crawler = get_crawler()
+    queued, skipped = [], []
+    for url in urls:
+        # Skipped when queued before or its domain is out of budget
+        (queued if crawler.add(url) else skipped).append(url)
+    return jsonify(queued=queued, skipped=skipped), 202
+
+
+# Matches ranked together, see search_documents
+SEARCH_CANDIDATES = int(os.environ.get('SEARCH_CANDIDATES', '1000'))
+
+
+@app.route('/search', methods=['GET'])
+def search():
+    """Stored documents matching q, best first, optionally of one domain"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify(error="Expected 'q'"), 400
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    found = search_documents(query, request.args.get('domain'), limit, offset,
+                             SEARCH_CANDIDATES)
+    return jsonify(query=query, limit=limit, offset=offset,
+                   rank_window=SEARCH_CANDIDATES, **found)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Stage latency histograms and cache/pool gauges for Prometheus"""
+    components = {'webdriver_pool': get_webdriver_pool().metrics(),
+                  'extraction_cache': get_extraction_cache().metrics()}
+    http_cache = get_default_cache()
+    if http_cache is not None:
+        components['http_cache'] = http_cache.metrics()
+    extraction_pool = get_extraction_pool()
+    if extraction_pool is not None:
+        components['extraction_pool'] = extraction_pool.metrics()
+    boilerplate = get_boilerplate_model()
+    if boilerplate is not None:
+        components['boilerplate'] = boilerplate.metrics()
+    if _recrawl is not None:
+        components['recrawl'] = _recrawl.metrics()
+    if _crawler is not None:
+        components['crawl'] = _crawler.metrics()
+    summarizer = get_default_summarizer()
+    if summarizer is not None:
+        components['summarizer'] = summarizer.metrics()
+    if _summary_queue is not None:
+        components['summary_queue'] = _summary_queue.metrics()
+    for domain, route in get_router().routes():
+        if hasattr(route.parser, 'metrics'):
+            components[f"render_{domain}"] = route.parser.metrics()
+    return Response(render_prometheus(components),
+                    mimetype='text/plain; version=0.0.4')
+
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    logging.basicConfig(level=logging.INFO,
+                        format="DEBUG [%(levelname)s]: %(message)s")
+    use_reloader = True
+    # The reloader runs this module twice, in a watcher process and in the
+    # child serving requests, so only the child starts background work
+    if not use_reloader or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        # Monitored URLs are recrawled, and a crawl left pending resumed,
+        # without waiting for a request
+        get_recrawl_scheduler()
+        get_crawler()
+    app.run(debug=True, use_reloader=use_reloader)
@@ -0,0 +1,178 @@
+"""
+Scrape a list of URLs and export one record per document.
+
+    python batch.py urls.txt -o results.ndjson
+    cat urls.txt | python batch.py - --format parquet -o results.parquet
+
+URLs are read one per line (blank lines and lines starting with # are
+skipped) and scraped concurrently with scraper.scrape_many. Records are
+written as they complete, to NDJSON (stdout by default), or to Parquet or
+Arrow IPC files in row groups of --row-group-size documents, so memory
+stays flat however long the list is.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import sys
+import time
+
+from repo import results_hash
+from scraper import get_domain_name
+from scraper import scrape_many
+
+FORMATS = ('ndjson', 'parquet', 'arrow')
+
+
+def read_urls(lines):
+    for line in lines:
+        url = line.strip()
+        if url and not url.startswith('#'):
+            yield url
+
+
+def make_record(url: str, results: dict, fetched_at: datetime.datetime) -> dict:
+    """One exported document, empty results make a failed record"""
+    elements = [{'tag': key, 'contents': text} for key, text in results.items()
+                if key != 'full_text']
+    return {
+        'url': url,
+        'domain': get_domain_name(url),
+        'fetched_at': fetched_at,
+        'ok': bool(results),
+        'content_hash': results_hash(results) if results else None,
+        'element_count': len(elements),
+        'full_text': results.get('full_text', ''),
+        'elements': elements,
+    }
+
+
+class NdjsonWriter:
+    """One compact JSON object per line, flushed per record"""
+
+    def __init__(self, output) -> None:
+        self._output = output
+
+    def write(self, record: dict) -> None:
+        record = dict(record, fetched_at=record['fetched_at'].isoformat())
+        self._output.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+        self._output.write('\n')
+        self._output.flush()
+
+    def close(self) -> None:
+        if self._output is not sys.stdout:
+            self._output.close()
+
+
+class ArrowWriter:
+    """
+    Buffers records and writes every row_group_size of them as one Parquet
+    row group or Arrow IPC record batch.
+    """
+
+    def __init__(self, path: str, file_format: str, row_group_size: int = 256) -> None:
+        # pyarrow is only needed for these formats
+        import pyarrow as pa
+
+        self._pa = pa
+        self.schema = pa.schema([
+            ('url', pa.string()),
+            ('domain', pa.string()),
+            ('fetched_at', pa.timestamp('ms', tz='UTC')),
+            ('ok', pa.bool_()),
+            ('content_hash', pa.string()),
+            ('element_count', pa.int32()),
+            ('full_text', pa.large_string()),
+            ('elements', pa.list_(pa.struct([('tag', pa.string()),
+                                             ('contents', pa.string())]))),
+        ])
+        self.row_group_size = row_group_size
+        self._rows = []
+        if file_format == 'parquet':
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+        else:
+            self._writer = pa.ipc.new_file(path, self.schema)
+
+    def _flush(self) -> None:
+        if self._rows:
+            batch = self._pa.RecordBatch.from_pylist(self._rows, schema=self.schema)
+            self._writer.write_batch(batch)
+            self._rows = []
+
+    def write(self, record: dict) -> None:
+        self._rows.append(record)
+        if len(self._rows) >= self.row_group_size:
+            self._flush()
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+
+
+def open_writer(path: str, file_format: str, row_group_size: int):
+    if file_format == 'ndjson':
+        output = sys.stdout if path in (None, '-') else open(path, 'w', encoding='utf-8')
+        return NdjsonWriter(output)
+    if path in (None, '-'):
+        raise ValueError(f"--format {file_format} needs an output file")
+    return ArrowWriter(path, file_format, row_group_size)
+
+
+async def run(urls, writer, concurrency: int, per_domain: int, store: bool) -> tuple:
+    """Scrape urls into writer, return (documents, failed)"""
+    if store:
+        from repo import store_document
+
+    documents = failed = 0
+    async for url, results in scrape_many(urls, concurrency=concurrency,
+                                          per_domain=per_domain):
+        fetched_at = datetime.datetime.now(datetime.timezone.utc)
+        writer.write(make_record(url, results, fetched_at))
+        documents += 1
+        if not results:
+            failed += 1
+        elif store:
+            await asyncio.to_thread(store_document, url, results, fetched_at)
+    return documents, failed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description=__doc__.strip(), formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('urls', help="file of URLs, or - for stdin")
+    arg_parser.add_argument('-o', '--output', help="output file, NDJSON goes to stdout by default")
+    arg_parser.add_argument('--format', choices=FORMATS,
+                            help="defaults to the output file's extension, else ndjson")
+    arg_parser.add_argument('--row-group-size', type=int, default=256,
+                            help="documents per Parquet row group or Arrow batch")
+    arg_parser.add_argument('--concurrency', type=int, default=32)
+    arg_parser.add_argument('--per-domain', type=int, default=4)
+    arg_parser.add_argument('--store', action='store_true',
+                            help="also store the documents in the database")
+    args = arg_parser.parse_args()
+
+    file_format = args.format
+    if file_format is None:
+        extension = (args.output or '').rpartition('.')[2]
+        file_format = extension if extension in FORMATS else 'ndjson'
+    try:
+        writer = open_writer(args.output, file_format, args.row_group_size)
+    except ValueError as e:
+        arg_parser.error(str(e))
+
+    lines = sys.stdin if args.urls == '-' else open(args.urls, encoding='utf-8')
+    start = time.perf_counter()
+    try:
+        documents, failed = asyncio.run(run(read_urls(lines), writer, args.concurrency,
+                                            args.per_domain, args.store))
+    finally:
+        writer.close()
+        if lines is not sys.stdin:
+            lines.close()
+    print(f"{documents} documents, {failed} failed, in {time.perf_counter() - start:.1f}s",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Time extraction over the corpus with debug logging off and on.
+
+    python bench/debug_logging.py [corpus_dir] [--rounds N] [--backend NAME]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import parsers  # noqa: E402
+from parser_backends import DEFAULT_CORPUS, load_corpus  # noqa: E402
+
+
+def run(label: str, documents: list, backend, rounds: int) -> None:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for document in documents:
+            parsers.start_debug_logs()
+            backend.extract(document)
+    elapsed = time.perf_counter() - start
+    docs = rounds * len(documents)
+    print(f"{label:<32} {docs / elapsed:>10.1f} docs/sec "
+          f"{elapsed / docs * 1e6:>10.1f} us/doc")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip())
+    arg_parser.add_argument('corpus', nargs='?', default=DEFAULT_CORPUS)
+    arg_parser.add_argument('--rounds', type=int, default=50)
+    arg_parser.add_argument('--backend', default='lexbor')
+    args = arg_parser.parse_args()
+
+    backend = parsers.get_parser_backend(args.backend)
+    # Parse once up front so only extraction and logging are timed
+    documents = [backend.parse(page) for page in load_corpus(args.corpus)]
+    logger = logging.getLogger(parsers.__name__)
+    logger.propagate = False
+    logger.addHandler(logging.NullHandler())
+
+    logger.setLevel(logging.CRITICAL)
+    parsers.DEBUG_LOG_LEVEL = logging.CRITICAL + 1
+    run("off", documents, backend, args.rounds)
+
+    parsers.DEBUG_LOG_LEVEL = logging.INFO
+    run("request buffer at INFO", documents, backend, args.rounds)
+
+    logger.setLevel(logging.INFO)
+    run("request buffer + logging at INFO", documents, backend, args.rounds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Compare parser backends on a corpus of saved HTML pages.
+
+Each backend runs in its own process so peak RSS is measured per backend.
+
+    python bench/parser_backends.py [corpus_dir] [--rounds N]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_CORPUS = os.path.join(ROOT, 'bench', 'corpus')
+
+
+def load_corpus(corpus_dir: str) -> list:
+    pages = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith('.html'):
+            with open(os.path.join(corpus_dir, name), 'rb') as f:
+                pages.append(f.read())
+    return pages
+
+
+def run_backend(name: str, corpus_dir: str, rounds: int) -> dict:
+    """Parse and extract every page rounds times with one backend"""
+    from parsers import get_parser_backend
+
+    backend = get_parser_backend(name)
+    pages = load_corpus(corpus_dir)
+
+    backend.extract(backend.parse(pages[0]))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for page in pages:
+            backend.extract(backend.parse(page))
+    elapsed = time.perf_counter() - start
+
+    docs = rounds * len(pages)
+    # ru_maxrss is KiB on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        'backend': name,
+        'docs': docs,
+        'seconds': round(elapsed, 4),
+        'docs_per_sec': round(docs / elapsed, 2),
+        'peak_rss_kib': peak_rss,
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip())
+    arg_parser.add_argument('corpus', nargs='?', default=DEFAULT_CORPUS)
+    arg_parser.add_argument('--rounds', type=int, default=20)
+    arg_parser.add_argument('--backend', help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.backend:
+        print(json.dumps(run_backend(args.backend, args.corpus, args.rounds)))
+        return
+
+    from parsers import PARSER_BACKENDS
+
+    print(f"{'backend':<12} {'docs/sec':>10} {'peak RSS (MiB)':>15}")
+    for name in PARSER_BACKENDS:
+        proc = subprocess.run(
+            [sys.executable, __file__, args.corpus,
+             '--rounds', str(args.rounds), '--backend', name],
+            capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"{name:<12} failed: {proc.stderr.strip().splitlines()[-1]}")
+            continue
+        result = json.loads(proc.stdout)
+        print(f"{name:<12} {result['docs_per_sec']:>10} "
+              f"{result['peak_rss_kib'] / 1024:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Save pages, with their status and headers, into the benchmark corpus.
+
+    python bench/record_corpus.py NAME=URL [NAME=URL ...] [--corpus DIR]
+
+Writes NAME.html and NAME.headers.json, which bench/replay.py serves back.
+Hop-by-hop and encoding headers are dropped, the body is stored decoded.
+"""
+import argparse
+import json
+import os
+import sys
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from parsers import REQUEST_HEADERS  # noqa: E402
+from replay import DEFAULT_CORPUS  # noqa: E402
+
+# Describe the transfer rather than the page, replay sets its own
+DROPPED_HEADERS = frozenset(['connection', 'content-encoding', 'content-length',
+                             'keep-alive', 'transfer-encoding', 'set-cookie'])
+
+
+def record(name: str, url: str, corpus_dir: str) -> None:
+    response = requests.get(url, headers=REQUEST_HEADERS, timeout=30)
+    headers = {key: value for key, value in response.headers.items()
+               if key.lower() not in DROPPED_HEADERS}
+    with open(os.path.join(corpus_dir, f"{name}.html"), 'wb') as f:
+        f.write(response.content)
+    with open(os.path.join(corpus_dir, f"{name}.headers.json"), 'w') as f:
+        json.dump({'status': response.status_code, 'url': url,
+                   'headers': headers}, f, indent=2)
+        f.write('\n')
+    print(f"{name}: {response.status_code}, {len(response.content)} bytes")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip())
+    arg_parser.add_argument('pages', nargs='+', metavar='NAME=URL')
+    arg_parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    args = arg_parser.parse_args()
+
+    for page in args.pages:
+        name, _, url = page.partition('=')
+        record(name, url, args.corpus)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""
+Replay the recorded corpus through a local stand-in server and time the
+scrape pipeline stage by stage.
+
+Every page in the corpus is served with its recorded status and headers
+(<name>.headers.json next to <name>.html). Each stage runs in its own
+process so peak RSS is per stage:
+
+    extract       getSoupResults/getLexborResults on an already built tree
+    parse         building the tree plus extraction
+    parser        DefaultParser.parse_article against the stand-in server
+    end_to_end    parse_article plus repo.store_document (with --db)
+
+Results are printed as JSON, or written to --output, so runs on two commits
+can be compared with --compare:
+
+    python bench/replay.py --output before.json
+    python bench/replay.py --compare before.json
+"""
+import argparse
+import http.server
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_CORPUS = os.path.join(ROOT, 'bench', 'corpus')
+
+STAGES = ['extract', 'parse', 'parser', 'end_to_end']
+
+
+def load_recorded(corpus_dir: str) -> dict:
+    """name -> (status, headers, body) of every recorded page"""
+    pages = {}
+    for name in sorted(os.listdir(corpus_dir)):
+        if not name.endswith('.html'):
+            continue
+        stem = name[:-len('.html')]
+        with open(os.path.join(corpus_dir, name), 'rb') as f:
+            body = f.read()
+        status, headers = 200, {'Content-Type': 'text/html'}
+        headers_path = os.path.join(corpus_dir, f"{stem}.headers.json")
+        if os.path.exists(headers_path):
+            with open(headers_path) as f:
+                recorded = json.load(f)
+            status, headers = recorded['status'], recorded['headers']
+        pages[stem] = (status, headers, body)
+    return pages
+
+
+def serve_corpus(corpus_dir: str):
+    """Start the stand-in server on a free port, return it"""
+    pages = load_recorded(corpus_dir)
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            page = pages.get(self.path.strip('/'))
+            if page is None:
+                self.send_error(404)
+                return
+            status, headers, body = page
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(samples: list, fraction: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def make_stage(stage: str, backend_name: str, base_url: str, names: list,
+               pages: dict):
+    """Return a function running the stage once for page i"""
+    import parsers
+
+    backend = parsers.get_parser_backend(backend_name)
+    if stage == 'extract':
+        documents = [backend.parse(pages[name][2]) for name in names]
+        return lambda i: backend.extract(documents[i])
+    if stage == 'parse':
+        return lambda i: backend.extract(backend.parse(pages[names[i]][2]))
+
+    # No memo, so every page is extracted again
+    parser = parsers.DefaultParser(backend=backend_name, memo=None)
+    urls = [f"{base_url}/{name}" for name in names]
+    if stage == 'parser':
+        return lambda i: parser.parse_article(urls[i])
+
+    import repo
+
+    def end_to_end(i):
+        repo.store_document(urls[i], parser.parse_article(urls[i]))
+    return end_to_end
+
+
+def run_stage(stage: str, backend_name: str, corpus_dir: str, base_url: str,
+              rounds: int) -> dict:
+    pages = load_recorded(corpus_dir)
+    names = [name for name, page in pages.items() if page[0] == 200]
+    run_once = make_stage(stage, backend_name, base_url, names, pages)
+
+    # Warm up imports, caches and connections
+    for i in range(len(names)):
+        run_once(i)
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for i in range(len(names)):
+            page_start = time.perf_counter()
+            run_once(i)
+            latencies.append(time.perf_counter() - page_start)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is KiB on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Allocations are traced in a separate pass, tracing slows everything down
+    alloc_peaks = []
+    tracemalloc.start()
+    for i in range(len(names)):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        run_once(i)
+        alloc_peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    if stage == 'end_to_end':
+        import repo
+        with repo.get_pool().connection() as conn:
+            conn.execute("DELETE FROM documents WHERE url LIKE %s",
+                         (f"{base_url}/%",))
+            conn.execute(
+                """
+                DELETE FROM document_contents c
+                WHERE NOT EXISTS (SELECT 1 FROM documents d WHERE d.content_id = c.id)
+                """)
+        repo.close()
+
+    docs = len(latencies)
+    return {
+        'stage': stage,
+        'backend': backend_name,
+        'docs': docs,
+        'seconds': round(elapsed, 4),
+        'docs_per_sec': round(docs / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'peak_rss_kib': peak_rss,
+        'alloc_peak_kib_max': round(max(alloc_peaks) / 1024, 1),
+        'alloc_peak_kib_mean': round(statistics.fmean(alloc_peaks) / 1024, 1),
+    }
+
+
+def git_commit() -> str:
+    proc = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                          capture_output=True, text=True)
+    return proc.stdout.strip() or None
+
+
+def compare(baseline: dict, current: dict) -> None:
+    """Print the change of every metric of stages present in both runs"""
+    before = {(r['stage'], r['backend']): r for r in baseline['results']}
+    print(f"{'stage':<12} {'backend':<12} {'docs/sec':>18} {'p50 ms':>18} {'p99 ms':>18}")
+    for result in current['results']:
+        old = before.get((result['stage'], result['backend']))
+        if old is None:
+            continue
+        cells = []
+        for metric in ('docs_per_sec', 'p50_ms', 'p99_ms'):
+            change = (result[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            cells.append(f"{result[metric]:>9} ({change:+6.1f}%)")
+        print(f"{result['stage']:<12} {result['backend']:<12} {' '.join(cells)}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description=__doc__.strip(), formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('corpus', nargs='?', default=DEFAULT_CORPUS)
+    arg_parser.add_argument('--rounds', type=int, default=20)
+    arg_parser.add_argument('--backend', default='html.parser')
+    arg_parser.add_argument('--stages', default='extract,parse,parser',
+                            help=f"comma separated, of {', '.join(STAGES)}")
+    arg_parser.add_argument('--db', action='store_true',
+                            help="also run end_to_end, needs the compose Postgres")
+    arg_parser.add_argument('--output', help="write the JSON results here")
+    arg_parser.add_argument('--compare', help="JSON results of an earlier run")
+    arg_parser.add_argument('--stage', help=argparse.SUPPRESS)
+    arg_parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.stage:
+        print(json.dumps(run_stage(args.stage, args.backend, args.corpus,
+                                   args.base_url, args.rounds)))
+        return
+
+    stages = args.stages.split(',')
+    if args.db and 'end_to_end' not in stages:
+        stages.append('end_to_end')
+
+    server = serve_corpus(args.corpus)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    # Measure the pipeline itself: no response cache, no worker processes
+    env = dict(os.environ, HTTP_CACHE_PATH='', DEBUG_LOG_LEVEL='OFF')
+    env.pop('EXTRACTION_WORKERS', None)
+
+    results = []
+    try:
+        for stage in stages:
+            proc = subprocess.run(
+                [sys.executable, __file__, args.corpus, '--rounds', str(args.rounds),
+                 '--backend', args.backend, '--stage', stage, '--base-url', base_url],
+                capture_output=True, text=True, env=env)
+            if proc.returncode != 0:
+                print(f"{stage} failed: {proc.stderr.strip().splitlines()[-1]}",
+                      file=sys.stderr)
+                continue
+            results.append(json.loads(proc.stdout))
+    finally:
+        server.shutdown()
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'rounds': args.rounds,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+    elif not args.output:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
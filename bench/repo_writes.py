@@ -0,0 +1,65 @@
+"""
+Measure rows/sec written to the dumps table, one insert() per element
+against one insert_many() per article.
+
+Needs the Postgres from compose.yml with migrations applied:
+
+    docker compose up -d && docker compose up flyway
+    python bench/repo_writes.py [--articles N] [--elements N]
+
+Benchmark rows are tagged bench_* and deleted afterwards.
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import repo  # noqa: E402
+
+
+def make_article(index: int, elements: int) -> dict:
+    article = {f"bench_paragraph_{index}_{i}": f"Paragraph {i} of article {index}. " * 8
+               for i in range(elements)}
+    article["bench_full_text"] = "\n\n".join(article.values())
+    return article
+
+
+def run(label: str, articles: list, write) -> None:
+    rows = sum(len(article) for article in articles)
+    start = time.perf_counter()
+    for article in articles:
+        write(article)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {rows:>8} rows {elapsed:>8.3f}s {rows / elapsed:>12.1f} rows/sec")
+
+
+def insert_each(article: dict) -> None:
+    for key in article:
+        repo.insert(key=key, val=article[key])
+
+
+def cleanup() -> None:
+    with repo.get_pool().connection() as conn:
+        conn.execute("DELETE FROM dumps WHERE tag LIKE 'bench\\_%'")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip())
+    arg_parser.add_argument('--articles', type=int, default=50)
+    arg_parser.add_argument('--elements', type=int, default=200)
+    args = arg_parser.parse_args()
+
+    articles = [make_article(i, args.elements) for i in range(args.articles)]
+    try:
+        run("insert per element", articles, insert_each)
+        run("insert_many per article", articles, repo.insert_many)
+    finally:
+        cleanup()
+        repo.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Time repo.search_documents over a large synthetic set of stored documents.
+
+Needs the Postgres from compose.yml with migrations applied:
+
+    docker compose up -d && docker compose up flyway
+    python bench/search.py [--documents N] [--elements N] [--keep]
+
+Documents are made of words drawn from the corpus with a Zipf
+distribution, so queries range from rare to very common words, and stored
+with repo.store_document like scraped pages. They live under
+http://bench-search.invalid/ and are deleted afterwards, unless --keep is
+given, in which case the next run reuses them.
+"""
+import argparse
+import itertools
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import parsers  # noqa: E402
+import repo  # noqa: E402
+from parser_backends import DEFAULT_CORPUS, load_corpus  # noqa: E402
+
+BASE_URL = 'http://bench-search.invalid'
+
+
+def vocabulary(corpus_dir: str, size: int) -> list:
+    """Corpus words, most frequent first, padded with made up ones"""
+    backend = parsers.get_parser_backend('html.parser')
+    counts = {}
+    for page in load_corpus(corpus_dir):
+        text = backend.extract(backend.parse(page)).get('full_text', '')
+        for word in re.findall(r'[a-z]{3,}', text.lower()):
+            counts[word] = counts.get(word, 0) + 1
+    words = sorted(counts, key=counts.get, reverse=True)
+    random.seed(0)
+    while len(words) < size:
+        words.append(''.join(random.choices('bcdfghklmnprstvz', k=3))
+                     + ''.join(random.choices('aeiou', k=1))
+                     + ''.join(random.choices('bcdfghklmnprstvz', k=3)))
+    return words[:size]
+
+
+def make_document(rng: random.Random, words: list, cum_weights: list,
+                  elements: int) -> dict:
+    results = {'full_text': ''}
+    parts = []
+    for i in range(elements):
+        if i % 10 == 0:
+            key = f"heading_h2_0_{i // 10}"
+            text = ' '.join(rng.choices(words, cum_weights=cum_weights, k=6)).capitalize()
+        else:
+            key = f"paragraph_0_{i}"
+            text = ' '.join(rng.choices(words, cum_weights=cum_weights, k=40)).capitalize() + '.'
+        results[key] = text
+        parts.append(f"{text}\n\n")
+    results['full_text'] = ''.join(parts)
+    return results
+
+
+def stored_count() -> int:
+    with repo.get_pool().connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM documents WHERE url LIKE %s",
+                            (f"{BASE_URL}/%",)).fetchone()[0]
+
+
+def load(count: int, elements: int, words: list, concurrency: int) -> None:
+    cum_weights = list(itertools.accumulate(
+        1 / rank for rank in range(1, len(words) + 1)))
+    first = stored_count()
+    if first >= count:
+        print(f"reusing {first} stored documents")
+        return
+
+    def store(i: int) -> None:
+        document = make_document(random.Random(i), words, cum_weights, elements)
+        repo.store_document(f"{BASE_URL}/{i}", document)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for done, _ in enumerate(executor.map(store, range(first, count)), first + 1):
+            if done % 10000 == 0:
+                print(f"  stored {done}", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    print(f"stored {count - first} documents ({(count - first) * elements} elements) "
+          f"in {elapsed:.1f}s, {(count - first) / elapsed:.0f} documents/sec")
+
+
+def cleanup() -> None:
+    with repo.get_pool().connection() as conn:
+        conn.execute("DELETE FROM documents WHERE url LIKE %s", (f"{BASE_URL}/%",))
+        conn.execute(
+            """
+            DELETE FROM document_contents c
+            WHERE NOT EXISTS (SELECT 1 FROM documents d WHERE d.content_id = c.id)
+            """)
+
+
+def percentile(samples: list, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description=__doc__.strip(), formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('corpus', nargs='?', default=DEFAULT_CORPUS)
+    arg_parser.add_argument('--documents', type=int, default=50000)
+    arg_parser.add_argument('--elements', type=int, default=20,
+                            help="elements per document")
+    arg_parser.add_argument('--vocabulary', type=int, default=20000)
+    arg_parser.add_argument('--concurrency', type=int, default=8,
+                            help="documents stored at once")
+    arg_parser.add_argument('--rounds', type=int, default=20)
+    arg_parser.add_argument('--keep', action='store_true',
+                            help="keep the documents for the next run")
+    args = arg_parser.parse_args()
+
+    words = vocabulary(args.corpus, args.vocabulary)
+    queries = [
+        ('rare word', words[-1]),
+        ('uncommon word', words[len(words) // 10]),
+        ('common word', words[5]),
+        ('two words', f"{words[20]} {words[200]}"),
+        ('phrase', f'"{words[3]} {words[4]}"'),
+        ('excluding', f"{words[50]} -{words[5]}"),
+        ('no match', 'zzzzzz'),
+    ]
+    try:
+        load(args.documents, args.elements, words, args.concurrency)
+        with repo.get_pool().connection() as conn:
+            conn.execute("ANALYZE document_contents")
+            conn.execute("ANALYZE documents")
+
+        print(f"{'query':<16} {'page':>4} {'matches':>7} {'results':>7} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+        for label, query in queries:
+            for page in (0, 9):
+                latencies = []
+                for _ in range(args.rounds):
+                    start = time.perf_counter()
+                    found = repo.search_documents(query, limit=20, offset=page * 20)
+                    latencies.append(time.perf_counter() - start)
+                print(f"{label:<16} {page + 1:>4} {found['total']:>7} {len(found['results']):>7} "
+                      f"{percentile(latencies, 0.5) * 1000:>9.2f} "
+                      f"{percentile(latencies, 0.99) * 1000:>9.2f} "
+                      f"{statistics.fmean(latencies) * 1000:>9.2f}")
+    finally:
+        if not args.keep:
+            cleanup()
+        repo.close()
+
+
+if __name__ == '__main__':
+    main()
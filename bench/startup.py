@@ -0,0 +1,94 @@
+"""
+Time cold imports of the app and worker entry points.
+
+    python bench/startup.py [MODULE ...] [--runs N] [--top N]
+
+Each module is imported in a fresh interpreter --runs times and the median
+wall time reported, followed by the modules that took longest to import
+according to python -X importtime (cumulative, in ms). Fails when a module
+loads one of the dependencies that are meant to be imported on first use.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The Flask app, what a job or extraction worker imports, and the DB layer
+DEFAULT_MODULES = ['assistant', 'scraper', 'parsers', 'repo']
+
+# Imported where they are first used, never at module level
+LAZY_DEPENDENCIES = ['selenium', 'bs4', 'selectolax', 'soupsieve', 'requests',
+                     'aiohttp', 'psycopg']
+
+LOADED_DEPENDENCIES = """
+import sys
+import {module}
+print(' '.join(name for name in {lazy!r} if name in sys.modules))
+"""
+
+TIMED_IMPORT = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+
+def import_seconds(module: str) -> float:
+    proc = subprocess.run([sys.executable, '-c', TIMED_IMPORT.format(module=module)],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(proc.stdout.strip().splitlines()[-1])
+
+
+def loaded_dependencies(module: str) -> list:
+    """The LAZY_DEPENDENCIES that importing module loads"""
+    proc = subprocess.run(
+        [sys.executable, '-c',
+         LOADED_DEPENDENCIES.format(module=module, lazy=LAZY_DEPENDENCIES)],
+        cwd=ROOT, capture_output=True, text=True, check=True)
+    return proc.stdout.split()
+
+
+def slowest_imports(module: str, top: int) -> list:
+    """(cumulative ms, module) of the top slowest imports below module"""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+    lines = [line[len('import time:'):].split('|')
+             for line in proc.stderr.splitlines()
+             if line.startswith('import time:') and 'cumulative' not in line]
+    # Interpreter startup is reported first and ends with site
+    names = [name.strip() for _, _, name in lines]
+    if 'site' in names:
+        lines = lines[names.index('site') + 1:]
+
+    timings = []
+    for _, cumulative, name in lines:
+        # module is indented by one space, its own imports by three
+        if len(name) - len(name.lstrip()) == 3:
+            timings.append((int(cumulative) / 1000, name.strip()))
+    return sorted(timings, reverse=True)[:top]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description=__doc__.strip(), formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    arg_parser.add_argument('--runs', type=int, default=10)
+    arg_parser.add_argument('--top', type=int, default=5)
+    args = arg_parser.parse_args()
+
+    for module in args.modules:
+        loaded = loaded_dependencies(module)
+        assert not loaded, f"import {module} loads {', '.join(loaded)}"
+        samples = [import_seconds(module) for _ in range(args.runs)]
+        print(f"{module:<16} {statistics.median(samples) * 1000:>8.1f} ms median "
+              f"{min(samples) * 1000:>8.1f} ms min")
+        for cumulative, name in slowest_imports(module, args.top):
+            print(f"    {name:<28} {cumulative:>8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Summarize the corpus with the stub backend at a simulated request latency.
+
+    python bench/summarize.py [corpus_dir] [--delay SECONDS] [--repeat N]
+
+The full texts of the corpus are summarized --repeat times, as recrawls of
+unchanged pages would be, one call at a time and then concurrently. Only
+the first round reaches the backend, later rounds are cache hits.
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import parsers  # noqa: E402
+from parser_backends import DEFAULT_CORPUS, load_corpus  # noqa: E402
+from summarizer import StubBackend, Summarizer  # noqa: E402
+
+
+def run(label: str, texts: list, repeat: int, delay: float, concurrency: int,
+        chunk_chars: int) -> None:
+    backend = StubBackend(delay=delay)
+    summarizer = Summarizer(backend, max_concurrency=concurrency,
+                            chunk_chars=chunk_chars)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        summarizer.summarize_many(texts)
+    elapsed = time.perf_counter() - start
+    metrics = summarizer.metrics()
+    summarizer.close()
+    print(f"{label:<24} {len(texts) * repeat / elapsed:>10.1f} texts/sec "
+          f"{metrics['requests']:>6} requests {metrics['cache_hits']:>6} cache hits "
+          f"{metrics['chunked_texts']:>4} chunked")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description=__doc__.strip(), formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('corpus', nargs='?', default=DEFAULT_CORPUS)
+    arg_parser.add_argument('--delay', type=float, default=0.2,
+                            help="seconds per backend call")
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--concurrency', type=int, default=8)
+    arg_parser.add_argument('--chunk-chars', type=int, default=12000)
+    args = arg_parser.parse_args()
+
+    backend = parsers.get_parser_backend('html.parser')
+    texts = [backend.extract(backend.parse(page))['full_text']
+             for page in load_corpus(args.corpus)]
+    texts = [text for text in texts if text]
+
+    run("sequential", texts, args.repeat, args.delay, 1, args.chunk_chars)
+    run(f"concurrency {args.concurrency}", texts, args.repeat, args.delay,
+        args.concurrency, args.chunk_chars)
+
+
+if __name__ == '__main__':
+    main()
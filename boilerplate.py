@@ -0,0 +1,262 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+from http_cache import normalize_url
+
+
+def fingerprint(text: str) -> int:
+    """
+    64-bit fingerprint of a text block.
+
+    The text is hashed as extracted, a site's template renders the same
+    block the same way on every page.
+    """
+    digest = hashlib.blake2b(text.encode('utf-8', errors='surrogatepass'),
+                             digest_size=8)
+    return int.from_bytes(digest.digest(), 'big', signed=True)
+
+
+def _url_fingerprint(url: str) -> int:
+    digest = hashlib.blake2b(normalize_url(url).encode(), digest_size=8)
+    return int.from_bytes(digest.digest(), 'big', signed=True)
+
+
+def _list_of(key: str):
+    """(container, list) of a list item key, None for other elements"""
+    if not key.startswith('list_'):
+        return None
+    return tuple(key.split('_')[2:4])
+
+
+def rebuild_full_text(results: dict) -> str:
+    """full_text of the elements in results, laid out like the extractors do"""
+    parts = []
+    current_list = None
+    for key, text in results.items():
+        if key == 'full_text':
+            continue
+        list_of = _list_of(key)
+        if current_list is not None and list_of != current_list:
+            parts.append("\n")
+        current_list = list_of
+        parts.append(f"• {text}\n" if list_of is not None else f"{text}\n\n")
+    if current_list is not None:
+        parts.append("\n")
+    return ''.join(parts)
+
+
+class _DomainModel:
+    __slots__ = ('pages', 'counts', 'boilerplate', 'seen', 'since_rebuild')
+
+    def __init__(self, pages: int = 0, counts: dict = None,
+                 seen: set = None) -> None:
+        self.pages = pages
+        # Fingerprint -> number of pages it was on
+        self.counts = counts or {}
+        self.boilerplate = set()
+        self.seen = seen or set()
+        self.since_rebuild = 0
+
+
+class BoilerplateModel:
+    """
+    Per-domain model of the text blocks repeated across a site's pages.
+
+    Every page observed counts its distinct block fingerprints once per
+    URL. A block on at least threshold of a domain's pages, once the domain
+    has min_pages of them, is boilerplate: navigation, cookie banners,
+    newsletter prompts, "related articles" lists. Checking a block is one
+    set lookup of its fingerprint.
+
+    After max_pages distinct pages of a domain the counts are halved, so the
+    model follows template changes and its memory stays bounded.
+    """
+
+    def __init__(self, path: str = None, threshold: float = 0.5,
+                 min_pages: int = 10, max_pages: int = 1000,
+                 max_blocks: int = 20000, save_every: int = 20) -> None:
+        """
+        Args:
+            path: SQLite file the model is kept in, memory only when None
+            threshold: Fraction of a domain's pages a block must be on
+            min_pages: Pages of a domain observed before anything is dropped
+            max_pages: Pages of a domain observed before counts are halved
+            max_blocks: Fingerprints kept per domain, blocks seen on one page
+                only are forgotten beyond that
+            save_every: Pages observed between writes to path
+        """
+        self.path = path
+        self.threshold = threshold
+        self.min_pages = min_pages
+        self.max_pages = max_pages
+        self.max_blocks = max_blocks
+        self.save_every = save_every
+        self._domains = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS domains (domain TEXT PRIMARY KEY, model TEXT NOT NULL)")
+            self._conn.commit()
+            for domain, model in self._conn.execute("SELECT domain, model FROM domains"):
+                state = json.loads(model)
+                self._domains[domain] = self._rebuild(_DomainModel(
+                    state['pages'],
+                    {int(fp): count for fp, count in state['counts'].items()},
+                    set(state['seen'])))
+
+        self.pages_observed = 0
+        self.blocks_dropped = 0
+        self.chars_dropped = 0
+
+    def _rebuild(self, model: _DomainModel) -> _DomainModel:
+        if model.pages >= self.min_pages:
+            needed = self.threshold * model.pages
+            model.boilerplate = {fp for fp, count in model.counts.items()
+                                 if count >= needed}
+        else:
+            model.boilerplate = set()
+        model.since_rebuild = 0
+        return model
+
+    def _decay(self, model: _DomainModel) -> None:
+        model.pages //= 2
+        model.counts = {fp: count // 2 for fp, count in model.counts.items()
+                        if count > 1}
+        model.seen.clear()
+
+    def _observe(self, domain: str, url: str, fingerprints: set) -> None:
+        model = self._domains.get(domain)
+        if model is None:
+            model = self._domains[domain] = _DomainModel()
+        url_fp = _url_fingerprint(url)
+        if url_fp in model.seen:
+            # A recrawl, its blocks are counted already
+            return
+        model.seen.add(url_fp)
+        model.pages += 1
+        self.pages_observed += 1
+
+        needed = self.threshold * model.pages
+        for fp in fingerprints:
+            count = model.counts[fp] = model.counts.get(fp, 0) + 1
+            if count >= needed and model.pages >= self.min_pages:
+                model.boilerplate.add(fp)
+
+        if len(model.counts) > self.max_blocks:
+            model.counts = {fp: count for fp, count in model.counts.items()
+                            if count > 1}
+        if model.pages >= self.max_pages:
+            self._decay(model)
+        # Blocks fall below the threshold as pages without them come in
+        model.since_rebuild += 1
+        if model.since_rebuild >= max(self.min_pages, model.pages // 10):
+            self._rebuild(model)
+
+        self._dirty.add(domain)
+        if self._conn is not None and self.pages_observed % self.save_every == 0:
+            self._save()
+
+    def strip(self, domain: str, url: str, results: dict) -> dict:
+        """
+        Observe the page and return results without its boilerplate blocks.
+
+        Args:
+            domain: Registrable domain of url
+            url: The page's URL, each URL is counted once
+            results: Results dict of a parser
+
+        Returns:
+            dict: results itself when nothing was dropped, otherwise a new
+            dict with full_text rebuilt from the remaining elements
+        """
+        fingerprints = {key: fingerprint(text) for key, text in results.items()
+                        if key != 'full_text'}
+        if not fingerprints:
+            return results
+        with self._lock:
+            self._observe(domain, url, set(fingerprints.values()))
+            boilerplate = self._domains[domain].boilerplate
+            dropped = [key for key, fp in fingerprints.items() if fp in boilerplate]
+            if not dropped:
+                return results
+            self.blocks_dropped += len(dropped)
+            self.chars_dropped += sum(len(results[key]) for key in dropped)
+
+        dropped = set(dropped)
+        stripped = {key: text for key, text in results.items()
+                    if key not in dropped}
+        stripped['full_text'] = rebuild_full_text(stripped)
+        return stripped
+
+    def is_boilerplate(self, domain: str, text: str) -> bool:
+        model = self._domains.get(domain)
+        return model is not None and fingerprint(text) in model.boilerplate
+
+    def _save(self) -> None:
+        rows = []
+        for domain in self._dirty:
+            model = self._domains[domain]
+            rows.append((domain, json.dumps({
+                'pages': model.pages,
+                'counts': model.counts,
+                'seen': list(model.seen),
+            })))
+        self._conn.executemany("INSERT OR REPLACE INTO domains VALUES (?, ?)", rows)
+        self._conn.commit()
+        self._dirty.clear()
+
+    def save(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._dirty:
+                self._save()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                'domains': len(self._domains),
+                'pages_observed': self.pages_observed,
+                'boilerplate_blocks': sum(len(model.boilerplate)
+                                          for model in self._domains.values()),
+                'blocks_dropped': self.blocks_dropped,
+                'chars_dropped': self.chars_dropped,
+            }
+
+    def close(self) -> None:
+        self.save()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_default_model = None
+_default_model_lock = threading.Lock()
+
+
+def get_default_model():
+    """
+    Shared model used by the scraper, stored at BOILERPLATE_PATH.
+
+    Returns None, meaning pages are kept whole, when BOILERPLATE_FILTER is
+    set to 0.
+    """
+    global _default_model
+    if os.environ.get('BOILERPLATE_FILTER', '1') == '0':
+        return None
+    with _default_model_lock:
+        if _default_model is None:
+            _default_model = BoilerplateModel(
+                os.environ.get('BOILERPLATE_PATH', '.cache/boilerplate.sqlite3'),
+                threshold=float(os.environ.get('BOILERPLATE_THRESHOLD', '0.5')),
+                min_pages=int(os.environ.get('BOILERPLATE_MIN_PAGES', '10')))
+        return _default_model
@@ -0,0 +1,423 @@
+import hashlib
+import logging
+import math
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+from urllib.parse import urldefrag, urljoin, urlparse
+
+from extraction_pool import PoolSaturated
+from http_cache import normalize_url
+from routing import registrable_domain
+
+logger = logging.getLogger(__name__)
+
+# Links to files rather than pages
+SKIPPED_EXTENSIONS = frozenset([
+    '.avi', '.css', '.dmg', '.doc', '.docx', '.exe', '.gif', '.gz', '.ico',
+    '.jpeg', '.jpg', '.js', '.json', '.mov', '.mp3', '.mp4', '.pdf', '.png',
+    '.ppt', '.pptx', '.rss', '.svg', '.tar', '.webp', '.woff', '.woff2',
+    '.xls', '.xlsx', '.xml', '.zip',
+])
+
+
+def normalize_link(base_url: str, href: str):
+    """
+    Absolute URL of a link found on base_url, without its fragment.
+
+    Returns:
+        str: The URL, or None for links that are not http(s) pages
+    """
+    try:
+        url = urldefrag(urljoin(base_url, href.strip()))[0]
+        parsed = urlparse(url)
+        # Raises ValueError for a malformed port
+        parsed.port
+    except ValueError:
+        return None
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return None
+    if os.path.splitext(parsed.path)[1].lower() in SKIPPED_EXTENSIONS:
+        return None
+    return url
+
+
+class BloomFilter:
+    """
+    Set of strings in a fixed number of bits, with false positives.
+
+    Sized for capacity keys at error_rate false positives. The bits live in
+    a memory-mapped file, so the filter survives restarts and takes page
+    cache rather than heap however many URLs it holds: about 1.8 MB per
+    million keys at 0.1%. Writes reach the file even if the process dies;
+    flush() only matters for machine crashes.
+    """
+
+    _HEADER = struct.Struct('<Q')
+
+    def __init__(self, path: str = None, capacity: int = 10_000_000,
+                 error_rate: float = 0.001) -> None:
+        """
+        Args:
+            path: File the bits are kept in, memory only when None
+            capacity: Keys the filter is sized for
+            error_rate: Chance that a key never added is reported as added,
+                once capacity keys are in
+        """
+        bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.bits = bits
+        self.hashes = max(1, round(bits / capacity * math.log(2)))
+        size = self._HEADER.size + (bits + 7) // 8
+
+        if path is None:
+            self._map = mmap.mmap(-1, size)
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'a+b') as f:
+            existing = os.fstat(f.fileno()).st_size
+            if existing == 0:
+                # Sparse, blocks are allocated as bits get set
+                f.truncate(size)
+            elif existing != size:
+                raise ValueError(
+                    f"{path} holds a filter of another capacity or error rate")
+            self._map = mmap.mmap(f.fileno(), size)
+
+    @property
+    def count(self) -> int:
+        """Keys added so far"""
+        return self._HEADER.unpack_from(self._map)[0]
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8', errors='surrogatepass'),
+                                 digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        offset = self._HEADER.size * 8
+        return [offset + (h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._map
+        return all(bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+
+    def add(self, key: str) -> bool:
+        """
+        Add key, not thread safe.
+
+        Returns:
+            bool: True if the key was not in the filter yet
+        """
+        bits = self._map
+        added = False
+        for position in self._positions(key):
+            byte = bits[position >> 3]
+            mask = 1 << (position & 7)
+            if not byte & mask:
+                bits[position >> 3] = byte | mask
+                added = True
+        if added:
+            self._HEADER.pack_into(bits, 0, self.count + 1)
+        return added
+
+    def flush(self) -> None:
+        self._map.flush()
+
+    def close(self) -> None:
+        self._map.flush()
+        self._map.close()
+
+
+class Crawler:
+    """
+    Follows the links of scraped pages within their site.
+
+    Pages are taken from a frontier persisted in SQLite, oldest first, so a
+    site is crawled breadth first. The links of a page are queued when they
+    point to the page's registrable domain, were never queued before, are at
+    most max_depth links away from a seed and their domain has queued fewer
+    than max_pages_per_domain pages. Queued URLs are remembered in a
+    BloomFilter next to the database, the frontier only keeps the pages not
+    fetched yet, so both stay small with tens of millions of URLs seen; a
+    false positive skips a new URL now and then. Pages being fetched when the
+    process stopped are queued again on start, so a crawl resumes where it
+    was; a path must therefore be crawled by one process at a time. A domain
+    is fetched at most once per domain_delay seconds. A page that finds the
+    extraction pool full stays queued and is fetched again after retry_delay
+    seconds.
+    """
+
+    def __init__(self, path: str, scrape, threads: int = 2,
+                 max_depth: int = 2, max_pages_per_domain: int = 1000,
+                 domain_delay: float = 1.0, capacity: int = 10_000_000,
+                 error_rate: float = 0.001, retry_delay: float = 5.0) -> None:
+        """
+        Args:
+            path: SQLite file of the frontier, the Bloom filter is kept
+                beside it with a .bloom extension
+            scrape: Function scrape(url, links) returning the results dict
+                of url and appending its hrefs to links when that is a
+                list, e.g. scrape_and_store
+            threads: Number of fetches running at once
+            max_depth: Links followed from a seed, 0 fetches the seeds only
+            max_pages_per_domain: Pages queued per registrable domain
+            domain_delay: Seconds between fetches of the same domain
+            capacity: URLs the Bloom filter is sized for
+            error_rate: Bloom filter false positive rate at capacity
+            retry_delay: Seconds before a page that found the extraction
+                pool full is fetched again
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.scrape = scrape
+        self.max_depth = max_depth
+        self.max_pages_per_domain = max_pages_per_domain
+        self.domain_delay = domain_delay
+        self.retry_delay = retry_delay
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._seen = BloomFilter(os.path.splitext(path)[0] + '.bloom',
+                                 capacity, error_rate)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS frontier (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                domain TEXT NOT NULL,
+                depth INTEGER NOT NULL,
+                running INTEGER NOT NULL DEFAULT 0,
+                run_after REAL
+            );
+            CREATE TABLE IF NOT EXISTS domains (
+                domain TEXT PRIMARY KEY,
+                queued INTEGER NOT NULL DEFAULT 0,
+                fetched INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0
+            );
+            """
+        )
+        columns = [row['name'] for row in self._conn.execute("PRAGMA table_info(frontier)")]
+        if 'run_after' not in columns:
+            # Frontiers created before pages could be retried
+            self._conn.execute("ALTER TABLE frontier ADD COLUMN run_after REAL")
+        # Pages being fetched when the last process stopped
+        self.resumed = self._conn.execute(
+            "UPDATE frontier SET running = 0 WHERE running = 1").rowcount
+        self._conn.commit()
+
+        # Domain -> earliest time it may be fetched again
+        self._domain_ready = {}
+        self.fetched = 0
+        self.failed = 0
+        self.retries = 0
+        self.links_found = 0
+        self.links_queued = 0
+        self.links_offsite = 0
+        self.links_over_budget = 0
+
+        self._stopping = False
+        self._threads = [
+            threading.Thread(target=self._run, name=f"crawl-{i}", daemon=True)
+            for i in range(threads)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _budget(self, domain: str) -> int:
+        """Pages domain may still queue"""
+        row = self._conn.execute(
+            "SELECT queued FROM domains WHERE domain = ?", (domain,)).fetchone()
+        return self.max_pages_per_domain - (row['queued'] if row else 0)
+
+    def _queue(self, rows: list, domain: str) -> None:
+        self._conn.executemany(
+            "INSERT INTO frontier (url, domain, depth) VALUES (?, ?, ?)", rows)
+        self._conn.execute(
+            """
+            INSERT INTO domains (domain, queued) VALUES (?, ?)
+            ON CONFLICT (domain) DO UPDATE SET queued = queued + excluded.queued
+            """,
+            (domain, len(rows)))
+
+    def add(self, url: str) -> bool:
+        """
+        Crawl from url. A URL queued before, or of a domain out of budget,
+        is not queued again.
+
+        Returns:
+            bool: Whether url was queued
+        """
+        url = normalize_link(url, url)
+        if url is None:
+            return False
+        domain = registrable_domain(urlparse(url).hostname)
+        with self._lock:
+            if self._budget(domain) <= 0 or not self._seen.add(normalize_url(url)):
+                return False
+            self._queue([(url, domain, 0)], domain)
+            self._conn.commit()
+            self._wakeup.notify()
+        return True
+
+    def _add_links(self, base_url: str, domain: str, depth: int,
+                   hrefs: list) -> None:
+        """Queue the new same-domain links of base_url at depth"""
+        remaining = self._budget(domain)
+        rows = []
+        for href in hrefs:
+            url = normalize_link(base_url, href)
+            if url is None:
+                continue
+            if registrable_domain(urlparse(url).hostname) != domain:
+                self.links_offsite += 1
+                continue
+            if remaining <= 0:
+                # Not marked as seen, a larger budget may want it later
+                self.links_over_budget += 1
+                continue
+            if self._seen.add(normalize_url(url)):
+                rows.append((url, domain, depth))
+                remaining -= 1
+        self.links_found += len(hrefs)
+        self.links_queued += len(rows)
+        if rows:
+            self._queue(rows, domain)
+
+    def _take(self, now: float):
+        """
+        Claim the oldest queued page whose domain may be fetched and that is
+        not waiting for a retry.
+
+        Returns:
+            tuple: (id, url, domain, depth) and None, or None and the seconds
+            until a waiting domain or retry is due (None when none is waiting)
+        """
+        waiting = {}
+        for domain, ready in list(self._domain_ready.items()):
+            if ready > now:
+                waiting[domain] = ready
+            else:
+                del self._domain_ready[domain]
+        # Select and mark in one statement, so a page is never claimed twice
+        row = self._conn.execute(
+            f"""
+            UPDATE frontier SET running = 1, run_after = NULL
+            WHERE id = (
+                SELECT id FROM frontier
+                WHERE running = 0 AND (run_after IS NULL OR run_after <= ?)
+                    AND domain NOT IN ({','.join('?' * len(waiting))})
+                ORDER BY id LIMIT 1
+            )
+            RETURNING id, url, domain, depth
+            """,
+            [now, *waiting]).fetchone()
+        self._conn.commit()
+        if row is None:
+            due = list(waiting.values())
+            # Retries already due only wait for their domain
+            retry_at = self._conn.execute(
+                "SELECT MIN(run_after) FROM frontier WHERE running = 0 AND run_after > ?",
+                (now,)).fetchone()[0]
+            if retry_at is not None:
+                due.append(retry_at)
+            return None, (min(due) - now if due else None)
+        self._domain_ready[row['domain']] = now + self.domain_delay
+        return tuple(row), None
+
+    def _record(self, frontier_id: int, url: str, domain: str, depth: int,
+                results, links) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM frontier WHERE id = ?", (frontier_id,))
+            if results:
+                self.fetched += 1
+                self._conn.execute(
+                    "UPDATE domains SET fetched = fetched + 1 WHERE domain = ?",
+                    (domain,))
+                if links:
+                    self._add_links(url, domain, depth + 1, links)
+            else:
+                self.failed += 1
+                self._conn.execute(
+                    "UPDATE domains SET failed = failed + 1 WHERE domain = ?",
+                    (domain,))
+            self._conn.commit()
+            self._wakeup.notify_all()
+
+    def _retry(self, frontier_id: int, delay: float) -> None:
+        """Queue a claimed page again, to be fetched after delay seconds"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE frontier SET running = 0, run_after = ? WHERE id = ?",
+                (time.time() + delay, frontier_id))
+            self._conn.commit()
+            self.retries += 1
+            self._wakeup.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if self._stopping:
+                    return
+                taken, wait = self._take(time.time())
+                if taken is None:
+                    self._wakeup.wait(wait)
+                    continue
+
+            frontier_id, url, domain, depth = taken
+            # Pages at max_depth are fetched without collecting their links
+            links = [] if depth < self.max_depth else None
+            try:
+                results = self.scrape(url, links)
+            except PoolSaturated:
+                logger.info("Crawl of %s retried in %ss, extraction pool is full",
+                            url, self.retry_delay)
+                self._retry(frontier_id, self.retry_delay)
+                continue
+            except Exception:
+                logger.exception("Crawl of %s failed", url)
+                results = None
+            self._record(frontier_id, url, domain, depth, results, links)
+
+    def domains(self, limit: int = 100, offset: int = 0) -> list:
+        """Crawled domains with their queued, fetched and failed pages"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM domains ORDER BY domain LIMIT ? OFFSET ?",
+                (limit, offset)).fetchall()
+        return [dict(row) for row in rows]
+
+    def metrics(self) -> dict:
+        with self._lock:
+            pending, running = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(running), 0) FROM frontier").fetchone()
+            return {
+                'pending': pending,
+                'running': running,
+                'seen': self._seen.count,
+                'fetched': self.fetched,
+                'failed': self.failed,
+                'retries': self.retries,
+                'links_found': self.links_found,
+                'links_queued': self.links_queued,
+                'links_offsite': self.links_offsite,
+                'links_over_budget': self.links_over_budget,
+            }
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._conn.close()
+        self._seen.close()
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+def content_key(content, extractor: str) -> str:
+    """
+    Cache key for extracting content with extractor.
+
+    Args:
+        content: Page body as bytes or str
+        extractor: Backend name and extractor version, so a change to either
+            never serves results produced by the other
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8', errors='surrogatepass')
+    digest = hashlib.blake2b(content, digest_size=16)
+    digest.update(extractor.encode())
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    Memoized results dicts keyed by content_key.
+
+    Recent results are kept in an in-memory LRU of max_entries, in front of
+    an optional SQLite store that survives restarts. When the stored results
+    exceed max_bytes the oldest ones are evicted.
+    """
+
+    def __init__(self, path: str = None, max_entries: int = 1024,
+                 max_bytes: int = 256 * 1024 * 1024) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._total_bytes = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS extractions (key TEXT PRIMARY KEY, results TEXT NOT NULL, size INTEGER NOT NULL)")
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(extractions)")]
+            if 'size' not in columns:
+                # Stores written before eviction existed
+                self._conn.execute(
+                    "ALTER TABLE extractions ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+                self._conn.execute("UPDATE extractions SET size = length(results)")
+            self._conn.commit()
+            self._total_bytes = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remember(self, key: str, results: dict) -> None:
+        self._memory[key] = results
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        """Return a copy of the results stored under key, or None"""
+        with self._lock:
+            results = self._memory.get(key)
+            if results is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return dict(results)
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT results FROM extractions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    results = json.loads(row[0])
+                    self._remember(key, results)
+                    self.store_hits += 1
+                    return dict(results)
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, results: dict) -> None:
+        with self._lock:
+            self._remember(key, dict(results))
+            if self._conn is not None:
+                encoded = json.dumps(results)
+                old = self._conn.execute(
+                    "SELECT size FROM extractions WHERE key = ?", (key,)).fetchone()
+                if old is not None:
+                    self._total_bytes -= old[0]
+                # REPLACE gives the row a new rowid, so rowid order is write order
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO extractions (key, results, size) VALUES (?, ?, ?)",
+                    (key, encoded, len(encoded)))
+                self._total_bytes += len(encoded)
+                self._evict()
+                self._conn.commit()
+
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT rowid, size FROM extractions ORDER BY rowid LIMIT 64").fetchall()
+            if not rows:
+                self._total_bytes = 0
+                return
+            for rowid, size in rows:
+                self._conn.execute("DELETE FROM extractions WHERE rowid = ?", (rowid,))
+                self._total_bytes -= size
+                self.evictions += 1
+                if self._total_bytes <= self.max_bytes:
+                    return
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                'memory_hits': self.memory_hits,
+                'store_hits': self.store_hits,
+                'misses': self.misses,
+                'memory_entries': len(self._memory),
+                'stored_bytes': self._total_bytes,
+                'evictions': self.evictions,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> ExtractionCache:
+    """
+    Shared cache used by the parsers.
+
+    Persisted at EXTRACTION_CACHE_PATH, or kept in memory only when that is
+    set to an empty string.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ExtractionCache(
+                os.environ.get('EXTRACTION_CACHE_PATH',
+                               '.cache/extraction_cache.sqlite3'),
+                max_entries=int(os.environ.get('EXTRACTION_CACHE_SIZE', '1024')),
+                max_bytes=int(os.environ.get(
+                    'EXTRACTION_CACHE_MAX_BYTES', str(256 * 1024 * 1024))))
+        return _default_cache
@@ -0,0 +1,184 @@
+import multiprocessing
+import os
+import queue
+import threading
+
+
+class PoolSaturated(Exception):
+    """Every worker is busy and the wait queue is full"""
+
+
+class TaskTimeout(Exception):
+    """A parse ran longer than the task timeout and its worker was killed"""
+
+
+class WorkerCrashed(Exception):
+    """A worker process died while parsing"""
+
+
+def _worker_main(conn) -> None:
+    """Parse and extract pages sent over conn until it is closed"""
+    from parsers import get_parser_backend
+    from parsers import start_debug_logs
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+
+        backend_name, content, profile, links = task
+        logs = start_debug_logs()
+        try:
+            backend = get_parser_backend(backend_name)
+            # The compact result pickles smaller than the legacy dict
+            result = backend.extract_result(backend.parse(content), profile,
+                                            links)
+            conn.send((True, result, logs))
+        except Exception as e:
+            conn.send((False, repr(e), logs))
+
+
+class _Worker:
+    __slots__ = ('conn', 'process')
+
+    def __init__(self, context) -> None:
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main,
+                                       args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class ExtractionPool:
+    """
+    Worker processes that parse and extract page bodies off the GIL.
+
+    At most workers + queue_depth calls are admitted at once, the rest fail
+    right away with PoolSaturated. A task running longer than task_timeout
+    gets its worker killed and replaced, and raises TaskTimeout.
+    """
+
+    def __init__(self, workers: int = None, queue_depth: int = None,
+                 task_timeout: float = 30.0) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_depth = self.workers * 2 if queue_depth is None else queue_depth
+        self.task_timeout = task_timeout
+
+        # spawn works the same on Windows and does not fork Flask's threads
+        self._context = multiprocessing.get_context('spawn')
+        self._admission = threading.BoundedSemaphore(
+            self.workers + self.queue_depth)
+        self._idle = queue.Queue()
+        for _ in range(self.workers):
+            self._idle.put(_Worker(self._context))
+
+        self._lock = threading.Lock()
+        self._closed = False
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.crashes = 0
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def extract(self, content, backend_name: str, profile=None,
+                links: bool = False):
+        """
+        Parse and extract content with the named backend in a worker.
+
+        profile is pickled along with the content, so it must be picklable.
+        links asks for the page's hrefs in result.links.
+
+        Returns:
+            tuple: (ExtractionResult, debug log entries recorded by the worker)
+        """
+        if self._closed or not self._admission.acquire(blocking=False):
+            self._count('rejected')
+            raise PoolSaturated(
+                f"All {self.workers} extraction workers busy and {self.queue_depth} tasks queued")
+        try:
+            worker = self._idle.get()
+            try:
+                worker.conn.send((backend_name, content, profile, links))
+                if not worker.conn.poll(self.task_timeout):
+                    worker.kill()
+                    worker = _Worker(self._context)
+                    self._count('timeouts')
+                    raise TaskTimeout(
+                        f"Extraction took longer than {self.task_timeout}s")
+                ok, payload, logs = worker.conn.recv()
+            except (EOFError, OSError):
+                worker.kill()
+                worker = _Worker(self._context)
+                self._count('crashes')
+                raise WorkerCrashed("Extraction worker died")
+            finally:
+                self._idle.put(worker)
+        finally:
+            self._admission.release()
+
+        if not ok:
+            raise RuntimeError(f"Extraction failed in worker: {payload}")
+        self._count('completed')
+        return payload, logs
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'workers_idle': self._idle.qsize(),
+                'queue_depth': self.queue_depth,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'crashes': self.crashes,
+            }
+
+    def close(self) -> None:
+        self._closed = True
+        for _ in range(self.workers):
+            self._idle.get().stop()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool():
+    """
+    Shared pool used by the parsers when EXTRACTION_WORKERS is set.
+
+    Returns None, meaning extract in the calling thread, otherwise.
+    """
+    global _default_pool
+    workers = os.environ.get('EXTRACTION_WORKERS')
+    if not workers:
+        return None
+    with _default_pool_lock:
+        if _default_pool is None:
+            queue_depth = os.environ.get('EXTRACTION_QUEUE_DEPTH')
+            _default_pool = ExtractionPool(
+                workers=int(workers) or None,
+                queue_depth=int(queue_depth) if queue_depth else None,
+                task_timeout=float(os.environ.get('EXTRACTION_TASK_TIMEOUT', '30')))
+        return _default_pool
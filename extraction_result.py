@@ -0,0 +1,124 @@
+from array import array
+
+HEADING = 0
+PARAGRAPH = 1
+LIST_ITEM = 2
+
+KIND_NAMES = ('heading', 'paragraph', 'list_item')
+
+# Stored in the level column of list items
+LIST_TYPES = ('ul', 'ol')
+
+
+class ExtractionResult:
+    """
+    Extracted elements of one page, stored column-wise.
+
+    Every element has a kind, a level (1-6 for headings, the LIST_TYPES
+    index for list items), its container index, its index within the
+    container (and within its list for list items), and an offset and
+    length into one shared text buffer. That buffer is full_text itself:
+    element texts are appended to it with their separators and joined once,
+    the first time the text is read.
+
+    to_dict() gives the legacy getSoupResults dict. links holds the href of
+    every <a> in the page, as written, when the extractor was asked for
+    them, and None otherwise.
+    """
+
+    __slots__ = ('kinds', 'levels', 'containers', 'indexes', 'items',
+                 'offsets', 'lengths', 'links', '_parts', '_size', '_text')
+
+    def __init__(self) -> None:
+        self.kinds = array('b')
+        self.levels = array('b')
+        self.containers = array('i')
+        self.indexes = array('i')
+        self.items = array('i')
+        self.offsets = array('q')
+        self.lengths = array('i')
+        self.links = None
+        self._parts = []
+        self._size = 0
+        self._text = None
+
+    def _append(self, text: str) -> None:
+        if self._text is not None:
+            self._parts = [self._text]
+            self._text = None
+        self._parts.append(text)
+        self._size += len(text)
+
+    def _add(self, kind: int, level: int, container: int, index: int,
+             item: int, text: str, separator: str) -> None:
+        self.kinds.append(kind)
+        self.levels.append(level)
+        self.containers.append(container)
+        self.indexes.append(index)
+        self.items.append(item)
+        self.offsets.append(self._size + (2 if kind == LIST_ITEM else 0))
+        self.lengths.append(len(text))
+        if kind == LIST_ITEM:
+            self._append("• ")
+        self._append(text)
+        self._append(separator)
+
+    def add_heading(self, tag: str, container: int, index: int, text: str) -> None:
+        self._add(HEADING, int(tag[1]), container, index, -1, text, "\n\n")
+
+    def add_paragraph(self, container: int, index: int, text: str) -> None:
+        self._add(PARAGRAPH, 0, container, index, -1, text, "\n\n")
+
+    def add_list_item(self, list_tag: str, container: int, list_index: int,
+                      item_index: int, text: str) -> None:
+        self._add(LIST_ITEM, LIST_TYPES.index(list_tag), container,
+                  list_index, item_index, text, "\n")
+
+    def end_list(self) -> None:
+        """Blank line after a list that had items"""
+        self._append("\n")
+
+    @property
+    def full_text(self) -> str:
+        if self._text is None:
+            self._text = ''.join(self._parts)
+            self._parts = None
+        return self._text
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def text(self, i: int) -> str:
+        offset = self.offsets[i]
+        return self.full_text[offset:offset + self.lengths[i]]
+
+    def key(self, i: int) -> str:
+        """The legacy key of element i, e.g. list_ul_0_3_7"""
+        kind = self.kinds[i]
+        if kind == HEADING:
+            return f"heading_h{self.levels[i]}_{self.containers[i]}_{self.indexes[i]}"
+        if kind == PARAGRAPH:
+            return f"paragraph_{self.containers[i]}_{self.indexes[i]}"
+        return f"list_{LIST_TYPES[self.levels[i]]}_{self.containers[i]}_{self.indexes[i]}_{self.items[i]}"
+
+    def count(self, kind: int) -> int:
+        return self.kinds.count(kind)
+
+    def to_dict(self) -> dict:
+        """full_text followed by every element under its legacy key"""
+        results_dict = {"full_text": self.full_text}
+        for i in range(len(self.kinds)):
+            results_dict[self.key(i)] = self.text(i)
+        return results_dict
+
+    def __getstate__(self):
+        # Ship the joined text, not the parts
+        return (self.kinds, self.levels, self.containers, self.indexes,
+                self.items, self.offsets, self.lengths, self.full_text,
+                self.links)
+
+    def __setstate__(self, state) -> None:
+        (self.kinds, self.levels, self.containers, self.indexes, self.items,
+         self.offsets, self.lengths, self._text, self.links) = state
+        self._parts = None
+        self._size = len(self._text)
@@ -0,0 +1,268 @@
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalize url for use as a cache key.
+
+    Lowercases scheme and host, drops default ports and fragments, sorts the
+    query string and uses / for an empty path.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+
+class CachedResponse:
+    """The parts of a response DefaultParser uses, possibly from the cache"""
+
+    __slots__ = ('status_code', 'headers', 'content', 'cache_status')
+
+    def __init__(self, status_code: int, headers, content: bytes,
+                 cache_status: str) -> None:
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        # 'hit', 'revalidated', 'miss' or 'bypass'
+        self.cache_status = cache_status
+
+
+class CacheEntry:
+    __slots__ = ('url', 'etag', 'last_modified', 'content_type', 'body',
+                 'fetched_at')
+
+    def __init__(self, url, etag, last_modified, content_type, body,
+                 fetched_at) -> None:
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_type = content_type
+        self.body = body
+        self.fetched_at = fetched_at
+
+
+class HttpCache:
+    """
+    On-disk response cache with conditional revalidation.
+
+    Responses are kept in a SQLite file keyed by normalize_url. An entry is
+    served without a request while younger than its TTL, and revalidated
+    with If-None-Match/If-Modified-Since afterwards. When the bodies exceed
+    max_bytes the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024,
+                 ttl: float = 300.0, domain_ttls: dict = None) -> None:
+        """
+        Args:
+            path: SQLite file to store responses in
+            max_bytes: Upper bound on the total size of stored bodies
+            ttl: Seconds an entry is served without revalidating
+            domain_ttls: TTL overrides by host, 'example.com' also covers
+                its subdomains
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.domain_ttls = domain_ttls or {}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_type TEXT,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.bytes_saved = 0
+
+    def ttl_for(self, url: str) -> float:
+        host = (urlsplit(url).hostname or '').lower()
+        while host:
+            if host in self.domain_ttls:
+                return self.domain_ttls[host]
+            host = host.partition('.')[2]
+        return self.ttl
+
+    def lookup(self, url: str):
+        """Return the CacheEntry for url, or None"""
+        key = normalize_url(url)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, content_type, body, fetched_at FROM responses WHERE url = ?",
+                (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE url = ?", (time.time(), key))
+            self._conn.commit()
+        return CacheEntry(key, *row)
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.fetched_at < self.ttl_for(entry.url)
+
+    @staticmethod
+    def conditional_headers(entry: CacheEntry) -> dict:
+        headers = {}
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def record_hit(self, entry: CacheEntry) -> None:
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += len(entry.body)
+
+    def record_not_modified(self, entry: CacheEntry) -> None:
+        """Mark entry fresh again after a 304"""
+        with self._lock:
+            self.revalidated += 1
+            self.bytes_saved += len(entry.body)
+            self._conn.execute(
+                "UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), entry.url))
+            self._conn.commit()
+
+    def store(self, url: str, headers, body: bytes) -> None:
+        """Store a 200 response, unless it asked not to be stored"""
+        with self._lock:
+            self.misses += 1
+        if 'no-store' in headers.get('Cache-Control', ''):
+            return
+        if len(body) > self.max_bytes:
+            return
+
+        key = normalize_url(url)
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT size FROM responses WHERE url = ?", (key,)).fetchone()
+            if old is not None:
+                self._total_bytes -= old[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, headers.get('ETag'), headers.get('Last-Modified'),
+                 headers.get('Content-Type'), body, len(body), now, now))
+            self._total_bytes += len(body)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT url, size FROM responses ORDER BY accessed_at LIMIT 64").fetchall()
+            if not rows:
+                self._total_bytes = 0
+                return
+            for url, size in rows:
+                self._conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self._total_bytes -= size
+                if self._total_bytes <= self.max_bytes:
+                    return
+
+    def fetch(self, url: str, headers: dict, timeout: float = None) -> CachedResponse:
+        """GET url with requests, going through the cache"""
+        import requests
+
+        entry = self.lookup(url)
+        if entry is not None and self.is_fresh(entry):
+            self.record_hit(entry)
+            return CachedResponse(200, {'Content-Type': entry.content_type or ''},
+                                  entry.body, 'hit')
+
+        request_headers = dict(headers)
+        if entry is not None:
+            request_headers.update(self.conditional_headers(entry))
+        response = requests.get(url, headers=request_headers, timeout=timeout)
+
+        if response.status_code == 304 and entry is not None:
+            self.record_not_modified(entry)
+            return CachedResponse(200, {'Content-Type': entry.content_type or ''},
+                                  entry.body, 'revalidated')
+        if response.status_code == 200:
+            self.store(url, response.headers, response.content)
+            return CachedResponse(200, response.headers, response.content, 'miss')
+        return CachedResponse(response.status_code, response.headers,
+                              response.content, 'bypass')
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidated': self.revalidated,
+                'bytes_saved': self.bytes_saved,
+                'bytes_stored': self._total_bytes,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def parse_domain_ttls(value: str) -> dict:
+    """Parse 'example.com=60,other.org=3600' into {host: seconds}"""
+    domain_ttls = {}
+    for item in value.split(','):
+        if item.strip():
+            host, _, seconds = item.partition('=')
+            domain_ttls[host.strip().lower()] = float(seconds)
+    return domain_ttls
+
+
+def get_default_cache():
+    """
+    Shared cache used by DefaultParser, stored at HTTP_CACHE_PATH.
+
+    Returns None when HTTP_CACHE_PATH is set to an empty string.
+    """
+    global _default_cache
+    path = os.environ.get('HTTP_CACHE_PATH', '.cache/http_cache.sqlite3')
+    if not path:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = HttpCache(
+                path,
+                max_bytes=int(os.environ.get(
+                    'HTTP_CACHE_MAX_BYTES', str(512 * 1024 * 1024))),
+                ttl=float(os.environ.get('HTTP_CACHE_TTL', '300')),
+                domain_ttls=parse_domain_ttls(
+                    os.environ.get('HTTP_CACHE_DOMAIN_TTLS', '')))
+        return _default_cache
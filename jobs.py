@@ -0,0 +1,260 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from extraction_pool import PoolSaturated
+from http_cache import normalize_url
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+FINISHED = (DONE, FAILED)
+
+
+class JobQueue:
+    """
+    Scrape jobs persisted in SQLite.
+
+    A URL has at most one queued or running job; enqueueing it again returns
+    that job instead of adding another.
+    """
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                url_key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                result TEXT,
+                error TEXT,
+                run_after REAL
+            )
+            """
+        )
+        columns = [row['name'] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+        if 'run_after' not in columns:
+            # Queues created before jobs could be retried
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN run_after REAL")
+        # Deduplicates in-flight URLs, finished jobs may repeat
+        self._conn.execute(
+            f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS jobs_in_flight_url
+            ON jobs (url_key) WHERE status IN ('{QUEUED}', '{RUNNING}')
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_status_created_at ON jobs (status, created_at)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at) WHERE finished_at IS NOT NULL")
+        self._conn.commit()
+
+    def enqueue(self, url: str) -> str:
+        """Queue url and return its job id, or the id of its in-flight job"""
+        url_key = normalize_url(url)
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT INTO jobs (id, url, url_key, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (job_id, url, url_key, QUEUED, time.time()))
+                self._conn.commit()
+                return job_id
+            except sqlite3.IntegrityError:
+                self._conn.rollback()
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE url_key = ? AND status IN (?, ?)",
+                    (url_key, QUEUED, RUNNING)).fetchone()
+                return row['id']
+
+    def claim(self):
+        """
+        Mark the oldest queued job that is not waiting for a retry running
+        and return (id, url), or None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                """
+                UPDATE jobs SET status = ?, started_at = ?, run_after = NULL
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE status = ? AND (run_after IS NULL OR run_after <= ?)
+                    ORDER BY created_at LIMIT 1
+                )
+                RETURNING id, url
+                """,
+                (RUNNING, now, QUEUED, now)).fetchone()
+            self._conn.commit()
+        return (row['id'], row['url']) if row is not None else None
+
+    def _finish(self, job_id: str, status: str, result, error) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ? WHERE id = ?",
+                (status, time.time(), result, error, job_id))
+            self._conn.commit()
+
+    def complete(self, job_id: str, result: dict) -> None:
+        self._finish(job_id, DONE, json.dumps(result), None)
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._finish(job_id, FAILED, None, error)
+
+    def retry(self, job_id: str, delay: float) -> None:
+        """Put a running job back in the queue, to be claimed after delay seconds"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, run_after = ? WHERE id = ?",
+                (QUEUED, time.time() + delay, job_id))
+            self._conn.commit()
+
+    def purge(self, max_age: float) -> int:
+        """Delete jobs that finished more than max_age seconds ago, return how many"""
+        with self._lock:
+            count = self._conn.execute(
+                "DELETE FROM jobs WHERE finished_at < ? AND status IN (?, ?)",
+                (time.time() - max_age, *FINISHED)).rowcount
+            self._conn.commit()
+        return count
+
+    def requeue_running(self) -> int:
+        """Put jobs left running by a previous process back in the queue"""
+        with self._lock:
+            count = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?",
+                (QUEUED, RUNNING)).rowcount
+            self._conn.commit()
+        return count
+
+    def get(self, job_id: str, with_result: bool = True):
+        """Return the job as a dict, or None if there is no such job"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            'id': row['id'],
+            'url': row['url'],
+            'status': row['status'],
+            'created_at': row['created_at'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at'],
+            'error': row['error'],
+        }
+        if row['run_after'] is not None:
+            job['retry_at'] = row['run_after']
+        if row['status'] == QUEUED:
+            with self._lock:
+                job['position'] = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?",
+                    (QUEUED, row['created_at'])).fetchone()[0]
+        if with_result and row['result'] is not None:
+            job['result'] = json.loads(row['result'])
+        return job
+
+
+class JobWorkers:
+    """
+    Threads that take jobs off a JobQueue and run handler(url) on them.
+
+    A job whose handler raises PoolSaturated is queued again and retried
+    after retry_delay seconds instead of failing, one whose handler returns
+    an empty result fails. When retention is set, finished jobs older than
+    that many seconds are purged every purge_interval seconds.
+    """
+
+    def __init__(self, jobs: JobQueue, handler, threads: int = 4,
+                 poll_interval: float = 1.0, retry_delay: float = 5.0,
+                 retention: float = None, purge_interval: float = 3600.0) -> None:
+        self.jobs = jobs
+        self.handler = handler
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.retention = retention
+        self.purge_interval = purge_interval
+        self._purge_lock = threading.Lock()
+        self._next_purge = time.time()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._threads = [
+            threading.Thread(target=self._run, name=f"job-worker-{i}",
+                             daemon=True)
+            for i in range(threads)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def notify(self) -> None:
+        """Wake idle workers after something was enqueued"""
+        self._wakeup.set()
+
+    def _purge(self) -> None:
+        """Purge old finished jobs when the purge interval has passed"""
+        if not self.retention:
+            return
+        with self._purge_lock:
+            now = time.time()
+            if now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_interval
+        try:
+            count = self.jobs.purge(self.retention)
+        except sqlite3.Error:
+            logger.exception("Purging finished jobs failed")
+            return
+        if count:
+            logger.info("Purged %s jobs finished over %ss ago", count, self.retention)
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._purge()
+            claimed = self.jobs.claim()
+            if claimed is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            job_id, url = claimed
+            try:
+                result = self.handler(url)
+            except PoolSaturated:
+                logger.info("Job %s for %s retried in %ss, extraction pool is full",
+                            job_id, url, self.retry_delay)
+                self.jobs.retry(job_id, self.retry_delay)
+            except Exception as e:
+                logger.exception("Job %s for %s failed", job_id, url)
+                self.jobs.fail(job_id, str(e))
+            else:
+                if result:
+                    self.jobs.complete(job_id, result)
+                else:
+                    # The handler reports fetch errors and error statuses this way
+                    logger.info("Job %s for %s failed, nothing was extracted", job_id, url)
+                    self.jobs.fail(job_id, "The page could not be fetched or had no content")
+
+    def stop(self) -> None:
+        self._stopping = True
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
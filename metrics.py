@@ -0,0 +1,226 @@
+import bisect
+import collections
+import contextlib
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds, the Prometheus client defaults
+# stretched to cover browser renders
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+           30.0, 60.0)
+
+# Domains beyond this many are counted under domain="other"
+MAX_DOMAINS = int(os.environ.get('METRICS_MAX_DOMAINS', '200'))
+
+# Labels of the spans the current code runs in
+_span_labels = contextvars.ContextVar('span_labels', default=None)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'sum', 'count')
+
+    def __init__(self) -> None:
+        # One count per bucket plus +Inf, not cumulative
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class StageMetrics:
+    """Histograms of stage durations by stage, parser and domain"""
+
+    def __init__(self, max_domains: int = MAX_DOMAINS) -> None:
+        self.max_domains = max_domains
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._domains = set()
+
+    def observe(self, stage: str, seconds: float, parser: str = '',
+                domain: str = '') -> None:
+        with self._lock:
+            if domain and domain not in self._domains:
+                if len(self._domains) < self.max_domains:
+                    self._domains.add(domain)
+                else:
+                    domain = 'other'
+            key = (stage, parser, domain)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def snapshot(self) -> dict:
+        """(stage, parser, domain) -> (bucket counts, sum, count)"""
+        with self._lock:
+            return {key: (list(h.buckets), h.sum, h.count)
+                    for key, h in self._histograms.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._domains.clear()
+
+
+stage_metrics = StageMetrics()
+
+
+@contextlib.contextmanager
+def metric_labels(**labels):
+    """Label every span started inside the block, e.g. with the domain"""
+    token = _span_labels.set({**(_span_labels.get() or {}), **labels})
+    try:
+        yield
+    finally:
+        _span_labels.reset(token)
+
+
+@contextlib.contextmanager
+def span(stage: str, **labels):
+    """
+    Time the block into the stage's histogram.
+
+    The span is labelled with parser and domain from labels or the enclosing
+    spans and metric_labels, and passes its labels on to spans inside it.
+    """
+    merged = {**(_span_labels.get() or {}), **labels}
+    token = _span_labels.set(merged)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _span_labels.reset(token)
+        stage_metrics.observe(stage, elapsed, merged.get('parser', ''),
+                              merged.get('domain', ''))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _metric_name(*parts) -> str:
+    name = '_'.join(parts)
+    return ''.join(char if char.isalnum() or char == '_' else '_'
+                   for char in name)
+
+
+def render_prometheus(components: dict = None) -> str:
+    """
+    Stage histograms and component gauges in the Prometheus text format.
+
+    Args:
+        components: name -> metrics() dict of e.g. a cache or pool; numeric
+            values are exported as datascrape_<name>_<key> gauges
+
+    Returns:
+        str: The exposition text
+    """
+    lines = [
+        "# HELP datascrape_stage_seconds Time spent in each scrape stage",
+        "# TYPE datascrape_stage_seconds histogram",
+    ]
+    for (stage, parser, domain), (buckets, total, count) in sorted(
+            stage_metrics.snapshot().items()):
+        labels = f'stage="{_escape(stage)}",parser="{_escape(parser)}",domain="{_escape(domain)}"'
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS + ('+Inf',), buckets):
+            cumulative += bucket
+            lines.append(
+                f'datascrape_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'datascrape_stage_seconds_sum{{{labels}}} {total}')
+        lines.append(f'datascrape_stage_seconds_count{{{labels}}} {count}')
+
+    for component, values in (components or {}).items():
+        for key, value in values.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)):
+                continue
+            name = _metric_name('datascrape', component, key)
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread every interval seconds.
+
+    Stacks are counted in the folded format flame graph tools read, root
+    first and separated by semicolons.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='sampling-profiler')
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> collections.Counter:
+        self._stopped.set()
+        self._thread.join()
+        return self.stacks
+
+
+# Requests slower than this many seconds have their profile written out,
+# unset or empty disables profiling
+PROFILE_SLOW_SECONDS = os.environ.get('PROFILE_SLOW_SECONDS')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '.cache/profiles')
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', '0.005'))
+
+
+@contextlib.contextmanager
+def profile_if_slow(name: str):
+    """
+    Sample the calling thread while the block runs, if PROFILE_SLOW_SECONDS
+    is set, and write the folded stacks to PROFILE_DIR when it took longer.
+    """
+    if not PROFILE_SLOW_SECONDS:
+        yield
+        return
+
+    profiler = SamplingProfiler(threading.get_ident(), PROFILE_INTERVAL)
+    profiler.start()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stacks = profiler.stop()
+        if elapsed >= float(PROFILE_SLOW_SECONDS) and stacks:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(
+                PROFILE_DIR, f"{int(time.time() * 1000)}-{_metric_name(name)[:80]}.folded")
+            with open(path, 'w') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            logger.warning("Slow request %s took %.2fs, profile written to %s",
+                           name, elapsed, path)
@@ -0,0 +1,34 @@
+-- Extracted content, stored once however many URLs or fetches produced it
+CREATE TABLE document_contents (
+    id BIGSERIAL PRIMARY KEY,
+    content_hash CHAR(32) NOT NULL UNIQUE,
+    full_text TEXT NOT NULL,
+    element_count INTEGER NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Elements of a content, in extraction order
+CREATE TABLE document_elements (
+    content_id BIGINT NOT NULL REFERENCES document_contents (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    tag VARCHAR(64) NOT NULL,
+    contents TEXT NOT NULL,
+    PRIMARY KEY (content_id, position)
+);
+
+-- One row per URL and content; fetching unchanged content again only
+-- updates last_fetched_at and fetch_count
+CREATE TABLE documents (
+    id BIGSERIAL PRIMARY KEY,
+    url TEXT NOT NULL,
+    domain VARCHAR(253) NOT NULL,
+    content_id BIGINT NOT NULL REFERENCES document_contents (id),
+    fetched_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_fetched_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    fetch_count INTEGER NOT NULL DEFAULT 1,
+    UNIQUE (url, content_id)
+);
+
+CREATE INDEX documents_url_last_fetched_at ON documents (url, last_fetched_at DESC);
+CREATE INDEX documents_domain_last_fetched_at ON documents (domain, last_fetched_at DESC);
+CREATE INDEX documents_content_id ON documents (content_id);
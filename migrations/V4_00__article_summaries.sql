@@ -0,0 +1,7 @@
+-- Summaries of stored documents, one article per URL
+ALTER TABLE articles
+    ADD COLUMN url TEXT,
+    ADD COLUMN content_id BIGINT REFERENCES document_contents (id) ON DELETE SET NULL,
+    ADD COLUMN updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
+
+CREATE UNIQUE INDEX articles_url ON articles (url);
@@ -0,0 +1,15 @@
+-- Full-text search over stored contents, headings ranked above body text.
+-- store_document fills search_vector with the same expression on insert.
+ALTER TABLE document_contents ADD COLUMN search_vector tsvector;
+
+UPDATE document_contents c
+SET search_vector =
+    setweight(to_tsvector('english', COALESCE((
+        SELECT string_agg(e.contents, ' ' ORDER BY e.position)
+        FROM document_elements e
+        WHERE e.content_id = c.id AND e.tag LIKE 'heading\_%'), '')), 'A')
+    || to_tsvector('english', c.full_text);
+
+ALTER TABLE document_contents ALTER COLUMN search_vector SET NOT NULL;
+
+CREATE INDEX document_contents_search_vector ON document_contents USING GIN (search_vector);
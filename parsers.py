@@ -1,31 +1,93 @@
-from bs4 import BeautifulSoup
-from bs4 import Tag
-from bs4 import NavigableString
-import requests
-from selenium import webdriver
-
-# Global debug log list to store debug information
-debug_logs = []
-
-
-def add_debug_log(message, level="INFO"):
+import contextvars
+import logging
+import os
+from http_cache import HttpCache
+from http_cache import get_default_cache
+from extraction_cache import ExtractionCache
+from extraction_cache import content_key
+from extraction_cache import get_default_cache as get_extraction_cache
+from extraction_pool import ExtractionPool
+from extraction_pool import TaskTimeout
+from extraction_pool import WorkerCrashed
+from extraction_pool import get_default_pool as get_extraction_pool
+from extraction_result import ExtractionResult
+from metrics import span
+from webdriver_pool import WebDriverPool
+from webdriver_pool import get_default_pool
+
+logger = logging.getLogger(__name__)
+
+# Between INFO and WARNING, for steps that found what they were looking for
+SUCCESS = 25
+logging.addLevelName(SUCCESS, "SUCCESS")
+
+LOG_LEVELS = {
+    "INFO": logging.INFO,
+    "SUCCESS": SUCCESS,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+}
+
+# Lowest level kept in the per-request buffer, OFF keeps nothing
+DEBUG_LOG_LEVEL = LOG_LEVELS.get(
+    os.environ.get("DEBUG_LOG_LEVEL", "INFO").upper(), logging.CRITICAL + 1)
+
+# Debug logs of the current request, None when no request is collecting them
+_debug_logs = contextvars.ContextVar("debug_logs", default=None)
+
+
+def start_debug_logs() -> list:
+    """Start collecting debug logs for the current request or task"""
+    logs = []
+    _debug_logs.set(logs)
+    return logs
+
+
+def debug_log_enabled(level="INFO") -> bool:
+    """Whether a message at level would be kept anywhere"""
+    levelno = LOG_LEVELS[level]
+    return (_debug_logs.get() is not None and levelno >= DEBUG_LOG_LEVEL) \
+        or logger.isEnabledFor(levelno)
+
+
+def add_debug_log(message, level="INFO", *args):
     """
-    Add a debug message to the global debug logs
+    Add a debug message to the current request's debug logs
+
+    The message is only formatted, as message % args, if the level is
+    enabled for the request buffer or the parsers logger.
 
     Args:
-        message: The message to log
+        message: The message to log, with %-style placeholders for args
         level: Log level (INFO, WARNING, ERROR, SUCCESS)
+        args: Values for the placeholders in message
     """
-    log_entry = {
-        "message": message,
-        "level": level
-    }
-    debug_logs.append(log_entry)
-    print(f"DEBUG [{level}]: {message}")
+    levelno = LOG_LEVELS[level]
+    logs = _debug_logs.get()
+    buffered = logs is not None and levelno >= DEBUG_LOG_LEVEL
+    if not buffered and not logger.isEnabledFor(levelno):
+        return
+
+    if args:
+        message = message % args
+    if buffered:
+        logs.append({
+            "message": message,
+            "level": level
+        })
+    logger.log(levelno, message)
+
+
+def extend_debug_logs(entries: list) -> None:
+    """Add log entries recorded elsewhere, e.g. in a worker process"""
+    logs = _debug_logs.get()
+    if logs is not None:
+        logs.extend(entries)
 
 
 def get_debug_logs():
-    """Get all debug logs as HTML formatted string with improved styling"""
+    """Get the current request's debug logs as HTML formatted string with improved styling"""
+    debug_logs = _debug_logs.get()
     if not debug_logs:
         return "<p>No debug logs recorded</p>"
 
@@ -52,7 +114,7 @@ def get_debug_logs():
             current_section = "URL Parsing"
             log_html += '</ul></div>'
             log_html += f'<div class="log-section"><h4>{current_section}</h4><ul>'
-        elif "Creating BeautifulSoup object" in message:
+        elif "Building parse tree" in message:
             current_section = "HTML Parsing"
             log_html += '</ul></div>'
             log_html += f'<div class="log-section"><h4>{current_section}</h4><ul>'
@@ -138,158 +200,584 @@ def get_debug_logs():
     return log_html
 
 
-def getSoupResults(soup: BeautifulSoup) -> dict:
+# Article container selectors, in the order their contents are emitted
+ARTICLE_CONTAINERS = ['article', 'main',
+                      'div.article', 'div.content', 'div.post']
+
+# Bump when a change alters what the extractors return, so memoized results
+# from the previous version are not reused
+EXTRACTOR_VERSION = 2
+
+HEADING_TAGS = frozenset(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+LIST_TAGS = frozenset(['ul', 'ol'])
+
+
+def _build_container_lookup(selectors):
+    """Map tag name -> [(priority, class name or None)] for the selectors"""
+    lookup = {}
+    for priority, selector in enumerate(selectors):
+        if '.' in selector:
+            tag, class_name = selector.split('.')
+        else:
+            tag, class_name = selector, None
+        lookup.setdefault(tag, []).append((priority, class_name))
+    return lookup
+
+
+_CONTAINER_LOOKUP = _build_container_lookup(ARTICLE_CONTAINERS)
+
+
+def _match_container(candidates, classes):
+    """Return the priority of the first candidate selector matching classes"""
+    for priority, class_name in candidates:
+        if class_name is None or class_name in classes:
+            return priority
+    return None
+
+
+class _ContainerContent:
+    """Headings, paragraphs and list items collected from one container"""
+
+    __slots__ = ('element', 'headings', 'paragraphs', 'lists', 'open_lists')
+
+    def __init__(self, element) -> None:
+        self.element = element
+        # (tag name, element) in document order
+        self.headings = []
+        self.paragraphs = []
+        # (tag name, [li elements]) in document order
+        self.lists = []
+        self.open_lists = []
+
+    def enter(self, element, name: str) -> None:
+        if name in HEADING_TAGS:
+            self.headings.append((name, element))
+        elif name == 'p':
+            self.paragraphs.append(element)
+        elif name == 'li':
+            # An item belongs to every list it is nested in, same as
+            # list_elem.find_all('li') on each of them
+            for _, items in self.open_lists:
+                items.append(element)
+        elif name in LIST_TAGS:
+            record = (name, [])
+            self.lists.append(record)
+            self.open_lists.append(record)
+
+    def leave(self, name: str) -> None:
+        if name in LIST_TAGS:
+            self.open_lists.pop()
+
+
+def _collect_containers(soup, skip=frozenset(), links=None):
     """
-    Extract article text from a BeautifulSoup object.
+    Walk the tree once and collect the content of every article container.
 
-    Args:
-        soup: BeautifulSoup object containing the HTML content
+    Containers nested inside another container are skipped, so their content
+    is only reported once through the outermost one. The content of the body
+    and of the whole document is collected in the same walk, for the case
+    where no container is found. Subtrees whose id() is in skip are not
+    walked at all. When links is a list, the href of every <a> walked is
+    appended to it.
 
     Returns:
-        dict: Dictionary containing extracted article content with structured keys
+        tuple: (containers sorted by selector priority then document order,
+                content of the body or None, content of the whole document)
+    """
+    from bs4 import Tag
+
+    containers = []
+    current = None
+    body = soup.body
+    body_content = None
+    document_content = _ContainerContent(soup)
+    active = [document_content]
+
+    stack = [(soup, iter(soup.contents))]
+    while stack:
+        node, children = stack[-1]
+        for child in children:
+            if isinstance(child, Tag) and id(child) not in skip:
+                break
+        else:
+            stack.pop()
+            if node is soup:
+                continue
+            for content in active:
+                content.leave(node.name)
+            if current is not None and node is current.element:
+                active.remove(current)
+                current = None
+            elif node is body:
+                active.remove(body_content)
+            continue
+
+        name = child.name
+        if current is None:
+            candidates = _CONTAINER_LOOKUP.get(name)
+            if candidates:
+                priority = _match_container(
+                    candidates, child.get('class') or ())
+                if priority is not None:
+                    current = _ContainerContent(child)
+                    containers.append((priority, len(containers), current))
+                    active.append(current)
+        if child is body:
+            body_content = _ContainerContent(child)
+            active.append(body_content)
+
+        for content in active:
+            content.enter(child, name)
+        if links is not None and name == 'a':
+            href = child.get('href')
+            if href:
+                links.append(href)
+        stack.append((child, iter(child.contents)))
+
+    containers.sort(key=lambda entry: (entry[0], entry[1]))
+    return containers, body_content, document_content
+
+
+def _collect_lexbor_containers(tree, skip=frozenset(), links=None):
+    """
+    Same walk as _collect_containers, over a selectolax LexborHTMLParser tree.
+
+    Lexbor always builds html/head/body, so the body content is never None.
+    skip holds the mem_id of subtrees not to walk.
     """
-    # Clear previous debug logs
-    global debug_logs
-    debug_logs = []
+    containers = []
+    current = None
+    current_id = None
+    root = tree.root
+    body_id = tree.body.mem_id
+    body_content = None
+    document_content = _ContainerContent(root)
+    active = [document_content]
+
+    stack = [(None, None, iter((root,)))]
+    while stack:
+        node_id, name, children = stack[-1]
+        for child in children:
+            if child.tag[0] not in '-_' and child.mem_id not in skip:
+                break
+        else:
+            stack.pop()
+            if node_id is None:
+                continue
+            for content in active:
+                content.leave(name)
+            if node_id == current_id:
+                active.remove(current)
+                current = current_id = None
+            elif node_id == body_id:
+                active.remove(body_content)
+            continue
+
+        name = child.tag
+        child_id = child.mem_id
+        if current is None:
+            candidates = _CONTAINER_LOOKUP.get(name)
+            if candidates:
+                priority = _match_container(
+                    candidates, (child.attributes.get('class') or '').split())
+                if priority is not None:
+                    current = _ContainerContent(child)
+                    current_id = child_id
+                    containers.append((priority, len(containers), current))
+                    active.append(current)
+        if child_id == body_id:
+            body_content = _ContainerContent(child)
+            active.append(body_content)
+
+        for content in active:
+            content.enter(child, name)
+        if links is not None and name == 'a':
+            href = child.attributes.get('href')
+            if href:
+                links.append(href)
+        stack.append((child_id, name, child.iter(include_text=False)))
+
+    containers.sort(key=lambda entry: (entry[0], entry[1]))
+    return containers, body_content, document_content
+
+
+def _outermost(matches, key, parents):
+    """Drop matched elements nested inside another match, keeping order"""
+    matched = {key(element) for _, element in matches}
+    kept = []
+    seen = set()
+    for priority, element in matches:
+        element_key = key(element)
+        if element_key in seen:
+            continue
+        seen.add(element_key)
+        if not any(key(parent) in matched for parent in parents(element)):
+            kept.append((priority, element))
+    return kept
+
+
+def _lexbor_parents(node):
+    parent = node.parent
+    while parent is not None:
+        yield parent
+        parent = parent.parent
+
+
+def _select_soup(soup, profile):
+    """
+    Find the profile's containers and boilerplate with its compiled selectors.
 
-    add_debug_log(f"Starting HTML parsing with BeautifulSoup", "INFO")
+    Returns:
+        tuple: ([(priority, element)] of the outermost containers,
+                frozenset of id() of boilerplate elements)
+    """
+    skip = frozenset(id(element) for selector in profile.skip_selectors
+                     for element in selector.select(soup))
+    matches = [(priority, element)
+               for priority, selector in enumerate(profile.container_selectors)
+               for element in selector.select(soup)
+               if id(element) not in skip]
+    return _outermost(matches, id, lambda element: element.parents), skip
+
+
+def _select_lexbor(tree, profile):
+    """Same as _select_soup over a lexbor tree, keyed by mem_id"""
+    skip = frozenset(node.mem_id for selector in profile.skip
+                     for node in tree.css(selector))
+    matches = [(priority, node)
+               for priority, selector in enumerate(profile.containers)
+               for node in tree.css(selector)
+               if node.mem_id not in skip]
+    return _outermost(matches, lambda node: node.mem_id, _lexbor_parents), skip
+
+
+def _walk_soup(root, content, skip) -> None:
+    """Feed every tag below root, minus skipped subtrees, to content"""
+    from bs4 import Tag
+
+    stack = [(None, iter(root.contents))]
+    while stack:
+        name, children = stack[-1]
+        for child in children:
+            if isinstance(child, Tag) and id(child) not in skip:
+                break
+        else:
+            stack.pop()
+            if name is not None:
+                content.leave(name)
+            continue
+        name = child.name
+        content.enter(child, name)
+        stack.append((name, iter(child.contents)))
+
+
+def _walk_lexbor(root, content, skip) -> None:
+    """Same as _walk_soup over a lexbor node"""
+    stack = [(None, root.iter(include_text=False))]
+    while stack:
+        name, children = stack[-1]
+        for child in children:
+            if child.tag[0] not in '-_' and child.mem_id not in skip:
+                break
+        else:
+            stack.pop()
+            if name is not None:
+                content.leave(name)
+            continue
+        name = child.tag
+        content.enter(child, name)
+        stack.append((name, child.iter(include_text=False)))
 
-    results_dict = {}
-    results_dict["full_text"] = ""  # Initialize the full_text key
 
-    # Try to find the main article content
-    article_containers = []
+def _collect_selected(selected, walk, skip):
+    """
+    Collect the content of containers already found by a profile, walking
+    only their subtrees.
 
-    # Look for common article container elements
-    add_debug_log("Looking for article containers...", "INFO")
-    for container in ['article', 'main', 'div.article', 'div.content', 'div.post']:
-        if '.' in container:
-            tag, class_name = container.split('.')
-            found = soup.find_all(tag, class_=class_name)
-            if len(found) > 0:
-                add_debug_log(
-                    f"Searching for {tag} with class {class_name}: found {len(found)} elements", "SUCCESS")
-            else:
-                add_debug_log(
-                    f"Searching for {tag} with class {class_name}: found {len(found)} elements", "INFO")
+    Returns:
+        tuple: Same shape as _collect_containers, without body or document
+    """
+    containers = []
+    for priority, element in selected:
+        content = _ContainerContent(element)
+        walk(element, content, skip)
+        containers.append((priority, len(containers), content))
+    return containers, None, None
+
+
+def _soup_text(element) -> str:
+    return element.get_text(strip=True)
+
+
+def _lexbor_text(node) -> str:
+    return node.text(deep=True, separator='', strip=True)
+
+
+# Elements whose text get_text leaves out. Lexbor also keeps the content of
+# <noscript> as raw markup, so it is left out as well
+_TEXTLESS_TAGS = frozenset(['script', 'style', 'template', 'noscript'])
+_TEXTLESS_SELECTOR = ', '.join(sorted(_TEXTLESS_TAGS))
+
+
+def _lexbor_visible_text(node) -> str:
+    """_lexbor_text without the text of _TEXTLESS_TAGS descendants"""
+    parts = []
+    stack = [node.iter(include_text=True)]
+    while stack:
+        for child in stack[-1]:
+            tag = child.tag
+            if tag == '-text':
+                text = child.text_content.strip()
+                if text:
+                    parts.append(text)
+            elif tag[0] not in '-_' and tag not in _TEXTLESS_TAGS:
+                stack.append(child.iter(include_text=True))
+                break
         else:
-            found = soup.find_all(container)
-            if len(found) > 0:
-                add_debug_log(
-                    f"Searching for {container} tag: found {len(found)} elements", "SUCCESS")
-            else:
-                add_debug_log(
-                    f"Searching for {container} tag: found {len(found)} elements", "INFO")
+            stack.pop()
+    return ''.join(parts)
+
+
+def _lexbor_text_of(tree):
+    """
+    Text function for the elements of a lexbor tree, leaving out scripts,
+    styles, templates and noscript content like bs4's get_text does.
+
+    Only the ancestors of such elements are walked in Python, every other
+    element goes through node.text.
+    """
+    hidden = set()
+    for node in tree.css(_TEXTLESS_SELECTOR):
+        parent = node.parent
+        while parent is not None and parent.mem_id not in hidden:
+            hidden.add(parent.mem_id)
+            parent = parent.parent
+    if not hidden:
+        return _lexbor_text
+
+    def text_of(node) -> str:
+        if node.mem_id in hidden:
+            return _lexbor_visible_text(node)
+        return _lexbor_text(node)
+    return text_of
+
+
+def _describe_selector(selector: str) -> str:
+    if '.' in selector:
+        tag, class_name = selector.split('.')
+        return f"{tag} with class {class_name}"
+    return f"{selector} tag"
+
+
+_CONTAINER_DESCRIPTIONS = [_describe_selector(selector)
+                           for selector in ARTICLE_CONTAINERS]
+
 
-        if found:
-            article_containers.extend(found)
+def _extract_results(collected, text_of, descriptions=None) -> dict:
+    """
+    Build the results dict from collected containers.
+
+    Args:
+        collected: (containers, body content, document content) as returned
+            by one of the _collect_*_containers functions
+        text_of: Function returning the stripped text of an element
+        descriptions: What each container priority was searched for, for the
+            debug log; defaults to the generic ARTICLE_CONTAINERS
+
+    Returns:
+        ExtractionResult: The extracted elements, to_dict() gives the legacy
+        dict with structured keys
+    """
+    containers, body_content, document_content = collected
+
+    result = ExtractionResult()
+
+    for priority, description in enumerate(descriptions or _CONTAINER_DESCRIPTIONS):
+        found = sum(1 for entry in containers if entry[0] == priority)
+        add_debug_log(
+            "Searching for %s: found %s elements", "SUCCESS" if found > 0 else "INFO", description, found)
+
+    article_containers = [entry[2] for entry in containers]
 
     if len(article_containers) > 0:
         add_debug_log(
-            f"Total article containers found: {len(article_containers)}", "SUCCESS")
+            "Total article containers found: %s", "SUCCESS", len(article_containers))
     else:
         add_debug_log(
-            f"Total article containers found: {len(article_containers)}", "WARNING")
+            "Total article containers found: %s", "WARNING", len(article_containers))
 
     # If no specific article containers found, use the body
     if not article_containers:
         add_debug_log(
             "No specific article containers found, falling back to body or entire document", "WARNING")
-        if soup.body:
+        if body_content is not None:
             add_debug_log("Using body tag as container", "INFO")
-            article_containers = [soup.body]
+            article_containers = [body_content]
         else:
             add_debug_log(
                 "No body tag found, using entire document", "WARNING")
-            article_containers = [soup]
+            article_containers = [document_content]
 
     # Process each potential article container
     total_headings = 0
     total_paragraphs = 0
     total_list_items = 0
+    # Nested list items are reported once per enclosing list
+    item_texts = {}
 
     for container_idx, container in enumerate(article_containers):
         add_debug_log(
-            f"Processing container {container_idx+1}/{len(article_containers)}", "INFO")
+            "Processing container %s/%s", "INFO", container_idx + 1, len(article_containers))
 
         # Extract headings
-        headings = container.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+        headings = container.headings
         if len(headings) > 0:
             add_debug_log(
-                f"Found {len(headings)} headings in container {container_idx+1}", "SUCCESS")
+                "Found %s headings in container %s", "SUCCESS", len(headings), container_idx + 1)
         else:
             add_debug_log(
-                f"Found {len(headings)} headings in container {container_idx+1}", "INFO")
-
-        for heading_idx, heading in enumerate(headings):
-            if heading.get_text(strip=True):
-                heading_text = heading.get_text(strip=True)
-                key = f"heading_{heading.name}_{container_idx}_{heading_idx}"
-                results_dict[key] = heading_text
-                # Append to full_text with appropriate formatting
-                results_dict["full_text"] += f"{heading_text}\n\n"
+                "Found %s headings in container %s", "INFO", len(headings), container_idx + 1)
+
+        for heading_idx, (heading_name, heading) in enumerate(headings):
+            heading_text = text_of(heading)
+            if heading_text:
+                result.add_heading(heading_name, container_idx, heading_idx,
+                                   heading_text)
                 total_headings += 1
 
         # Extract paragraphs
-        paragraphs = container.find_all('p')
+        paragraphs = container.paragraphs
         if len(paragraphs) > 0:
             add_debug_log(
-                f"Found {len(paragraphs)} paragraphs in container {container_idx+1}", "SUCCESS")
+                "Found %s paragraphs in container %s", "SUCCESS", len(paragraphs), container_idx + 1)
         else:
             add_debug_log(
-                f"Found {len(paragraphs)} paragraphs in container {container_idx+1}", "INFO")
+                "Found %s paragraphs in container %s", "INFO", len(paragraphs), container_idx + 1)
 
         for p_idx, paragraph in enumerate(paragraphs):
-            if paragraph.get_text(strip=True):
-                paragraph_text = paragraph.get_text(strip=True)
-                key = f"paragraph_{container_idx}_{p_idx}"
-                results_dict[key] = paragraph_text
-                # Append to full_text
-                results_dict["full_text"] += f"{paragraph_text}\n\n"
+            paragraph_text = text_of(paragraph)
+            if paragraph_text:
+                result.add_paragraph(container_idx, p_idx, paragraph_text)
                 total_paragraphs += 1
 
         # Extract lists
-        list_elements = container.find_all(['ul', 'ol'])
+        list_elements = container.lists
         if len(list_elements) > 0:
             add_debug_log(
-                f"Found {len(list_elements)} list elements in container {container_idx+1}", "SUCCESS")
+                "Found %s list elements in container %s", "SUCCESS", len(list_elements), container_idx + 1)
         else:
             add_debug_log(
-                f"Found {len(list_elements)} list elements in container {container_idx+1}", "INFO")
+                "Found %s list elements in container %s", "INFO", len(list_elements), container_idx + 1)
 
-        for list_idx, list_elem in enumerate(list_elements):
-            list_items = list_elem.find_all('li')
+        for list_idx, (list_name, list_items) in enumerate(list_elements):
             if len(list_items) > 0:
                 add_debug_log(
-                    f"Found {len(list_items)} list items in list {list_idx+1}", "SUCCESS")
+                    "Found %s list items in list %s", "SUCCESS", len(list_items), list_idx + 1)
             else:
                 add_debug_log(
-                    f"Found {len(list_items)} list items in list {list_idx+1}", "INFO")
+                    "Found %s list items in list %s", "INFO", len(list_items), list_idx + 1)
 
             for item_idx, item in enumerate(list_items):
-                if item.get_text(strip=True):
-                    item_text = item.get_text(strip=True)
-                    key = f"list_{list_elem.name}_{container_idx}_{list_idx}_{item_idx}"
-                    results_dict[key] = item_text
-                    # Append to full_text with bullet point
-                    results_dict["full_text"] += f"• {item_text}\n"
+                item_text = item_texts.get(id(item))
+                if item_text is None:
+                    item_text = item_texts[id(item)] = text_of(item)
+                if item_text:
+                    result.add_list_item(list_name, container_idx, list_idx,
+                                         item_idx, item_text)
                     total_list_items += 1
 
             # Add an extra newline after each list
             if list_items:
-                results_dict["full_text"] += "\n"
+                result.end_list()
 
     if total_headings > 0 or total_paragraphs > 0 or total_list_items > 0:
         add_debug_log(
-            f"Extracted content summary: {total_headings} headings, {total_paragraphs} paragraphs, {total_list_items} list items", "SUCCESS")
+            "Extracted content summary: %s headings, %s paragraphs, %s list items", "SUCCESS", total_headings, total_paragraphs, total_list_items)
+    else:
+        add_debug_log(
+            "Extracted content summary: %s headings, %s paragraphs, %s list items", "WARNING", total_headings, total_paragraphs, total_list_items)
+
+    return result
+
+
+def _log_result_size(size: int) -> None:
+    if size > 0:
+        add_debug_log(
+            "Final result contains %s elements", "SUCCESS", size)
     else:
         add_debug_log(
-            f"Extracted content summary: {total_headings} headings, {total_paragraphs} paragraphs, {total_list_items} list items", "WARNING")
+            "Final result contains %s elements", "ERROR", size)
+
+
+def _log_profile(profile, found: int) -> None:
+    add_debug_log(
+        "Using extraction profile %s: %s containers matched", "SUCCESS" if found else "WARNING", profile.name, found)
+
+
+def soup_extraction(soup, profile=None, links: bool = False) -> ExtractionResult:
+    """
+    Extract article text from a BeautifulSoup object.
+
+    The tree is walked once to find the article containers and collect their
+    headings, paragraphs and lists; text is then read from those elements in
+    the same order as before.
+
+    Args:
+        soup: BeautifulSoup object containing the HTML content
+        profile: Optional routing.ExtractionProfile. Its container selectors
+            replace the generic ones, falling back to them when nothing
+            matches, and its boilerplate is skipped either way
+        links: Also collect the href of every <a> into result.links
+
+    Returns:
+        ExtractionResult: The extracted elements
+    """
+    add_debug_log("Starting HTML parsing with BeautifulSoup", "INFO")
+
+    # Look for the profile's or the common article container elements
+    add_debug_log("Looking for article containers...", "INFO")
+    if profile is not None:
+        with span('select'):
+            selected, skip = _select_soup(soup, profile)
+        _log_profile(profile, len(selected))
+    else:
+        selected, skip = None, frozenset()
+
+    hrefs = [] if links else None
+    with span('collect'):
+        if selected:
+            collected = _collect_selected(selected, _walk_soup, skip)
+            if links:
+                # Only the containers were walked
+                hrefs.extend(a['href'] for a in soup.find_all('a', href=True)
+                             if a['href'])
+        else:
+            collected = _collect_containers(soup, skip, hrefs)
+    with span('text'):
+        result = _extract_results(
+            collected, _soup_text, profile.containers if selected else None)
+    result.links = hrefs
+    return result
+
+
+def getSoupResults(soup, profile=None) -> dict:
+    """
+    soup_extraction as the legacy dict.
+
+    Args:
+        soup: BeautifulSoup object containing the HTML content
+        profile: Optional routing.ExtractionProfile
+
+    Returns:
+        dict: Dictionary containing extracted article content with structured keys
+    """
+    results_dict = soup_extraction(soup, profile).to_dict()
 
     # If no structured content was found, fall back to the original method
     if not results_dict:
         add_debug_log(
             "No structured content found, falling back to extracting text from all elements", "WARNING")
+        from bs4 import NavigableString
         fallback_count = 0
 
         for top_level_child in soup.find_all(recursive=True):
@@ -304,76 +792,299 @@ def getSoupResults(soup: BeautifulSoup) -> dict:
                     # Only log the first few items to avoid excessive logging
                     if fallback_count <= 5:
                         add_debug_log(
-                            f"Extracted text from {top_level_child.name}: {text[:50]}...", "INFO")
+                            "Extracted text from %s: %s...", "INFO", top_level_child.name, text[:50])
 
         if fallback_count > 0:
             add_debug_log(
-                f"Fallback method extracted {fallback_count} text elements", "SUCCESS")
+                "Fallback method extracted %s text elements", "SUCCESS", fallback_count)
         else:
             add_debug_log(
-                f"Fallback method extracted {fallback_count} text elements", "ERROR")
+                "Fallback method extracted %s text elements", "ERROR", fallback_count)
 
-    if len(results_dict) > 0:
-        add_debug_log(
-            f"Final result contains {len(results_dict)} elements", "SUCCESS")
+    _log_result_size(len(results_dict))
+
+    return results_dict
+
+
+def lexbor_extraction(tree, profile=None, links: bool = False) -> ExtractionResult:
+    """
+    Extract article text from a selectolax LexborHTMLParser tree.
+
+    Produces the same elements and full_text layout as soup_extraction
+    without building a BeautifulSoup tree.
+
+    Args:
+        tree: LexborHTMLParser object containing the HTML content
+        profile: Optional routing.ExtractionProfile, as for soup_extraction
+        links: Also collect the href of every <a> into result.links
+
+    Returns:
+        ExtractionResult: The extracted elements
+    """
+    add_debug_log("Starting HTML parsing with lexbor", "INFO")
+
+    add_debug_log("Looking for article containers...", "INFO")
+    if profile is not None:
+        with span('select'):
+            selected, skip = _select_lexbor(tree, profile)
+        _log_profile(profile, len(selected))
     else:
+        selected, skip = None, frozenset()
+
+    hrefs = [] if links else None
+    with span('collect'):
+        if selected:
+            collected = _collect_selected(selected, _walk_lexbor, skip)
+            if links:
+                # Only the containers were walked
+                hrefs.extend(href for href in (node.attributes.get('href')
+                                               for node in tree.css('a[href]'))
+                             if href)
+        else:
+            collected = _collect_lexbor_containers(tree, skip, hrefs)
+    with span('text'):
+        result = _extract_results(
+            collected, _lexbor_text_of(tree),
+            profile.containers if selected else None)
+    result.links = hrefs
+    return result
+
+
+def getLexborResults(tree, profile=None) -> dict:
+    """lexbor_extraction as the legacy dict, see getSoupResults"""
+    results_dict = lexbor_extraction(tree, profile).to_dict()
+    _log_result_size(len(results_dict))
+    return results_dict
+
+
+class SoupBackend:
+    """Parser backend building a BeautifulSoup tree with the given builder"""
+
+    def __init__(self, features: str) -> None:
+        self.name = features
+        self.features = features
+
+    def parse(self, markup):
+        from bs4 import BeautifulSoup
+        return BeautifulSoup(markup, self.features)
+
+    def extract(self, document, profile=None) -> dict:
+        return getSoupResults(document, profile)
+
+    def extract_result(self, document, profile=None,
+                       links: bool = False) -> ExtractionResult:
+        return soup_extraction(document, profile, links)
+
+
+class LexborBackend:
+    """Parser backend using selectolax's lexbor bindings, without bs4"""
+
+    name = 'lexbor'
+
+    def parse(self, markup):
+        from selectolax.lexbor import LexborHTMLParser
+        return LexborHTMLParser(markup)
+
+    def extract(self, document, profile=None) -> dict:
+        return getLexborResults(document, profile)
+
+    def extract_result(self, document, profile=None,
+                       links: bool = False) -> ExtractionResult:
+        return lexbor_extraction(document, profile, links)
+
+
+PARSER_BACKENDS = {
+    'html.parser': SoupBackend('html.parser'),
+    'lxml': SoupBackend('lxml'),
+    'lexbor': LexborBackend(),
+}
+
+# Backend used when a parser is not given one explicitly
+DEFAULT_PARSER_BACKEND = os.environ.get('PARSER_BACKEND', 'html.parser')
+
+
+def get_parser_backend(name: str = None):
+    """
+    Look up a parser backend by name.
+
+    Args:
+        name: One of PARSER_BACKENDS, or None for DEFAULT_PARSER_BACKEND
+
+    Returns:
+        The backend, with parse(markup), extract(document, profile=None)
+        returning the legacy dict and extract_result(document, profile=None,
+        links=False) returning an ExtractionResult
+    """
+    name = name or DEFAULT_PARSER_BACKEND
+    if name not in PARSER_BACKENDS:
+        raise ValueError(
+            f"Unknown parser backend {name!r}, expected one of {', '.join(PARSER_BACKENDS)}")
+    return PARSER_BACKENDS[name]
+
+
+# Stands in for an argument left out, an explicit None disables the feature
+_DEFAULT = object()
+
+# Headers sent with every page request
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+def _extract_in_worker(parser_name: str, workers: ExtractionPool, backend,
+                       content, profile=None, links: list = None) -> dict:
+    """
+    Parse and extract content in a worker process.
+
+    PoolSaturated is not caught, so the caller can turn it into a 503.
+    """
+    add_debug_log(
+        "%s: Sending page to extraction worker (%s)", "INFO", parser_name, backend.name)
+    try:
+        result, logs = workers.extract(content, backend.name, profile,
+                                       links is not None)
+    except (TaskTimeout, WorkerCrashed, RuntimeError) as e:
         add_debug_log(
-            f"Final result contains {len(results_dict)} elements", "ERROR")
+            "%s: Error extracting content in worker: %s", "ERROR", parser_name, e)
+        return {}
+    extend_debug_logs(logs)
+    if links is not None:
+        links.extend(result.links)
+    results_dict = result.to_dict()
+    _log_result_size(len(results_dict))
+    return results_dict
+
 
+def _extract_with_links(backend, document, profile, links: list) -> dict:
+    """backend.extract, also appending the page's hrefs to links"""
+    result = backend.extract_result(document, profile, links=True)
+    links.extend(result.links)
+    results_dict = result.to_dict()
+    _log_result_size(len(results_dict))
     return results_dict
 
 
+def _extractor_key(backend, profile) -> str:
+    """Identifies the extraction a memoized result came from"""
+    key = f"{backend.name}:{EXTRACTOR_VERSION}"
+    if profile is not None:
+        key += f":{profile.cache_key}"
+    return key
+
+
 class DefaultParser:
     """Default text extractor"""
 
-    def __init__(self) -> None:
-        pass
-
-    def parse_article(self, url: str) -> dict:
-        add_debug_log(f"DefaultParser: Starting to parse URL: {url}")
+    def __init__(self, backend: str = None, cache: HttpCache = _DEFAULT,
+                 memo: ExtractionCache = _DEFAULT,
+                 workers: ExtractionPool = _DEFAULT, profile=None) -> None:
+        """
+        Args:
+            cache, memo, workers: Left out, the shared default is used;
+                None fetches uncached, extracts without memoizing or
+                extracts in this process respectively
+        """
+        self.backend = get_parser_backend(backend)
+        self.cache = get_default_cache() if cache is _DEFAULT else cache
+        self.memo = get_extraction_cache() if memo is _DEFAULT else memo
+        self.workers = get_extraction_pool() if workers is _DEFAULT else workers
+        self.profile = profile
+
+    def parse_article(self, url: str, links: list = None) -> dict:
+        """
+        Fetch url and extract its article.
+
+        Args:
+            url: The page to fetch
+            links: When a list, the href of every <a> in the page is
+                appended to it, as written in the page
+
+        Returns:
+            dict: The results, empty when the page could not be fetched
+        """
+        add_debug_log("DefaultParser: Starting to parse URL: %s", "INFO", url)
 
         try:
             add_debug_log("DefaultParser: Sending HTTP request")
-            response = requests.get(url, headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            })
+            with span('fetch', parser='DefaultParser'):
+                if self.cache is not None:
+                    response = self.cache.fetch(url, REQUEST_HEADERS)
+                else:
+                    import requests
+                    response = requests.get(url, headers=REQUEST_HEADERS)
+            if self.cache is not None:
+                add_debug_log(
+                    "DefaultParser: Response cache %s, cache metrics: %s", "INFO", response.cache_status, self.cache.metrics())
             add_debug_log(
-                f"DefaultParser: Received response with status code: {response.status_code}")
+                "DefaultParser: Received response with status code: %s", "INFO", response.status_code)
 
             if response.status_code != 200:
                 add_debug_log(
-                    f"DefaultParser: Error - HTTP status code {response.status_code}")
+                    "DefaultParser: Error - HTTP status code %s", "ERROR", response.status_code)
                 return {}
 
             content_type = response.headers.get('Content-Type', '')
-            add_debug_log(f"DefaultParser: Content-Type: {content_type}")
-
-            # Debug response content preview
-            content_preview = response.text[:500] + \
-                "..." if len(response.text) > 500 else response.text
             add_debug_log(
-                f"DefaultParser: Response content preview: {content_preview}")
+                "DefaultParser: Content-Type: %s", "INFO", content_type)
+
+            # Debug response content preview, only decoded if it is kept
+            if debug_log_enabled("INFO"):
+                content_preview = response.content[:500].decode(errors='replace') + \
+                    ("..." if len(response.content) > 500 else "")
+                add_debug_log(
+                    "DefaultParser: Response content preview: %s", "INFO", content_preview)
 
         except Exception as e:
             add_debug_log(
-                f"DefaultParser: Error making HTTP request: {str(e)}")
+                "DefaultParser: Error making HTTP request: %s", "ERROR", e)
             return {}
 
-        try:
-            add_debug_log("DefaultParser: Creating BeautifulSoup object")
-            soup = BeautifulSoup(response.content, 'html.parser')
-            add_debug_log(
-                f"DefaultParser: BeautifulSoup object created successfully")
-        except Exception as e:
+        return self.parse_content(response.content, links)
+
+    def parse_content(self, content, links: list = None) -> dict:
+        """Parse and extract an already fetched page body, see parse_article"""
+        key = content_key(content, _extractor_key(self.backend, self.profile))
+        # Links are not memoized, a page whose links are wanted is extracted
+        results = None
+        if self.memo is not None and links is None:
+            results = self.memo.get(key)
+        if results is not None:
             add_debug_log(
-                f"DefaultParser: Error creating BeautifulSoup object: {str(e)}")
-            return {}
+                "DefaultParser: Unchanged content, reusing extraction with %s elements", "INFO", len(results))
+            return results
+
+        if self.workers is not None:
+            with span('extract_worker', parser='DefaultParser'):
+                results = _extract_in_worker(
+                    "DefaultParser", self.workers, self.backend, content,
+                    self.profile, links)
+            if not results:
+                return results
+        else:
+            try:
+                add_debug_log(
+                    "DefaultParser: Building parse tree with %s", "INFO", self.backend.name)
+                with span('parse', parser='DefaultParser'):
+                    document = self.backend.parse(content)
+                add_debug_log(
+                    "DefaultParser: Parse tree built successfully", "INFO")
+            except Exception as e:
+                add_debug_log(
+                    "DefaultParser: Error building parse tree: %s", "ERROR", e)
+                return {}
 
+            add_debug_log(
+                "DefaultParser: Extracting content from parse tree")
+            with span('extract', parser='DefaultParser'):
+                if links is None:
+                    results = self.backend.extract(document, self.profile)
+                else:
+                    results = _extract_with_links(
+                        self.backend, document, self.profile, links)
         add_debug_log(
-            "DefaultParser: Calling getSoupResults to extract content")
-        results = getSoupResults(soup)
-        add_debug_log(
-            f"DefaultParser: Extraction complete, found {len(results)} elements")
+            "DefaultParser: Extraction complete, found %s elements", "INFO", len(results))
+        if self.memo is not None:
+            self.memo.put(key, results)
 
         return results
 
@@ -381,61 +1092,95 @@ class DefaultParser:
 class SeleniumParser:
     """Extract text using Selenium"""
 
-    def __init__(self) -> None:
-        pass
+    def __init__(self, backend: str = None, pool: WebDriverPool = None,
+                 memo: ExtractionCache = _DEFAULT,
+                 workers: ExtractionPool = _DEFAULT, profile=None) -> None:
+        """See DefaultParser, the pool always falls back to the shared one"""
+        self.backend = get_parser_backend(backend)
+        self.pool = pool or get_default_pool()
+        self.memo = get_extraction_cache() if memo is _DEFAULT else memo
+        self.workers = get_extraction_pool() if workers is _DEFAULT else workers
+        self.profile = profile
 
-    def parse_article(self, url: str) -> dict:
-        add_debug_log(f"SeleniumParser: Starting to parse URL: {url}", "INFO")
+    def parse_article(self, url: str, links: list = None) -> dict:
+        """Render url in a browser and extract its article, see DefaultParser"""
+        add_debug_log("SeleniumParser: Starting to parse URL: %s", "INFO", url)
 
         try:
             add_debug_log(
-                "SeleniumParser: Initializing Chrome WebDriver", "INFO")
-            driver = webdriver.Chrome()
-            add_debug_log(
-                f"SeleniumParser: WebDriver initialized successfully", "SUCCESS")
-
-            add_debug_log(f"SeleniumParser: Navigating to URL: {url}", "INFO")
-            driver.get(url)
-            add_debug_log(
-                "SeleniumParser: Page loaded successfully", "SUCCESS")
+                "SeleniumParser: Checking out WebDriver from pool", "INFO")
+            with span('browser', parser='SeleniumParser'), \
+                    self.pool.driver() as driver:
+                add_debug_log(
+                    "SeleniumParser: WebDriver checked out successfully", "SUCCESS")
 
-            # Extract data from the rendered page
-            add_debug_log("SeleniumParser: Getting page source", "INFO")
-            page_source = driver.page_source
-            add_debug_log(
-                f"SeleniumParser: Page source retrieved, length: {len(page_source)} characters", "SUCCESS")
+                add_debug_log(
+                    "SeleniumParser: Navigating to URL: %s", "INFO", url)
+                with span('render'):
+                    driver.get(url)
+                    add_debug_log(
+                        "SeleniumParser: Page loaded successfully", "SUCCESS")
+
+                    # Extract data from the rendered page
+                    add_debug_log("SeleniumParser: Getting page source", "INFO")
+                    page_source = driver.page_source
+                add_debug_log(
+                    "SeleniumParser: Page source retrieved, length: %s characters", "SUCCESS", len(page_source))
 
-            # Close the WebDriver
-            add_debug_log("SeleniumParser: Closing WebDriver", "INFO")
-            driver.quit()
             add_debug_log(
-                "SeleniumParser: WebDriver closed successfully", "SUCCESS")
+                "SeleniumParser: WebDriver returned to pool, pool metrics: %s", "INFO", self.pool.metrics())
 
         except Exception as e:
             add_debug_log(
-                f"SeleniumParser: Error with Selenium: {str(e)}", "ERROR")
+                "SeleniumParser: Error with Selenium: %s", "ERROR", e)
             return {}
 
-        try:
+        key = content_key(
+            page_source, _extractor_key(self.backend, self.profile))
+        results = None
+        if self.memo is not None and links is None:
+            results = self.memo.get(key)
+        if results is not None:
             add_debug_log(
-                "SeleniumParser: Creating BeautifulSoup object", "INFO")
-            soup = BeautifulSoup(page_source, 'html.parser')
-            add_debug_log(
-                "SeleniumParser: BeautifulSoup object created successfully", "SUCCESS")
-        except Exception as e:
-            add_debug_log(
-                f"SeleniumParser: Error creating BeautifulSoup object: {str(e)}", "ERROR")
-            return {}
+                "SeleniumParser: Unchanged content, reusing extraction with %s elements", "SUCCESS", len(results))
+            return results
+
+        if self.workers is not None:
+            with span('extract_worker', parser='SeleniumParser'):
+                results = _extract_in_worker(
+                    "SeleniumParser", self.workers, self.backend, page_source,
+                    self.profile, links)
+            if not results:
+                return results
+        else:
+            try:
+                add_debug_log(
+                    "SeleniumParser: Building parse tree with %s", "INFO", self.backend.name)
+                with span('parse', parser='SeleniumParser'):
+                    document = self.backend.parse(page_source)
+                add_debug_log(
+                    "SeleniumParser: Parse tree built successfully", "SUCCESS")
+            except Exception as e:
+                add_debug_log(
+                    "SeleniumParser: Error building parse tree: %s", "ERROR", e)
+                return {}
 
-        add_debug_log(
-            "SeleniumParser: Calling getSoupResults to extract content", "INFO")
-        results = getSoupResults(soup)
+            add_debug_log(
+                "SeleniumParser: Extracting content from parse tree", "INFO")
+            with span('extract', parser='SeleniumParser'):
+                if links is None:
+                    results = self.backend.extract(document, self.profile)
+                else:
+                    results = _extract_with_links(
+                        self.backend, document, self.profile, links)
 
         if len(results) > 0:
             add_debug_log(
-                f"SeleniumParser: Extraction complete, found {len(results)} elements", "SUCCESS")
+                "SeleniumParser: Extraction complete, found %s elements", "SUCCESS", len(results))
         else:
             add_debug_log(
-                f"SeleniumParser: Extraction complete, found {len(results)} elements", "WARNING")
+                "SeleniumParser: Extraction complete, found %s elements", "WARNING", len(results))
+        if self.memo is not None:
+            self.memo.put(key, results)
 
         return results
@@ -0,0 +1,307 @@
+import heapq
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from extraction_pool import PoolSaturated
+from http_cache import normalize_url
+from repo import results_hash
+from routing import registrable_domain
+
+logger = logging.getLogger(__name__)
+
+
+class RecrawlScheduler:
+    """
+    Refetches monitored URLs as often as their content changes.
+
+    Every URL has a recrawl interval. A fetch that finds the extracted
+    content changed halves it, an unchanged or failed one doubles it,
+    within [min_interval, max_interval], so fetches follow each page's
+    change rate. Monitored URLs are persisted in SQLite and ordered in a
+    heap by next due time. A domain is fetched at most once per
+    domain_delay seconds; due URLs of a domain that was just fetched wait
+    their turn. A fetch that finds the extraction pool full is retried
+    after retry_delay seconds, leaving the interval as it was.
+    """
+
+    def __init__(self, path: str, scrape, threads: int = 2,
+                 initial_interval: float = 3600.0, min_interval: float = 900.0,
+                 max_interval: float = 7 * 86400.0,
+                 domain_delay: float = 5.0, retry_delay: float = 5.0) -> None:
+        """
+        Args:
+            path: SQLite file the monitored URLs are kept in
+            scrape: Function fetching a url and returning its results dict,
+                e.g. scrape_and_store. It is called as scrape(url,
+                unfiltered=[]) and may append the results before
+                boilerplate removal to unfiltered
+            threads: Number of fetches running at once
+            initial_interval: Seconds between the first two fetches of a URL
+            min_interval: Shortest interval a changing page backs down to
+            max_interval: Longest interval an unchanged page backs off to
+            domain_delay: Seconds between fetches of the same domain
+            retry_delay: Seconds before a fetch that found the extraction
+                pool full is tried again
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.scrape = scrape
+        self.initial_interval = initial_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.domain_delay = domain_delay
+        self.retry_delay = retry_delay
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS monitored (
+                url_key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                domain TEXT NOT NULL,
+                interval REAL NOT NULL,
+                next_due REAL NOT NULL,
+                last_fetched_at REAL,
+                content_hash TEXT,
+                fetches INTEGER NOT NULL DEFAULT 0,
+                changes INTEGER NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._conn.commit()
+
+        # (next due, url_key); an entry is current while _due holds its time
+        self._heap = []
+        self._due = {}
+        # Domain -> earliest time it may be fetched again
+        self._domain_ready = {}
+        for row in self._conn.execute("SELECT url_key, next_due FROM monitored"):
+            self._schedule(row['url_key'], row['next_due'])
+
+        self.fetches = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.politeness_waits = 0
+        self.retries = 0
+
+        self._stopping = False
+        self._threads = [
+            threading.Thread(target=self._run, name=f"recrawl-{i}", daemon=True)
+            for i in range(threads)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _schedule(self, url_key: str, due: float) -> None:
+        self._due[url_key] = due
+        heapq.heappush(self._heap, (due, url_key))
+
+    def add(self, url: str, interval: float = None) -> dict:
+        """
+        Monitor url, fetching it right away. Adding a monitored URL again
+        returns it unchanged.
+
+        Raises:
+            ValueError: url has no hostname
+        """
+        hostname = urlparse(url).hostname
+        if not hostname:
+            raise ValueError(f"{url!r} has no hostname")
+        url_key = normalize_url(url)
+        with self._lock:
+            inserted = self._conn.execute(
+                """
+                INSERT INTO monitored (url_key, url, domain, interval, next_due)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (url_key) DO NOTHING
+                """,
+                (url_key, url, registrable_domain(hostname),
+                 interval or self.initial_interval, time.time())).rowcount
+            self._conn.commit()
+            if inserted:
+                self._schedule(url_key, time.time())
+                self._wakeup.notify()
+        return self.get(url)
+
+    def remove(self, url: str) -> bool:
+        url_key = normalize_url(url)
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM monitored WHERE url_key = ?", (url_key,)).rowcount
+            self._conn.commit()
+            # Its heap entry is skipped once it is no longer in _due
+            self._due.pop(url_key, None)
+        return bool(removed)
+
+    def get(self, url: str):
+        """The monitored URL as a dict, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM monitored WHERE url_key = ?",
+                (normalize_url(url),)).fetchone()
+        return dict(row) if row is not None else None
+
+    def list(self, limit: int = 100, offset: int = 0) -> list:
+        """Monitored URLs, next due first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM monitored ORDER BY next_due LIMIT ? OFFSET ?",
+                (limit, offset)).fetchall()
+        return [dict(row) for row in rows]
+
+    def _take_due(self, now: float):
+        """
+        Pop the first due URL whose domain may be fetched.
+
+        Returns:
+            tuple: (url_key, url, domain) and None, or None and the seconds
+            until the next URL is due (None when nothing is monitored)
+        """
+        while self._heap:
+            due, url_key = self._heap[0]
+            if self._due.get(url_key) != due:
+                # Removed or rescheduled since
+                heapq.heappop(self._heap)
+                continue
+            if due > now:
+                return None, due - now
+            heapq.heappop(self._heap)
+            row = self._conn.execute(
+                "SELECT url, domain FROM monitored WHERE url_key = ?",
+                (url_key,)).fetchone()
+            ready = self._domain_ready.get(row['domain'], 0.0)
+            if ready > now:
+                self.politeness_waits += 1
+                self._schedule(url_key, ready)
+                continue
+            del self._due[url_key]
+            self._domain_ready[row['domain']] = now + self.domain_delay
+            return (url_key, row['url'], row['domain']), None
+        return None, None
+
+    def record(self, url_key: str, results, fetched_at: float,
+               unfiltered: dict = None) -> None:
+        """
+        Update the interval of a fetched URL and schedule its next fetch.
+
+        Changes are detected on unfiltered, the results before boilerplate
+        removal, when given: the boilerplate model is rebuilt as pages come
+        in, which changes the filtered results of an unchanged page.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT interval, content_hash FROM monitored WHERE url_key = ?",
+                (url_key,)).fetchone()
+            if row is None:
+                # Removed while it was being fetched
+                return
+            interval = row['interval']
+            content_hash = row['content_hash']
+            changed = unchanged = failed = 0
+            if not results:
+                failed = 1
+                interval = min(self.max_interval, interval * 2)
+            else:
+                new_hash = results_hash(unfiltered or results)
+                if content_hash is not None and new_hash == content_hash:
+                    unchanged = 1
+                    interval = min(self.max_interval, interval * 2)
+                else:
+                    # The first fetch counts as a change, nothing is known yet
+                    changed = 1
+                    if content_hash is not None:
+                        interval = max(self.min_interval, interval / 2)
+                    content_hash = new_hash
+            next_due = fetched_at + interval
+
+            self._conn.execute(
+                """
+                UPDATE monitored
+                SET interval = ?, next_due = ?, last_fetched_at = ?,
+                    content_hash = ?, fetches = fetches + 1,
+                    changes = changes + ?, failures = failures + ?
+                WHERE url_key = ?
+                """,
+                (interval, next_due, fetched_at, content_hash, changed, failed,
+                 url_key))
+            self._conn.commit()
+            self.fetches += 1
+            self.changed += changed
+            self.unchanged += unchanged
+            self.failed += failed
+            self._schedule(url_key, next_due)
+            self._wakeup.notify()
+
+    def retry(self, url_key: str, delay: float) -> None:
+        """Fetch a URL again after delay seconds, its interval and counts unchanged"""
+        with self._lock:
+            next_due = time.time() + delay
+            updated = self._conn.execute(
+                "UPDATE monitored SET next_due = ? WHERE url_key = ?",
+                (next_due, url_key)).rowcount
+            self._conn.commit()
+            if not updated:
+                # Removed while it was being fetched
+                return
+            self.retries += 1
+            self._schedule(url_key, next_due)
+            self._wakeup.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if self._stopping:
+                    return
+                taken, wait = self._take_due(time.time())
+                if taken is None:
+                    self._wakeup.wait(wait)
+                    continue
+
+            url_key, url, domain = taken
+            fetched_at = time.time()
+            unfiltered = []
+            try:
+                results = self.scrape(url, unfiltered=unfiltered)
+            except PoolSaturated:
+                logger.info("Recrawl of %s retried in %ss, extraction pool is full",
+                            url, self.retry_delay)
+                self.retry(url_key, self.retry_delay)
+                continue
+            except Exception:
+                logger.exception("Recrawl of %s failed", url)
+                results = None
+            self.record(url_key, results, fetched_at,
+                        unfiltered[0] if unfiltered else None)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            now = time.time()
+            return {
+                'scheduled': len(self._due),
+                'due': sum(1 for due in self._due.values() if due <= now),
+                'fetches': self.fetches,
+                'changed': self.changed,
+                'unchanged': self.unchanged,
+                'failed': self.failed,
+                'politeness_waits': self.politeness_waits,
+                'retries': self.retries,
+            }
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._conn.close()
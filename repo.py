@@ -1,44 +1,360 @@
-import psycopg2
+import hashlib
+import json
+import os
+import threading
+from urllib.parse import urlparse
 
-# Connect to your postgres DB
-conn = psycopg2.connect(
-    host="localhost",
-    database="datascrape",
-    user="script_runner",
-    password="home-stone-groan")
+from metrics import span
+from routing import registrable_domain
 
+CONNINFO = os.environ.get(
+    "DATABASE_URL",
+    "host=localhost dbname=datascrape user=script_runner password=home-stone-groan")
 
-def insert(key, val):
-    try:
-        # Open a cursor to perform database operations
-        cur = conn.cursor()
+_pool = None
+_pool_lock = threading.Lock()
 
-        cur.execute(
-            "INSERT INTO dumps (tag, contents) VALUES (%s, %s)",
-            (key, val))
-        conn.commit()
 
-        # Execute a query
-        # cur.execute("SELECT * FROM dumps")
+def get_pool():
+    """
+    Shared psycopg_pool.ConnectionPool, opened on first use.
 
-        # Retrieve query results
-        cur.execute(
-            """
-            select
-                tag, contents
-            from dumps
-        """
-        )
-        # records = cur.fetchall()
+    psycopg is imported here too, so importing repo costs nothing until
+    the database is used.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from psycopg_pool import ConnectionPool
+            _pool = ConnectionPool(
+                CONNINFO,
+                min_size=1,
+                max_size=int(os.environ.get("DB_POOL_SIZE", "10")),
+                # Seconds to wait for a connection. psycopg_pool waits 30 by
+                # default, which stalls every request while the database is down
+                timeout=float(os.environ.get("DB_POOL_TIMEOUT", "3")))
+        return _pool
 
-        # print(records)
 
-    except BaseException as e:
+def insert_many(elements: dict) -> None:
+    """
+    Write every (tag, contents) pair of elements in one transaction.
+
+    Rows are streamed with COPY, so a whole article costs one round-trip
+    instead of one per element.
+    """
+    try:
+        # The connection commits on exit, or rolls back if COPY failed
+        with span('db_write'), get_pool().connection() as conn:
+            with conn.cursor() as cur:
+                with cur.copy("COPY dumps (tag, contents) FROM STDIN") as copy:
+                    for key, val in elements.items():
+                        copy.write_row((key, val))
+    except Exception as e:
         print(e)
-        conn.rollback()
-    else:
-        conn.commit()
+
+
+def insert(key, val):
+    insert_many({key: val})
+
+
+def results_hash(elements: dict) -> str:
+    """Hash of an extraction, equal for equal keys, texts and order"""
+    serialized = json.dumps(elements, ensure_ascii=False).encode(
+        'utf-8', errors='surrogatepass')
+    return hashlib.blake2b(serialized, digest_size=16).hexdigest()
+
+
+def store_document(url: str, elements: dict, fetched_at=None) -> int:
+    """
+    Store one fetch of url and its extracted elements.
+
+    The content is stored once per distinct results_hash, whichever URL it
+    came from. Fetching the same content at the same URL again only bumps
+    the document's last_fetched_at and fetch_count.
+
+    Args:
+        url: The fetched URL
+        elements: Results dict of a parser, full_text and the element keys
+        fetched_at: When it was fetched, defaults to now
+
+    Returns:
+        int: Id of the documents row
+    """
+    content_hash = results_hash(elements)
+    full_text = elements.get('full_text', '')
+    headings = ' '.join(val for key, val in elements.items()
+                        if key.startswith('heading_'))
+    domain = registrable_domain(urlparse(url).hostname)
+
+    with span('db_write'), get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO document_contents (content_hash, full_text, element_count,
+                                               search_vector)
+                VALUES (%s, %s, %s,
+                        setweight(to_tsvector('english', %s), 'A')
+                        || to_tsvector('english', %s))
+                ON CONFLICT (content_hash) DO NOTHING
+                RETURNING id
+                """,
+                (content_hash, full_text, len(elements) - ('full_text' in elements),
+                 headings, full_text))
+            row = cur.fetchone()
+            if row is not None:
+                content_id = row[0]
+                with cur.copy(
+                        "COPY document_elements (content_id, position, tag, contents) FROM STDIN") as copy:
+                    position = 0
+                    for key, val in elements.items():
+                        if key == 'full_text':
+                            continue
+                        copy.write_row((content_id, position, key, val))
+                        position += 1
+            else:
+                # Stored before, by this or another URL
+                cur.execute(
+                    "SELECT id FROM document_contents WHERE content_hash = %s",
+                    (content_hash,))
+                content_id = cur.fetchone()[0]
+
+            cur.execute(
+                """
+                INSERT INTO documents (url, domain, content_id, fetched_at, last_fetched_at)
+                VALUES (%s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP), COALESCE(%s, CURRENT_TIMESTAMP))
+                ON CONFLICT (url, content_id) DO UPDATE
+                SET last_fetched_at = GREATEST(documents.last_fetched_at, EXCLUDED.last_fetched_at),
+                    fetch_count = documents.fetch_count + 1
+                RETURNING id
+                """,
+                (url, domain, content_id, fetched_at, fetched_at))
+            return cur.fetchone()[0]
+
+
+_DOCUMENT_COLUMNS = """
+    d.id, d.url, d.domain, d.fetched_at, d.last_fetched_at, d.fetch_count,
+    c.content_hash, c.full_text, c.element_count, d.content_id
+"""
+
+
+def _with_elements(cur, document: dict) -> dict:
+    rows = cur.execute(
+        "SELECT tag, contents FROM document_elements WHERE content_id = %s ORDER BY position",
+        (document.pop('content_id'),)).fetchall()
+    document['elements'] = {row['tag']: row['contents'] for row in rows}
+    return document
+
+
+def get_document(url: str, with_elements: bool = True):
+    """
+    The most recently fetched content of url as a dict, or None.
+
+    With with_elements, 'elements' holds the element keys and texts in
+    extraction order.
+    """
+    from psycopg.rows import dict_row
+
+    # Row factory on the cursor, pooled connections are shared
+    with get_pool().connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+        document = cur.execute(
+            f"""
+            SELECT {_DOCUMENT_COLUMNS}
+            FROM documents d JOIN document_contents c ON c.id = d.content_id
+            WHERE d.url = %s
+            ORDER BY d.last_fetched_at DESC
+            LIMIT 1
+            """,
+            (url,)).fetchone()
+        if document is None:
+            return None
+        if not with_elements:
+            document.pop('content_id')
+            return document
+        return _with_elements(cur, document)
+
+
+def list_documents(domain: str, limit: int = 50, offset: int = 0) -> list:
+    """Documents of a registrable domain, most recently fetched first"""
+    from psycopg.rows import dict_row
+
+    with get_pool().connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+        documents = cur.execute(
+            f"""
+            SELECT {_DOCUMENT_COLUMNS}
+            FROM documents d JOIN document_contents c ON c.id = d.content_id
+            WHERE d.domain = %s
+            ORDER BY d.last_fetched_at DESC
+            LIMIT %s OFFSET %s
+            """,
+            (domain, limit, offset)).fetchall()
+    for document in documents:
+        document.pop('content_id')
+    return documents
+
+
+# d is the latest fetch of its URL, and of the domain searched if any
+_LATEST_DOCUMENT = """
+    (%(domain)s::text IS NULL OR d.domain = %(domain)s)
+    AND NOT EXISTS (
+        SELECT 1 FROM documents newer
+        WHERE newer.url = d.url
+          AND newer.last_fetched_at > d.last_fetched_at)
+"""
+
+
+def search_documents(query: str, domain: str = None, limit: int = 20,
+                     offset: int = 0, candidates: int = 1000) -> dict:
+    """
+    Documents whose current content matches query, best match first.
+
+    Only the most recently fetched content of each URL is searched. query
+    uses web search syntax: words are ANDed, "quoted phrases", or, and -word
+    to exclude. Headings weigh more than body text in the rank.
+
+    Ranking reads the whole search vector of every match it ranks, so
+    matches are ranked in tiers of candidates documents, newest content
+    first: a query with at most candidates matches is ranked as a whole,
+    one with more lists the best of the newest candidates matches, then the
+    best of the next ones, and so on. A page only reads the matches up to
+    the end of its last tier, so the first pages of a query matching most of
+    the table cost about the same as those of a rare one.
+
+    Args:
+        query: The search terms
+        domain: Only search documents of this registrable domain
+        limit: Results per page
+        offset: Results skipped, for the following pages
+        candidates: Matches ranked together in one tier
+
+    Returns:
+        dict: total, the number of matching documents, estimated by the
+        query planner when total_is_estimate is set because there are more
+        matches than the page's tiers; has_more, whether a next page has
+        results; and results, dicts with the document's id, url, domain,
+        last_fetched_at, rank and a headline of the matching text, matches
+        in <b>
+    """
+    from psycopg.rows import dict_row
+
+    first_tier = offset // candidates
+    last_tier = (offset + limit - 1) // candidates
+    # Every content has at least one document, so this many contents fill
+    # the page's tiers, and one more tells whether there are more matches
+    scanned = (last_tier + 1) * candidates + 1
+    params = {'query': query, 'domain': domain, 'limit': limit,
+              'candidates': candidates, 'first_tier': first_tier,
+              'last_tier': last_tier, 'scanned': scanned,
+              'tier_offset': offset - first_tier * candidates}
+    with span('db_search'), get_pool().connection() as conn, \
+            conn.cursor(row_factory=dict_row) as cur:
+        rows = cur.execute(
+            f"""
+            WITH q AS (SELECT websearch_to_tsquery('english', %(query)s) AS query),
+            -- Newest contents first, stopping after the page's tiers. Ids
+            -- come from the GIN index, or from the primary key backwards
+            -- when most contents match, without reading every vector. The
+            -- query is repeated rather than taken from q so the planner
+            -- sees how many contents it matches
+            matches AS (
+                SELECT c.id FROM document_contents c
+                WHERE c.search_vector @@ websearch_to_tsquery('english', %(query)s)
+                  AND EXISTS (
+                      SELECT 1 FROM documents d
+                      WHERE d.content_id = c.id AND {_LATEST_DOCUMENT})
+                ORDER BY c.id DESC
+                LIMIT %(scanned)s
+            ),
+            tiers AS (
+                SELECT d.id, d.content_id,
+                       (row_number() OVER (ORDER BY d.content_id DESC, d.id) - 1)
+                           / %(candidates)s AS tier
+                FROM matches m
+                JOIN documents d ON d.content_id = m.id
+                WHERE {_LATEST_DOCUMENT}
+            ),
+            page AS (
+                SELECT t.id, t.content_id, t.tier,
+                       ts_rank_cd(c.search_vector, q.query) AS rank
+                FROM q, tiers t
+                JOIN document_contents c ON c.id = t.content_id
+                WHERE t.tier BETWEEN %(first_tier)s AND %(last_tier)s
+                ORDER BY t.tier, rank DESC, t.id
+                LIMIT %(limit)s OFFSET %(tier_offset)s
+            )
+            -- One row with a NULL id when the page is empty, so the counts
+            -- are still returned. Headlines only for the page, they re-parse
+            -- the whole text
+            SELECT (SELECT COUNT(*) FROM matches) AS contents,
+                   (SELECT COUNT(*) FROM tiers) AS documents,
+                   page.id, d.url, d.domain, d.last_fetched_at, page.rank,
+                   ts_headline('english', c.full_text, q.query,
+                               'MaxFragments=2, MaxWords=25, MinWords=10') AS headline
+            FROM q
+            LEFT JOIN page ON true
+            LEFT JOIN documents d ON d.id = page.id
+            LEFT JOIN document_contents c ON c.id = page.content_id
+            ORDER BY page.tier, page.rank DESC, page.id
+            """, params,
+            # A prepared statement would switch to a generic plan, blind to
+            # how many contents the query matches
+            prepare=False).fetchall()
+
+        total = rows[0]['documents']
+        total_is_estimate = rows[0]['contents'] == scanned
+        if total_is_estimate:
+            # Counting every match reads every search vector, the planner's
+            # estimate costs nothing. It leaves out the latest fetch filter,
+            # whose selectivity the planner guesses badly
+            plan = cur.execute(
+                """
+                EXPLAIN (FORMAT JSON)
+                SELECT 1 FROM document_contents c
+                JOIN documents d ON d.content_id = c.id
+                WHERE c.search_vector @@ websearch_to_tsquery('english', %(query)s)
+                  AND (%(domain)s::text IS NULL OR d.domain = %(domain)s)
+                """, params).fetchone()
+            total = max(int(next(iter(plan.values()))[0]['Plan']['Plan Rows']),
+                        total)
+
+    results = []
+    for row in rows:
+        del row['contents'], row['documents']
+        if row['id'] is not None:
+            results.append(row)
+    return {'total': total, 'total_is_estimate': total_is_estimate,
+            'has_more': total_is_estimate or offset + limit < total,
+            'results': results}
+
+
+def store_summary(url: str, title: str, summary: str, document_id: int = None) -> None:
+    """
+    Write the summary of url into articles, replacing an earlier one.
+
+    Args:
+        url: The summarized URL
+        title: Title of the article, e.g. its first heading
+        summary: The summary text
+        document_id: The documents row it was made from, when stored
+    """
+    with span('db_write'), get_pool().connection() as conn:
+        conn.execute(
+            """
+            INSERT INTO articles (url, article_name, title, summary, content_id)
+            VALUES (%s, %s, %s, %s,
+                    (SELECT content_id FROM documents WHERE id = %s))
+            ON CONFLICT (url) DO UPDATE
+            SET title = EXCLUDED.title,
+                summary = EXCLUDED.summary,
+                content_id = EXCLUDED.content_id,
+                updated_at = CURRENT_TIMESTAMP
+            """,
+            (url, url[:255], title[:255], summary, document_id))
 
 
 def close():
-    conn.close()
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
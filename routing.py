@@ -0,0 +1,229 @@
+import hashlib
+import ipaddress
+import json
+import os
+import threading
+from urllib.parse import urlparse
+
+from adaptive import AdaptiveParser
+from parsers import DefaultParser
+from parsers import SeleniumParser
+
+# Try a static fetch before rendering render_js sites in a browser
+ADAPTIVE_RENDER = os.environ.get('ADAPTIVE_RENDER', '1') == '1'
+
+# Public suffixes of more than one label. Any other host is taken to end in a
+# single-label suffix, so example.com and example.io are registrable as is.
+MULTI_LABEL_SUFFIXES = [
+    'co.uk', 'org.uk', 'me.uk', 'ltd.uk', 'plc.uk', 'net.uk', 'ac.uk',
+    'gov.uk', 'nhs.uk', 'police.uk',
+    'com.au', 'net.au', 'org.au', 'edu.au', 'gov.au', 'asn.au', 'id.au',
+    'co.nz', 'net.nz', 'org.nz', 'govt.nz', 'ac.nz',
+    'co.jp', 'ne.jp', 'or.jp', 'ac.jp', 'go.jp',
+    'co.kr', 'or.kr', 'ac.kr',
+    'co.in', 'net.in', 'org.in', 'gov.in', 'ac.in',
+    'co.za', 'org.za', 'gov.za',
+    'co.il', 'org.il', 'ac.il',
+    'com.br', 'net.br', 'org.br', 'gov.br',
+    'com.ar', 'com.mx', 'com.co', 'com.pe', 'com.ve',
+    'com.cn', 'net.cn', 'org.cn', 'gov.cn',
+    'com.hk', 'com.tw', 'com.sg', 'com.my', 'com.ph', 'com.pk', 'com.tr',
+    'com.ua', 'com.eg', 'com.sa', 'com.ng', 'co.ke',
+]
+
+# Sites with their own extraction profile, by registrable domain or host.
+# containers: CSS selectors of the article body, in the order their contents
+#     are emitted; the generic containers are used if none match
+# skip: CSS selectors of boilerplate left out of the extraction
+# render_js: The page may need a browser to render its content, see
+#     adaptive.AdaptiveParser
+# backend: Parser backend, defaults to PARSER_BACKEND
+DOMAIN_PROFILES = {
+    'nytimes.com': {
+        'containers': ['section[name="articleBody"]'],
+        'skip': ['[data-testid="StandardAd"]', '[data-testid="inline-message"]',
+                 'aside'],
+        'render_js': True,
+    },
+}
+
+
+class _SuffixTrie:
+    """Values keyed by domain, looked up by the longest matching label suffix"""
+
+    __slots__ = ('_root',)
+
+    def __init__(self) -> None:
+        self._root = {}
+
+    def insert(self, domain: str, value) -> None:
+        node = self._root
+        for label in reversed(domain.split('.')):
+            node = node.setdefault(label, {})
+        # '' is never a label, so it marks the end of a domain
+        node[''] = value
+
+    def longest_match(self, labels: list):
+        """
+        Return (number of labels matched, value) for the longest suffix of
+        labels that was inserted, or (0, None)
+        """
+        node = self._root
+        match = (0, None)
+        for depth, label in enumerate(reversed(labels), 1):
+            node = node.get(label)
+            if node is None:
+                break
+            if '' in node:
+                match = (depth, node[''])
+        return match
+
+
+_PUBLIC_SUFFIXES = _SuffixTrie()
+for _suffix in MULTI_LABEL_SUFFIXES:
+    _PUBLIC_SUFFIXES.insert(_suffix, True)
+
+
+def _host_labels(host: str):
+    """Lowercased labels of host, or None for IP addresses and empty hosts"""
+    host = (host or '').strip().rstrip('.').lower()
+    if not host:
+        return None
+    try:
+        ipaddress.ip_address(host)
+        return None
+    except ValueError:
+        return host.split('.')
+
+
+def registrable_domain(host: str) -> str:
+    """
+    The domain of host that its owner registered, e.g. example.co.uk for
+    www.news.example.co.uk. IP addresses are returned unchanged.
+    """
+    labels = _host_labels(host)
+    if labels is None:
+        return (host or '').lower()
+    depth, _ = _PUBLIC_SUFFIXES.longest_match(labels)
+    depth = max(depth, 1) + 1
+    return '.'.join(labels[-depth:])
+
+
+class ExtractionProfile:
+    """
+    How to extract one site's pages.
+
+    Selectors are compiled once here; lexbor takes the selector strings.
+    """
+
+    __slots__ = ('name', 'containers', 'skip', 'render_js',
+                 'container_selectors', 'skip_selectors', 'cache_key')
+
+    def __init__(self, name: str, containers=(), skip=(),
+                 render_js: bool = False) -> None:
+        self.name = name
+        self.containers = tuple(containers)
+        self.skip = tuple(skip)
+        self.render_js = render_js
+        import soupsieve
+        self.container_selectors = [soupsieve.compile(selector)
+                                    for selector in self.containers]
+        self.skip_selectors = [soupsieve.compile(selector)
+                               for selector in self.skip]
+        # Changes when the selectors do, so memoized extractions go stale
+        digest = hashlib.blake2b(
+            repr((self.containers, self.skip)).encode(), digest_size=8)
+        self.cache_key = f"{name}/{digest.hexdigest()}"
+
+    def __reduce__(self):
+        # Compiled selectors are rebuilt rather than pickled for workers
+        return (ExtractionProfile,
+                (self.name, self.containers, self.skip, self.render_js))
+
+    def __repr__(self) -> str:
+        return f"ExtractionProfile({self.name!r})"
+
+
+class Route:
+    """The parser and profile a URL is scraped with"""
+
+    __slots__ = ('parser', 'profile')
+
+    def __init__(self, parser, profile: ExtractionProfile = None) -> None:
+        self.parser = parser
+        self.profile = profile
+
+    @property
+    def render_js(self) -> bool:
+        return self.profile is not None and self.profile.render_js
+
+
+def _parser_for(profile: ExtractionProfile, backend: str = None):
+    static = DefaultParser(backend=backend, profile=profile)
+    if not profile.render_js:
+        return static
+    browser = SeleniumParser(backend=backend, profile=profile)
+    if ADAPTIVE_RENDER:
+        return AdaptiveParser(static, browser)
+    return browser
+
+
+class DomainRouter:
+    """
+    Maps hosts to a Route, built once from a table of domain profiles.
+
+    A host is routed by its longest matching domain in the table, so an entry
+    for example.com covers www.example.com and news.example.com, and a more
+    specific entry for one of them wins. Hosts without an entry get the
+    default route, a DefaultParser with the generic extraction.
+    """
+
+    def __init__(self, profiles: dict, default_parser=None) -> None:
+        self._routes = _SuffixTrie()
+        self._by_domain = {}
+        for domain, spec in profiles.items():
+            profile = ExtractionProfile(
+                domain, spec.get('containers', ()), spec.get('skip', ()),
+                spec.get('render_js', False))
+            parser = _parser_for(profile, spec.get('backend'))
+            route = self._by_domain[domain.lower()] = Route(parser, profile)
+            self._routes.insert(domain.lower(), route)
+        self.default = Route(default_parser or DefaultParser())
+
+    def routes(self):
+        """(domain, Route) of every entry in the table"""
+        return self._by_domain.items()
+
+    def route(self, url: str) -> Route:
+        labels = _host_labels(urlparse(url).hostname)
+        if labels is None:
+            return self.default
+        _, route = self._routes.longest_match(labels)
+        return route or self.default
+
+
+def load_profiles(path: str = None) -> dict:
+    """
+    DOMAIN_PROFILES, updated with the JSON object in path if given.
+
+    The file maps domains to the same keys as DOMAIN_PROFILES.
+    """
+    profiles = dict(DOMAIN_PROFILES)
+    if path:
+        with open(path) as f:
+            profiles.update(json.load(f))
+    return profiles
+
+
+_default_router = None
+_default_router_lock = threading.Lock()
+
+
+def get_router() -> DomainRouter:
+    """Shared router, with extra profiles from DOMAIN_PROFILES_PATH if set"""
+    global _default_router
+    with _default_router_lock:
+        if _default_router is None:
+            _default_router = DomainRouter(
+                load_profiles(os.environ.get('DOMAIN_PROFILES_PATH')))
+        return _default_router
@@ -0,0 +1,236 @@
+import asyncio
+import os
+import random
+from urllib.parse import urlparse
+
+from boilerplate import get_default_model as get_boilerplate_model
+from http_cache import get_default_cache
+from metrics import metric_labels
+from metrics import span
+from parsers import REQUEST_HEADERS
+from parsers import add_debug_log
+from routing import get_router
+from routing import registrable_domain
+
+# Parse pages while they download instead of fetching the whole body first
+STREAMING_FETCH = os.environ.get('STREAMING_FETCH') == '1'
+
+_streaming_parser = None
+if STREAMING_FETCH:
+    from streaming import StreamingParser
+    _streaming_parser = StreamingParser()
+
+# Statuses worth retrying, anything else non-200 is treated as a failure
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+def get_domain_name(url: str) -> str:
+    """Registrable domain of url, e.g. nytimes.com for www.nytimes.com"""
+    return registrable_domain(urlparse(url).hostname)
+
+
+def strip_boilerplate(url: str, results: dict) -> dict:
+    """Drop the blocks repeated across url's domain, see boilerplate.py"""
+    model = get_boilerplate_model()
+    if model is None or not results:
+        return results
+    with span('boilerplate'):
+        stripped = model.strip(get_domain_name(url), url, results)
+    if stripped is not results:
+        add_debug_log(
+            "Dropped %s boilerplate elements", "INFO", len(results) - len(stripped))
+    return stripped
+
+
+def scrape_webpage(url: str, links: list = None, unfiltered: list = None) -> dict:
+    """
+    Scrape url with the parser its route picks.
+
+    Args:
+        url: The page to scrape
+        links: When a list, the page's hrefs are appended to it, as for
+            DefaultParser.parse_article
+        unfiltered: When a list, the results before boilerplate removal
+            are appended to it
+    """
+    route = get_router().route(url)
+    with metric_labels(domain=get_domain_name(url)):
+        # The streaming extractor only knows the generic containers, and
+        # does not collect links
+        if _streaming_parser is not None and route.profile is None \
+                and links is None:
+            with span('stream', parser='StreamingParser'):
+                results = _streaming_parser.parse_article(url)
+        else:
+            results = route.parser.parse_article(url, links)
+        if unfiltered is not None:
+            unfiltered.append(results)
+        return strip_boilerplate(url, results)
+
+
+async def _fetch(session, url: str, timeout: float, retries: int,
+                 backoff: float):
+    """
+    GET url through the response cache, retrying connection errors, timeouts
+    and RETRY_STATUSES.
+
+    Returns:
+        bytes: The response body, or None if the page could not be fetched
+    """
+    import aiohttp
+
+    cache = get_default_cache()
+    # The cache is SQLite, keep its I/O off the event loop
+    entry = (await asyncio.to_thread(cache.lookup, url)
+             if cache is not None else None)
+    if entry is not None and cache.is_fresh(entry):
+        cache.record_hit(entry)
+        return entry.body
+    headers = cache.conditional_headers(entry) if entry is not None else None
+
+    for attempt in range(retries + 1):
+        try:
+            async with session.get(
+                    url, headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                if response.status == 304 and entry is not None:
+                    await asyncio.to_thread(cache.record_not_modified, entry)
+                    return entry.body
+                if response.status == 200:
+                    body = await response.read()
+                    if cache is not None:
+                        await asyncio.to_thread(
+                            cache.store, url, response.headers, body)
+                    return body
+                add_debug_log(
+                    "scrape_many: HTTP status code %s for %s", "WARNING", response.status, url)
+                if response.status not in RETRY_STATUSES:
+                    return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            add_debug_log(
+                "scrape_many: Error fetching %s: %r", "WARNING", url, e)
+
+        if attempt < retries:
+            # Exponential backoff with jitter so retries to one host spread out
+            delay = backoff * (2 ** attempt)
+            await asyncio.sleep(delay + random.uniform(0, delay))
+
+    add_debug_log(
+        "scrape_many: Giving up on %s after %s attempts", "ERROR", url, retries + 1)
+    return None
+
+
+class _DomainLimit:
+    """Per-domain semaphore of scrape_many and the number of its users"""
+
+    __slots__ = ('semaphore', 'users')
+
+    def __init__(self, per_domain: int) -> None:
+        self.semaphore = asyncio.Semaphore(per_domain)
+        self.users = 0
+
+
+async def _scrape_one(session, url: str, global_limit, domain_limits,
+                      per_domain: int, timeout: float, retries: int,
+                      backoff: float):
+    domain = get_domain_name(url)
+    limit = domain_limits.get(domain)
+    if limit is None:
+        limit = domain_limits[domain] = _DomainLimit(per_domain)
+    route = get_router().route(url)
+
+    with metric_labels(domain=domain):
+        limit.users += 1
+        try:
+            # Take the domain slot first so a busy domain does not hold global slots
+            async with limit.semaphore:
+                if route.render_js:
+                    # Needs a browser, which is blocking, keep it off the event loop
+                    async with global_limit:
+                        results = await asyncio.to_thread(
+                            route.parser.parse_article, url)
+                    return url, strip_boilerplate(url, results)
+
+                async with global_limit:
+                    with span('fetch', parser='scrape_many'):
+                        content = await _fetch(session, url, timeout, retries,
+                                               backoff)
+        finally:
+            # Forget domains with nothing in flight, so a long crawl over
+            # many sites does not keep a semaphore per site
+            limit.users -= 1
+            if not limit.users:
+                del domain_limits[domain]
+
+        if content is None:
+            return url, {}
+        results = await asyncio.to_thread(route.parser.parse_content, content)
+        return url, strip_boilerplate(url, results)
+
+
+async def scrape_many(urls, concurrency: int = 32, per_domain: int = 4,
+                      timeout: float = 30.0, retries: int = 2,
+                      backoff: float = 0.5):
+    """
+    Scrape many URLs concurrently, yielding results as they complete.
+
+    Pages are fetched over one pooled keep-alive session. Parsing runs in
+    worker threads so it does not block fetches in flight.
+
+    Args:
+        urls: Iterable of URLs, consumed lazily
+        concurrency: Maximum number of requests in flight overall
+        per_domain: Maximum number of requests in flight per get_domain_name
+        timeout: Total timeout in seconds for each request attempt
+        retries: Number of retries after the first attempt
+        backoff: Base delay in seconds, doubled after each retry
+
+    Yields:
+        tuple: (url, results dict), the dict is empty if the page failed
+    """
+    # aiohttp is the slowest import of the app, only batch scraping needs it
+    import aiohttp
+
+    global_limit = asyncio.Semaphore(concurrency)
+    domain_limits = {}
+    # Bound the number of scheduled tasks so huge URL lists stay lazy
+    max_pending = concurrency * 4
+
+    connector = aiohttp.TCPConnector(limit=concurrency,
+                                     limit_per_host=per_domain)
+    async with aiohttp.ClientSession(connector=connector,
+                                     headers=REQUEST_HEADERS) as session:
+        url_iter = iter(urls)
+        pending = {}
+        exhausted = False
+
+        try:
+            while True:
+                while not exhausted and len(pending) < max_pending:
+                    url = next(url_iter, None)
+                    if url is None:
+                        exhausted = True
+                        break
+                    task = asyncio.create_task(_scrape_one(
+                        session, url, global_limit, domain_limits, per_domain,
+                        timeout, retries, backoff))
+                    pending[task] = url
+
+                if not pending:
+                    break
+
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    url = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        add_debug_log(
+                            "scrape_many: Error scraping %s: %r", "ERROR", url, e)
+                        result = url, {}
+                    yield result
+        finally:
+            # The caller stopped iterating early, drop the work in flight
+            for task in pending:
+                task.cancel()
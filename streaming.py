@@ -0,0 +1,268 @@
+import os
+
+import requests
+from lxml import etree
+
+from parsers import HEADING_TAGS
+from parsers import LIST_TAGS
+from parsers import REQUEST_HEADERS
+from parsers import _CONTAINER_LOOKUP
+from parsers import _match_container
+from parsers import add_debug_log
+
+# Bytes read from the socket per chunk
+CHUNK_SIZE = 64 * 1024
+
+# Text of these elements is not article text
+SKIPPED_TEXT_TAGS = frozenset(['script', 'style', 'noscript', 'template'])
+
+
+class StreamElement:
+    """A heading, paragraph or list item, emitted when its end tag is seen"""
+
+    __slots__ = ('key', 'text', 'kind')
+
+    def __init__(self, key: str, text: str, kind: str) -> None:
+        self.key = key
+        self.text = text
+        # 'heading', 'paragraph', 'list_item', or 'list_end' (no key or text)
+        self.kind = kind
+
+    @property
+    def full_text(self) -> str:
+        """How this element is written into full_text"""
+        if self.kind == 'list_item':
+            return f"• {self.text}\n"
+        if self.kind == 'list_end':
+            return "\n"
+        return f"{self.text}\n\n"
+
+
+def _element_text(element) -> str:
+    """Same as get_text(strip=True), skipping script/style and comments"""
+    parts = []
+    if element.text:
+        parts.append(element.text.strip())
+    for child in element.iterdescendants():
+        tag = child.tag
+        if isinstance(tag, str) and tag not in SKIPPED_TEXT_TAGS and child.text:
+            parts.append(child.text.strip())
+        if child.tail:
+            parts.append(child.tail.strip())
+    return ''.join(parts)
+
+
+class _StreamContainer:
+    """Counters for one container, so keys match getSoupResults"""
+
+    __slots__ = ('index', 'headings', 'paragraphs', 'lists', 'open_lists')
+
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.headings = 0
+        self.paragraphs = 0
+        self.lists = 0
+        # [tag name, list index, next item index] per open list
+        self.open_lists = []
+
+
+class StreamExtractor:
+    """
+    Incremental version of getSoupResults over an lxml pull parser.
+
+    Feed it chunks of the page; each call to feed() returns the elements that
+    closed within that chunk. Subtrees are discarded once read so memory
+    stays flat however large the page is.
+
+    Unlike getSoupResults, containers are numbered and full_text is written
+    in document order, since the rest of the page is not known yet. Elements
+    outside any container are held back and only emitted by close() if the
+    page had no container at all.
+    """
+
+    def __init__(self, encoding: str = None) -> None:
+        self._parser = etree.HTMLPullParser(events=('start', 'end'),
+                                            encoding=encoding)
+        self._containers = 0
+        self._container = None
+        self._container_element = None
+        # Page-level content, used if no container turns up
+        self._body = _StreamContainer(0)
+        self._held_back = []
+        # Open headings, paragraphs and list items whose text is still needed
+        self._open_text = 0
+
+    def _scope(self):
+        return self._container if self._container is not None else self._body
+
+    def _start(self, element) -> None:
+        tag = element.tag
+        if not isinstance(tag, str):
+            return
+        if self._container is None:
+            candidates = _CONTAINER_LOOKUP.get(tag)
+            if candidates and _match_container(
+                    candidates, (element.get('class') or '').split()) is not None:
+                self._container = _StreamContainer(self._containers)
+                self._container_element = element
+                self._containers += 1
+                # A container exists, page-level content is no longer needed
+                self._held_back = None
+
+        if tag in HEADING_TAGS or tag == 'p' or tag == 'li':
+            self._open_text += 1
+        elif tag in LIST_TAGS:
+            scope = self._scope()
+            scope.open_lists.append([tag, scope.lists, 0])
+            scope.lists += 1
+
+    def _end(self, element, out: list) -> None:
+        tag = element.tag
+        if not isinstance(tag, str):
+            return
+        scope = self._scope()
+        emitted = []
+
+        if tag in HEADING_TAGS:
+            self._open_text -= 1
+            text = _element_text(element)
+            if text:
+                emitted.append(StreamElement(
+                    f"heading_{tag}_{scope.index}_{scope.headings}", text, 'heading'))
+            scope.headings += 1
+        elif tag == 'p':
+            self._open_text -= 1
+            text = _element_text(element)
+            if text:
+                emitted.append(StreamElement(
+                    f"paragraph_{scope.index}_{scope.paragraphs}", text, 'paragraph'))
+            scope.paragraphs += 1
+        elif tag == 'li':
+            self._open_text -= 1
+            text = _element_text(element)
+            for open_list in scope.open_lists:
+                if text:
+                    emitted.append(StreamElement(
+                        f"list_{open_list[0]}_{scope.index}_{open_list[1]}_{open_list[2]}",
+                        text, 'list_item'))
+                open_list[2] += 1
+        elif tag in LIST_TAGS and scope.open_lists:
+            open_list = scope.open_lists.pop()
+            if open_list[2]:
+                # Blank line after a list that had items
+                emitted.append(StreamElement(None, '', 'list_end'))
+
+        if self._container is not None and element is self._container_element:
+            self._container = None
+            self._container_element = None
+
+        if scope is not self._body:
+            out.extend(emitted)
+        elif self._held_back is not None:
+            self._held_back.extend(emitted)
+
+        # Drop the subtree unless an open element still needs its text
+        if self._open_text == 0:
+            element.clear()
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+
+    def _drain(self) -> list:
+        out = []
+        for event, element in self._parser.read_events():
+            if event == 'start':
+                self._start(element)
+            else:
+                self._end(element, out)
+        return out
+
+    def feed(self, chunk: bytes) -> list:
+        self._parser.feed(chunk)
+        return self._drain()
+
+    def close(self) -> list:
+        self._parser.close()
+        out = self._drain()
+        if self._held_back:
+            out.extend(self._held_back)
+        self._held_back = None
+        return out
+
+
+class StreamingParser:
+    """
+    Text extractor that parses the page while it downloads.
+
+    The body is never held in memory as a whole. Reading stops after
+    max_bytes, or once stop_after_chars of text have been extracted.
+    """
+
+    def __init__(self, max_bytes: int = None, stop_after_chars: int = None) -> None:
+        self.max_bytes = max_bytes or int(
+            os.environ.get('STREAM_MAX_BYTES', str(16 * 1024 * 1024)))
+        self.stop_after_chars = stop_after_chars or int(
+            os.environ.get('STREAM_STOP_AFTER_CHARS', '0')) or None
+
+    def iter_article(self, url: str):
+        """
+        Yield StreamElements of url as they are parsed.
+
+        Returns early, without error, when a limit is reached.
+        """
+        add_debug_log("StreamingParser: Starting to parse URL: %s", "INFO", url)
+
+        with requests.get(url, headers=REQUEST_HEADERS, stream=True,
+                          timeout=30) as response:
+            add_debug_log(
+                "StreamingParser: Received response with status code: %s", "INFO", response.status_code)
+            if response.status_code != 200:
+                add_debug_log(
+                    "StreamingParser: Error - HTTP status code %s", "ERROR", response.status_code)
+                return
+
+            # Only trust an explicit charset, otherwise lxml sniffs the page
+            content_type = response.headers.get('Content-Type', '')
+            encoding = response.encoding if 'charset=' in content_type.lower() else None
+            extractor = StreamExtractor(encoding=encoding)
+
+            received = 0
+            text_chars = 0
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                received += len(chunk)
+                for element in extractor.feed(chunk):
+                    text_chars += len(element.text)
+                    yield element
+                if received >= self.max_bytes:
+                    add_debug_log(
+                        "StreamingParser: Stopped after %s bytes, max_bytes reached", "WARNING", received)
+                    break
+                if self.stop_after_chars and text_chars >= self.stop_after_chars:
+                    add_debug_log(
+                        "StreamingParser: Stopped after %s bytes, enough text collected", "SUCCESS", received)
+                    break
+
+        for element in extractor.close():
+            yield element
+        add_debug_log(
+            "StreamingParser: Read %s bytes", "INFO", received)
+
+    def parse_article(self, url: str) -> dict:
+        results_dict = {}
+        full_text = []
+        try:
+            for element in self.iter_article(url):
+                if element.key is not None:
+                    results_dict[element.key] = element.text
+                full_text.append(element.full_text)
+        except Exception as e:
+            add_debug_log(
+                "StreamingParser: Error streaming page: %s", "ERROR", e)
+            return {}
+
+        results = {"full_text": ''.join(full_text)}
+        results.update(results_dict)
+        add_debug_log(
+            "StreamingParser: Extraction complete, found %s elements", "INFO", len(results))
+        return results
@@ -0,0 +1,434 @@
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from extraction_cache import ExtractionCache, content_key
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+PROMPT = ("Summarize the following article in two or three sentences. "
+          "Answer with the summary only.\n\n")
+
+# Roughly four characters per token for English text
+CHARS_PER_TOKEN = 4
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def chunk_text(text: str, max_chars: int) -> list:
+    """
+    Split text into chunks of at most max_chars characters.
+
+    Chunks end at paragraph breaks where possible, then at sentence ends,
+    and long sentences are cut hard.
+    """
+    if len(text) <= max_chars:
+        return [text]
+
+    pieces = []
+    for paragraph in text.split("\n\n"):
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            for start in range(0, len(sentence), max_chars):
+                pieces.append(sentence[start:start + max_chars])
+
+    chunks = []
+    current = ''
+    for piece in pieces:
+        if not piece.strip():
+            continue
+        if current and len(current) + 2 + len(piece) > max_chars:
+            chunks.append(current)
+            current = ''
+        current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class TokenBucket:
+    """
+    Allows rate tokens per second on average, and bursts of up to capacity.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens, sleeping until they are available.
+
+        A request for more than capacity waits for a full bucket.
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        tokens = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    self.waited += waited
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class OpenAIBackend:
+    """Chat completions through the openai SDK"""
+
+    def __init__(self, model: str = 'gpt-3.5-turbo', api_key: str = None,
+                 max_tokens: int = 150, temperature: float = 0.3,
+                 retries: int = 3) -> None:
+        # Imported here so the stub backend works without the SDK
+        import openai
+
+        self._openai = openai
+        self.name = f"openai:{model}"
+        self.model = model
+        self.api_key = api_key or os.environ['OPENAI_KEY']
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.retries = retries
+
+    def summarize(self, text: str) -> str:
+        for attempt in range(self.retries + 1):
+            try:
+                response = self._openai.ChatCompletion.create(
+                    model=self.model,
+                    messages=[{'role': 'user', 'content': PROMPT + text}],
+                    max_tokens=self.max_tokens,
+                    temperature=self.temperature,
+                    api_key=self.api_key)
+                return response.choices[0].message.content.strip()
+            except (self._openai.error.RateLimitError,
+                    self._openai.error.ServiceUnavailableError) as e:
+                if attempt == self.retries:
+                    raise
+                delay = 2 ** attempt
+                logger.warning("Summary request failed (%s), retrying in %ss",
+                               e, delay)
+                time.sleep(delay)
+
+
+class StubBackend:
+    """
+    Offline backend for tests and benchmarks.
+
+    Returns the first sentences of the text, after sleeping delay seconds
+    like a remote call would.
+    """
+
+    def __init__(self, sentences: int = 2, delay: float = 0.0,
+                 max_tokens: int = 150) -> None:
+        self.name = f"stub:{sentences}"
+        self.sentences = sentences
+        self.delay = delay
+        self.max_tokens = max_tokens
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def summarize(self, text: str) -> str:
+        with self._lock:
+            self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        sentences = _SENTENCE_END.split(' '.join(text.split()))
+        return ' '.join(sentences[:self.sentences])[:self.max_tokens * CHARS_PER_TOKEN]
+
+
+class Summarizer:
+    """
+    Summarizes extracted texts with a backend, at most once per text.
+
+    Summaries are cached by a hash of the text and the backend name. Texts
+    longer than chunk_chars are summarized chunk by chunk and the chunk
+    summaries summarized again. Backend calls are limited to
+    max_concurrency at a time and to requests_per_minute and
+    tokens_per_minute, both token buckets allowing a minute's worth in a
+    burst.
+    """
+
+    def __init__(self, backend, cache: ExtractionCache = None,
+                 max_concurrency: int = 4, requests_per_minute: float = 500,
+                 tokens_per_minute: float = 90000, chunk_chars: int = 12000) -> None:
+        """
+        Args:
+            backend: OpenAIBackend, StubBackend or anything with a name and
+                summarize(text)
+            cache: Where summaries are kept, in memory only when None
+            max_concurrency: Backend calls running at once
+            requests_per_minute: Backend calls allowed per minute
+            tokens_per_minute: Prompt plus completion tokens allowed per
+                minute, estimated from the text length
+            chunk_chars: Longest text sent in one call
+        """
+        self.backend = backend
+        self.cache = cache if cache is not None else ExtractionCache()
+        self.max_concurrency = max_concurrency
+        self.chunk_chars = chunk_chars
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # Chunks of one text are summarized side by side, _slots still
+        # bounds the calls of all texts together
+        self._chunk_executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix='summarizer-chunk')
+        self._requests = TokenBucket(requests_per_minute / 60, requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.cache_hits = 0
+        self.chunked = 0
+
+    def _key(self, text: str) -> str:
+        return content_key(text, f"summary:{self.backend.name}:{self.chunk_chars}")
+
+    def _complete(self, text: str) -> str:
+        """One rate limited backend call"""
+        with self._slots:
+            self._requests.acquire()
+            self._tokens.acquire(estimate_tokens(PROMPT + text)
+                                 + getattr(self.backend, 'max_tokens', 0))
+            with span('summarize_request'):
+                summary = self.backend.summarize(text)
+            with self._lock:
+                self.requests += 1
+            return summary
+
+    def _summarize(self, text: str) -> str:
+        chunks = chunk_text(text, self.chunk_chars)
+        if len(chunks) == 1:
+            return self._complete(chunks[0])
+
+        with self._lock:
+            self.chunked += 1
+        # Map the chunks, then reduce their summaries the same way
+        combined = "\n\n".join(self._chunk_executor.map(self._complete, chunks))
+        if len(combined) >= len(text):
+            # Summaries no shorter than the text, stop reducing
+            combined = combined[:self.chunk_chars]
+        return self._summarize(combined)
+
+    def summarize(self, text: str):
+        """
+        Summary of text, from the cache when it was summarized before.
+
+        Returns:
+            str: The summary, or None for empty text
+        """
+        if not text or not text.strip():
+            return None
+        key = self._key(text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            with self._lock:
+                self.cache_hits += 1
+            return cached['summary']
+
+        summary = self._summarize(text)
+        self.cache.put(key, {'summary': summary})
+        return summary
+
+    def summarize_many(self, texts: list) -> list:
+        """
+        Summaries of texts, in the same order.
+
+        Equal texts are summarized once, and up to max_concurrency texts
+        at a time.
+        """
+        distinct = list(dict.fromkeys(texts))
+        with ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                thread_name_prefix='summarizer') as executor:
+            summaries = dict(zip(distinct, executor.map(self.summarize, distinct)))
+        return [summaries[text] for text in texts]
+
+    def close(self) -> None:
+        self._chunk_executor.shutdown()
+        self.cache.close()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'cache_hits': self.cache_hits,
+                'chunked_texts': self.chunked,
+                'rate_limited_seconds': round(
+                    self._requests.waited + self._tokens.waited, 3),
+            }
+
+
+class SummaryQueue:
+    """
+    Summarizes pages in the background, in batches.
+
+    enqueue() returns at once; a worker thread takes up to batch_size
+    queued pages, waiting at most batch_wait seconds for a batch to fill,
+    summarizes their texts with summarizer.summarize_many and hands each
+    summary to store(url, title, summary, document_id). Pages queued while
+    max_pending are already waiting are dropped, and pages still queued
+    when the process exits are not summarized.
+    """
+
+    def __init__(self, summarizer: Summarizer, store, batch_size: int = 16,
+                 batch_wait: float = 1.0, max_pending: int = 10000) -> None:
+        self.summarizer = summarizer
+        self.store = store
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._pending = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+
+        self.batches = 0
+        self.summarized = 0
+        self.failed = 0
+        self.dropped = 0
+
+        self._thread = threading.Thread(target=self._run, name='summary-queue',
+                                        daemon=True)
+        self._thread.start()
+
+    def enqueue(self, url: str, title: str, text: str, document_id: int = None) -> bool:
+        """
+        Queue text of url for summarizing.
+
+        Returns:
+            bool: False if the queue was full and the page was dropped
+        """
+        try:
+            self._pending.put_nowait((url, title, text, document_id))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logger.warning("Summary queue full, not summarizing %s", url)
+            return False
+
+    def _take_batch(self) -> list:
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            pages = [page for page in batch if page is not None]
+            if pages:
+                self._summarize(pages)
+            if len(pages) < len(batch):
+                # stop() queued None after the last page
+                return
+
+    def _summarize(self, batch: list) -> None:
+        try:
+            with span('summarize'):
+                summaries = self.summarizer.summarize_many(
+                    [text for _, _, text, _ in batch])
+        except Exception as e:
+            logger.error("Could not summarize %s pages: %s", len(batch), e)
+            with self._lock:
+                self.failed += len(batch)
+            return
+
+        stored = 0
+        for (url, title, _, document_id), summary in zip(batch, summaries):
+            try:
+                self.store(url, title, summary, document_id)
+                stored += 1
+            except Exception as e:
+                logger.error("Could not store the summary of %s: %s", url, e)
+        with self._lock:
+            self.batches += 1
+            self.summarized += stored
+            self.failed += len(batch) - stored
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                'pending': self._pending.qsize(),
+                'batches': self.batches,
+                'summarized': self.summarized,
+                'failed': self.failed,
+                'dropped': self.dropped,
+            }
+
+    def stop(self) -> None:
+        """Summarize what is queued, then stop the worker"""
+        # Blocks while the queue is full, until the worker makes room
+        self._pending.put(None)
+        self._thread.join()
+
+
+def generate_summary(text):
+    """Summary of text with the default summarizer"""
+    summarizer = get_default_summarizer()
+    if summarizer is None:
+        raise RuntimeError("Set SUMMARY_BACKEND to summarize")
+    return summarizer.summarize(text)
+
+
+_default_summarizer = None
+_default_summarizer_lock = threading.Lock()
+
+
+def get_default_summarizer():
+    """
+    Shared summarizer, when SUMMARY_BACKEND is 'openai' or 'stub'.
+
+    Returns None, meaning pages are not summarized, otherwise.
+    """
+    global _default_summarizer
+    backend_name = os.environ.get('SUMMARY_BACKEND')
+    if not backend_name:
+        return None
+    with _default_summarizer_lock:
+        if _default_summarizer is None:
+            if backend_name == 'stub':
+                backend = StubBackend(
+                    delay=float(os.environ.get('SUMMARY_STUB_DELAY', '0')))
+            elif backend_name == 'openai':
+                backend = OpenAIBackend(
+                    model=os.environ.get('SUMMARY_MODEL', 'gpt-3.5-turbo'))
+            else:
+                raise ValueError(f"Unknown SUMMARY_BACKEND {backend_name!r}")
+            _default_summarizer = Summarizer(
+                backend,
+                cache=ExtractionCache(
+                    os.environ.get('SUMMARY_CACHE_PATH', '.cache/summaries.sqlite3'),
+                    max_entries=int(os.environ.get('SUMMARY_CACHE_SIZE', '1024')),
+                    max_bytes=int(os.environ.get(
+                        'SUMMARY_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))),
+                max_concurrency=int(os.environ.get('SUMMARY_CONCURRENCY', '4')),
+                requests_per_minute=float(os.environ.get('SUMMARY_REQUESTS_PER_MINUTE', '500')),
+                tokens_per_minute=float(os.environ.get('SUMMARY_TOKENS_PER_MINUTE', '90000')),
+                chunk_chars=int(os.environ.get('SUMMARY_CHUNK_CHARS', '12000')))
+        return _default_summarizer
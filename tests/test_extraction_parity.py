@@ -0,0 +1,144 @@
+"""
+The single-pass extraction against the find_all based getSoupResults it
+replaced, kept here as baseline_results.
+
+The one intended difference: the baseline reports a container nested in
+another one, or matching two selectors, once per match, the single pass
+only once through the outermost container. outermost_only applies that
+change to the baseline.
+"""
+import os
+
+import pytest
+from bs4 import BeautifulSoup
+
+from conftest import CORPUS
+from parsers import getSoupResults
+
+ARTICLE_CONTAINERS = ['article', 'main', 'div.article', 'div.content', 'div.post']
+
+
+def baseline_results(soup, outermost_only: bool = False) -> dict:
+    """The original getSoupResults, without its debug logs"""
+    results_dict = {"full_text": ""}
+    article_containers = []
+    for container in ARTICLE_CONTAINERS:
+        if '.' in container:
+            tag, class_name = container.split('.')
+            article_containers.extend(soup.find_all(tag, class_=class_name))
+        else:
+            article_containers.extend(soup.find_all(container))
+    if outermost_only:
+        matched = {id(container) for container in article_containers}
+        kept = []
+        for container in article_containers:
+            if id(container) in {id(seen) for seen in kept}:
+                continue
+            if not any(id(parent) in matched for parent in container.parents):
+                kept.append(container)
+        article_containers = kept
+    if not article_containers:
+        article_containers = [soup.body] if soup.body else [soup]
+
+    for container_idx, container in enumerate(article_containers):
+        headings = container.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+        for heading_idx, heading in enumerate(headings):
+            if heading.get_text(strip=True):
+                text = heading.get_text(strip=True)
+                results_dict[f"heading_{heading.name}_{container_idx}_{heading_idx}"] = text
+                results_dict["full_text"] += f"{text}\n\n"
+
+        for p_idx, paragraph in enumerate(container.find_all('p')):
+            if paragraph.get_text(strip=True):
+                text = paragraph.get_text(strip=True)
+                results_dict[f"paragraph_{container_idx}_{p_idx}"] = text
+                results_dict["full_text"] += f"{text}\n\n"
+
+        for list_idx, list_elem in enumerate(container.find_all(['ul', 'ol'])):
+            list_items = list_elem.find_all('li')
+            for item_idx, item in enumerate(list_items):
+                if item.get_text(strip=True):
+                    text = item.get_text(strip=True)
+                    results_dict[f"list_{list_elem.name}_{container_idx}_{list_idx}_{item_idx}"] = text
+                    results_dict["full_text"] += f"• {text}\n"
+            if list_items:
+                results_dict["full_text"] += "\n"
+    return results_dict
+
+
+def corpus_pages():
+    return sorted(name for name in os.listdir(CORPUS) if name.endswith('.html'))
+
+
+def read_page(name: str) -> bytes:
+    with open(os.path.join(CORPUS, name), 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('features', ['html.parser', 'lxml'])
+@pytest.mark.parametrize('name', corpus_pages())
+def test_corpus_matches_baseline(name, features):
+    html = read_page(name)
+    results = getSoupResults(BeautifulSoup(html, features))
+    expected = baseline_results(BeautifulSoup(html, features), outermost_only=True)
+    assert list(results.items()) == list(expected.items())
+
+
+def test_corpus_has_nested_containers():
+    """The news pages nest article in main, so the corpus covers the change"""
+    html = read_page('news-article-short.html')
+    nested = baseline_results(BeautifulSoup(html, 'html.parser'))
+    outermost = baseline_results(BeautifulSoup(html, 'html.parser'), outermost_only=True)
+    assert len(nested) > len(outermost)
+
+
+def test_nested_containers_are_reported_once():
+    html = """
+    <body>
+      <article>
+        <h1>Title</h1>
+        <main><p>Body</p><ul><li>Item</li></ul></main>
+      </article>
+    </body>
+    """
+    # The baseline reports main's content again as container 1
+    assert baseline_results(BeautifulSoup(html, 'html.parser')) == {
+        'full_text': "Title\n\nBody\n\n• Item\n\nBody\n\n• Item\n\n",
+        'heading_h1_0_0': 'Title',
+        'paragraph_0_0': 'Body',
+        'list_ul_0_0_0': 'Item',
+        'paragraph_1_0': 'Body',
+        'list_ul_1_0_0': 'Item',
+    }
+    assert getSoupResults(BeautifulSoup(html, 'html.parser')) == {
+        'full_text': "Title\n\nBody\n\n• Item\n\n",
+        'heading_h1_0_0': 'Title',
+        'paragraph_0_0': 'Body',
+        'list_ul_0_0_0': 'Item',
+    }
+
+
+def test_element_matching_two_selectors_is_reported_once():
+    html = '<body><div class="article content"><p>Body</p></div></body>'
+    assert baseline_results(BeautifulSoup(html, 'html.parser')) == {
+        'full_text': "Body\n\nBody\n\n",
+        'paragraph_0_0': 'Body',
+        'paragraph_1_0': 'Body',
+    }
+    assert getSoupResults(BeautifulSoup(html, 'html.parser')) == {
+        'full_text': "Body\n\n",
+        'paragraph_0_0': 'Body',
+    }
+
+
+def test_sibling_containers_keep_selector_order():
+    html = """
+    <body>
+      <div class="post"><p>Post</p></div>
+      <main><p>Main</p></main>
+      <article><p>Article</p></article>
+    </body>
+    """
+    results = getSoupResults(BeautifulSoup(html, 'html.parser'))
+    assert results == baseline_results(BeautifulSoup(html, 'html.parser'))
+    assert list(results) == ['full_text', 'paragraph_0_0', 'paragraph_1_0', 'paragraph_2_0']
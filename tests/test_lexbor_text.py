@@ -0,0 +1,55 @@
+"""
+The lexbor backend against html.parser: both leave the text of scripts,
+styles and templates out of the elements they extract.
+"""
+import os
+
+import pytest
+
+from conftest import CORPUS
+from parsers import get_parser_backend
+
+LEXBOR = get_parser_backend('lexbor')
+SOUP = get_parser_backend('html.parser')
+
+
+def extract_both(markup: str):
+    return LEXBOR.extract(LEXBOR.parse(markup)), SOUP.extract(SOUP.parse(markup))
+
+
+@pytest.mark.parametrize('name', sorted(
+    name for name in os.listdir(CORPUS) if name.endswith('.html')))
+def test_corpus_matches_soup(name):
+    with open(os.path.join(CORPUS, name), encoding='utf-8') as page:
+        lexbor_results, soup_results = extract_both(page.read())
+    assert lexbor_results == soup_results
+
+
+def test_script_in_list_item_is_left_out():
+    lexbor_results, soup_results = extract_both(
+        "<article><ul><li><script>var x</script>2</li></ul></article>")
+    assert lexbor_results['list_ul_0_0_0'] == '2'
+    assert lexbor_results == soup_results
+
+
+def test_style_and_template_are_left_out():
+    lexbor_results, soup_results = extract_both(
+        "<article><h2>Title<template><b>row</b></template></h2>"
+        "<p>one <style>p { color: red }</style><em>two</em> three</p></article>")
+    assert lexbor_results['heading_h2_0_0'] == 'Title'
+    assert lexbor_results['paragraph_0_0'] == 'onetwothree'
+    assert lexbor_results == soup_results
+
+
+def test_noscript_is_left_out():
+    lexbor_results, _ = extract_both(
+        "<article><p>text<noscript><img src=x.png></noscript></p></article>")
+    assert lexbor_results['paragraph_0_0'] == 'text'
+
+
+def test_scripts_outside_extracted_elements_keep_fast_path():
+    lexbor_results, soup_results = extract_both(
+        "<html><head><script>var a</script></head><body><article>"
+        "<p>plain <b>bold</b></p><script>var b</script></article></body></html>")
+    assert lexbor_results['paragraph_0_0'] == 'plainbold'
+    assert lexbor_results == soup_results
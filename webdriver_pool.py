@@ -0,0 +1,214 @@
+import contextlib
+import os
+import threading
+import time
+
+from metrics import span
+
+# URL patterns blocked when block_media is set, passed to Chrome's
+# Network.setBlockedURLs
+BLOCKED_MEDIA_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.avif',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.mp4', '*.webm', '*.mp3', '*.m4a', '*.ogg', '*.m3u8',
+]
+
+
+class PoolExhausted(Exception):
+    """No browser session became free within the checkout timeout"""
+
+
+class _Session:
+    """A pooled browser and the number of pages it has loaded"""
+
+    __slots__ = ('driver', 'pages')
+
+    def __init__(self, driver) -> None:
+        self.driver = driver
+        self.pages = 0
+
+
+class WebDriverPool:
+    """
+    Pool of long-lived headless Chrome sessions.
+
+    Sessions are started lazily up to size, handed out with driver() and
+    reused until they have loaded max_pages pages or fail with a
+    WebDriverException, after which they are quit and replaced.
+    """
+
+    def __init__(self, size: int = 2, max_pages: int = 100,
+                 page_timeout: float = 30.0, checkout_timeout: float = 120.0,
+                 block_media: bool = True, headless: bool = True) -> None:
+        self.size = size
+        self.max_pages = max_pages
+        self.page_timeout = page_timeout
+        self.checkout_timeout = checkout_timeout
+        self.block_media = block_media
+        self.headless = headless
+
+        # Used as a LIFO stack so the most recently used (warm) browser is
+        # handed out first
+        self._idle = []
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._started = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._restarts = 0
+        self._sessions_created = 0
+        self._pages = 0
+
+    def _start_driver(self):
+        from selenium import webdriver
+
+        options = webdriver.ChromeOptions()
+        if self.headless:
+            options.add_argument('--headless=new')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--disable-dev-shm-usage')
+        if self.block_media:
+            options.add_experimental_option('prefs', {
+                'profile.managed_default_content_settings.images': 2,
+            })
+
+        driver = webdriver.Chrome(options=options)
+        driver.set_page_load_timeout(self.page_timeout)
+        driver.set_script_timeout(self.page_timeout)
+        if self.block_media:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs',
+                                   {'urls': BLOCKED_MEDIA_PATTERNS})
+        return driver
+
+    def _checkout(self) -> _Session:
+        start = time.perf_counter()
+        deadline = start + self.checkout_timeout
+        session = None
+        with self._available:
+            while True:
+                if self._closed:
+                    raise PoolExhausted("WebDriver pool is closed")
+                if self._idle:
+                    session = self._idle.pop()
+                    break
+                if self._started < self.size:
+                    self._started += 1
+                    self._sessions_created += 1
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    raise PoolExhausted(
+                        f"No WebDriver free after {self.checkout_timeout}s")
+                self._available.wait(remaining)
+
+        if session is None:
+            try:
+                session = _Session(self._start_driver())
+            except BaseException:
+                with self._available:
+                    self._started -= 1
+                    self._sessions_created -= 1
+                    self._available.notify()
+                raise
+
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._checkouts += 1
+            self._wait_seconds += waited
+            self._max_wait_seconds = max(self._max_wait_seconds, waited)
+        return session
+
+    def _retire(self, session: _Session, restart: bool) -> None:
+        try:
+            session.driver.quit()
+        except Exception:
+            pass
+        with self._available:
+            self._started -= 1
+            if restart:
+                self._restarts += 1
+            # A waiter may now start a replacement
+            self._available.notify()
+
+    def _checkin(self, session: _Session, broken: bool) -> None:
+        if broken:
+            self._retire(session, restart=True)
+        elif session.pages >= self.max_pages or self._closed:
+            self._retire(session, restart=False)
+        else:
+            with self._available:
+                self._idle.append(session)
+                self._available.notify()
+
+    @contextlib.contextmanager
+    def driver(self):
+        """
+        Check out a browser for one page load.
+
+        The browser is returned to the pool afterwards, or replaced if it
+        raised a WebDriverException other than a page load timeout.
+        """
+        from selenium.common.exceptions import TimeoutException
+        from selenium.common.exceptions import WebDriverException
+
+        with span('webdriver_checkout'):
+            session = self._checkout()
+        broken = False
+        try:
+            yield session.driver
+        except TimeoutException:
+            raise
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            session.pages += 1
+            with self._lock:
+                self._pages += 1
+            self._checkin(session, broken)
+
+    def close(self) -> None:
+        """Quit every idle browser; sessions in use are quit on return"""
+        with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._available.notify_all()
+        for session in idle:
+            self._retire(session, restart=False)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            checkouts = self._checkouts
+            sessions = self._sessions_created
+            return {
+                'size': self.size,
+                'sessions_live': self._started,
+                'sessions_idle': len(self._idle),
+                'checkouts': checkouts,
+                'wait_seconds_total': round(self._wait_seconds, 4),
+                'wait_seconds_avg': round(self._wait_seconds / checkouts, 4) if checkouts else 0.0,
+                'wait_seconds_max': round(self._max_wait_seconds, 4),
+                'pages_per_session': round(self._pages / sessions, 2) if sessions else 0.0,
+                'restarts': self._restarts,
+            }
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool() -> WebDriverPool:
+    """Shared pool used by SeleniumParser, sized from WEBDRIVER_POOL_SIZE"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = WebDriverPool(
+                size=int(os.environ.get('WEBDRIVER_POOL_SIZE', '2')),
+                max_pages=int(os.environ.get('WEBDRIVER_MAX_PAGES', '100')),
+                block_media=os.environ.get(
+                    'WEBDRIVER_BLOCK_MEDIA', '1') != '0')
+        return _default_pool